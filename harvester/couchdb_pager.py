@@ -1,3 +1,6 @@
+import json
+
+
 def couchdb_pager(db, view_name='_all_docs',
                   startkey=None, startkey_docid=None,
                   endkey=None, endkey_docid=None,
@@ -35,7 +38,8 @@ def couchdb_pager(db, view_name='_all_docs',
             # Otherwise, continue at the new start position.
             rows = view.rows[:-1]
             last = view.rows[-1]
-            ###options['start_key'] = last.key
+            # start_key is sent as is, so it has to be JSON already
+            options['start_key'] = json.dumps(last.key)
             options['startkey_docid'] = last.id
 
         for row in rows:
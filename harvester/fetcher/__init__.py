@@ -1,5 +1,6 @@
 from .fetcher import Fetcher
 from .fetcher import NoRecordsFetchedException
+from .fetcher import ReadAheadFetcher
 from .oai_fetcher import OAIFetcher
 from .solr_fetcher import SolrFetcher
 from .solr_fetcher import PySolrFetcher
@@ -29,6 +30,7 @@ from .controller import EMAIL_RETURN_ADDRESS
 __all__ = (
         Fetcher,
         NoRecordsFetchedException,
+        ReadAheadFetcher,
         HARVEST_TYPES,
         OAIFetcher,
         SolrFetcher,
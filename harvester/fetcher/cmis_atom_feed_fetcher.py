@@ -5,36 +5,71 @@ from xml.etree import ElementTree as ET
 from xmljson import badgerfish
 from .fetcher import Fetcher
 
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+CMISRA_NS = '{http://docs.oasis-open.org/ns/cmis/restatom/200908/}'
+
 
 class CMISAtomFeedFetcher(Fetcher):
     '''harvest a CMIS Atom Feed. Don't know how generic this is, just working
     with Oakland Public Library Preservica implementation.
 
     Right now this uses the "descendants" page for collections, this gets all
-    the data for one collection from one http request then parses the resulting
-    data. This might not work if we get collections much bigger than the
-    current ones (~1000 objects max)
+    the data for one collection. The response is parsed as a stream and each
+    descendant entry is converted to badgerfish only when returned by next,
+    then discarded, so memory use doesn't grow with the collection size.
+    If the feed has a "next" link, the following pages are fetched in turn.
     '''
 
     def __init__(self, url_harvest, extra_data, **kwargs):
-        '''Grab file and copy to local temp file'''
+        '''Open the feed and get ready to stream the entries'''
         super(CMISAtomFeedFetcher, self).__init__(url_harvest, extra_data)
         # parse extra data for username,password
         uname, pswd = extra_data.split(',')
-        resp = requests.get(url_harvest,
-                            auth=HTTPBasicAuth(uname.strip(), pswd.strip()))
-        self.tree = ET.fromstring(resp.content)
-        self.objects = [
-            badgerfish.data(x)
-            for x in self.tree.findall('./{http://www.w3.org/2005/Atom}'
-                                       'entry/{http://docs.oasis-open.org/'
-                                       'ns/cmis/restatom/200908/}children//'
-                                       '{http://www.w3.org/2005/Atom}entry')
-        ]
-        self.objects_iter = iter(self.objects)
+        self._auth = HTTPBasicAuth(uname.strip(), pswd.strip())
+        self.url_next = url_harvest
+        self.objects_iter = self._iter_entries()
+
+    def _iter_feed(self, url):
+        '''Yield the descendant entry elements of one feed page as they
+        are parsed. Sets self.url_next to the feed's "next" link, if any.
+        Entries nested in another descendant are yielded before it and are
+        kept until the outer entry has been yielded, as they are part of its
+        data.
+        '''
+        self.url_next = None
+        resp = requests.get(url, auth=self._auth, stream=True)
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        path = []
+        for event, elem in ET.iterparse(resp.raw, events=('start', 'end')):
+            if event == 'start':
+                path.append(elem)
+                continue
+            path.pop()
+            if elem.tag == ATOM_NS + 'link' and len(path) == 1 and \
+                    elem.get('rel') == 'next':
+                self.url_next = elem.get('href')
+            if elem.tag != ATOM_NS + 'entry':
+                continue
+            # only entries under a cmisra:children are descendants
+            ancestors = [e.tag for e in path]
+            if CMISRA_NS + 'children' not in ancestors:
+                continue
+            yield elem
+            in_descendant = ancestors[ancestors.index(CMISRA_NS +
+                                                      'children'):]
+            if ATOM_NS + 'entry' not in in_descendant:
+                elem.clear()
+                path[-1].remove(elem)
+        resp.close()
+
+    def _iter_entries(self):
+        while self.url_next:
+            for elem in self._iter_feed(self.url_next):
+                yield elem
 
     def next(self):
-        return self.objects_iter.next()
+        return badgerfish.data(self.objects_iter.next())
 
 
 # Copyright © 2016, Regents of the University of California
@@ -15,6 +15,9 @@ from ..collection_registry_client import Collection
 from .. import config
 from .fetcher import Fetcher
 from .fetcher import NoRecordsFetchedException
+from .fetcher import ReadAheadFetcher
+from .s3_upload import S3PageUploader
+from .s3_upload import S3_UPLOAD_WORKERS
 from .oai_fetcher import OAIFetcher
 from .solr_fetcher import SolrFetcher
 from .solr_fetcher import PySolrQueryFetcher
@@ -54,12 +57,27 @@ HARVEST_TYPES = {
     'UCD': UCD_JSON_Fetcher,
     'IAR': IA_Fetcher
 }
+# Harvest types whose fetchers request one page per next() call. These
+# fetch this many pages ahead in a background thread while the controller
+# saves the current page.
+READ_AHEAD_PAGES = {
+    'OAC': 2,
+    'UCB': 2,
+    'ALX': 2,
+    'IAR': 2,
+    'EMS': 2,
+    'UCD': 2,
+    'YTB': 2,
+}
 
 
 class HarvestController(object):
     '''Controller for the harvesting. Selects correct Fetcher for the given
     collection, then retrieves records for the given collection and saves to
     disk.
+    During harvest, pages are uploaded to S3 in the background by
+    s3_upload_workers threads (see s3_upload.S3PageUploader). Set
+    s3_upload_workers to 0 to upload synchronously in the fetch loop.
     TODO: produce profile file
     '''
     campus_valid = [
@@ -79,6 +97,7 @@ class HarvestController(object):
                  collection,
                  profile_path=None,
                  config_file=None,
+                 s3_upload_workers=S3_UPLOAD_WORKERS,
                  **kwargs):
         self.user_email = user_email  # single or list
         self.collection = collection
@@ -96,6 +115,9 @@ class HarvestController(object):
         self.fetcher = cls_fetcher(self.collection.url_harvest,
                                    self.collection.harvest_extra_data,
                                    **kwargs)
+        read_ahead_pages = READ_AHEAD_PAGES.get(self.collection.harvest_type)
+        if read_ahead_pages:
+            self.fetcher = ReadAheadFetcher(self.fetcher, read_ahead_pages)
         self.logger = logbook.Logger('HarvestController')
         self.dir_save = tempfile.mkdtemp('_' + self.collection.slug)
         self.ingest_doc_id = None
@@ -104,6 +126,9 @@ class HarvestController(object):
         self.num_records = 0
         self.datetime_start = datetime.datetime.now()
         self.objset_page = 0
+        self.registry_collection = None
+        self.s3_upload_workers = s3_upload_workers
+        self.uploader = None
 
     @property
     def s3path(self):
@@ -125,22 +150,25 @@ class HarvestController(object):
     def jsonl(objset):
         '''Return a JSONL string for a given set of python objects
         '''
-        jsonl = ''
         if isinstance(objset, dict):
             objset = [objset]
-        for obj in objset:
-            jsonl += ''.join((json.dumps(
-                obj, default=HarvestController.dt_json_handler), '\n'))
-        return jsonl
+        return ''.join([
+            json.dumps(obj, default=HarvestController.dt_json_handler) + '\n'
+            for obj in objset
+        ])
 
     def save_objset_s3(self, objset):
-        '''Save the objset to a bucket'''
-        if not hasattr(self, 's3'):
-            self.s3 = boto3.resource('s3')
+        '''Save the objset to a bucket. If the background uploader is
+        running the page is queued for upload instead'''
         body = HarvestController.jsonl(objset)
-        bucket = self.s3.Bucket('ucldc-ingest')
         key = ''.join((self.s3path, 'page-{}.jsonl'.format(self.objset_page)))
         self.objset_page += 1
+        if self.uploader:
+            self.uploader.put_page(key, body)
+            return
+        if not hasattr(self, 's3'):
+            self.s3 = boto3.resource('s3')
+        bucket = self.s3.Bucket(self.bucket)
         bucket.put_object(Body=body, Key=key)
 
     def save_objset(self, objset):
@@ -150,9 +178,7 @@ class HarvestController(object):
         if not type(objset) == list:
             objset = [objset]
         with open(filename, 'w') as foo:
-            foo.write(
-                json.dumps(
-                    objset, default=HarvestController.dt_json_handler))
+            json.dump(objset, foo, default=HarvestController.dt_json_handler)
 
     def create_ingest_doc(self):
         '''Create the DPLA style ingest doc in couch for this harvest session.
@@ -209,8 +235,10 @@ class HarvestController(object):
                               (self.ingestion_doc["_id"], __name__))
             raise e
 
-    def _add_registry_data(self, obj):
-        '''Add the registry based data to the harvested object.
+    def _registry_collection(self):
+        '''Build the registry based "collection" data that is added to
+        every harvested object. This is the same for the whole harvest, so
+        it is computed once and every object gets a reference to it.
         '''
         # get base registry URL
         url_tuple = urlparse.urlparse(self.collection.url)
@@ -220,22 +248,29 @@ class HarvestController(object):
                                                                       1)[1]
         self.collection['ingestType'] = 'collection'
         self.collection['title'] = self.collection.name
-        if 'collection' in obj:
-            # save before hammering
-            obj['source_collection_name'] = obj['collection']
-        obj['collection'] = dict(self.collection)
+        collection = dict(self.collection)
         campus = []
         for c in self.collection.get('campus', []):
             c.update({'@id': ''.join((base_url, c['resource_uri']))})
             campus.append(c)
-        obj['collection']['campus'] = campus
+        collection['campus'] = campus
         repository = []
         for r in self.collection['repository']:
             r.update({'@id': ''.join((base_url, r['resource_uri']))})
             repository.append(r)
-        obj['collection']['repository'] = repository
+        collection['repository'] = repository
         # in future may be more than one
-        obj['collection'] = [obj['collection']]
+        return [collection]
+
+    def _add_registry_data(self, obj):
+        '''Add the registry based data to the harvested object.
+        '''
+        if self.registry_collection is None:
+            self.registry_collection = self._registry_collection()
+        if 'collection' in obj:
+            # save before hammering
+            obj['source_collection_name'] = obj['collection']
+        obj['collection'] = self.registry_collection
         return obj
 
     def harvest(self):
@@ -247,6 +282,47 @@ class HarvestController(object):
             str(self.collection['campus']),
             str(self.collection['repository']))))
         self.num_records = 0
+        if self.s3_upload_workers:
+            self.uploader = S3PageUploader(
+                self.bucket, workers=self.s3_upload_workers)
+        try:
+            self._fetch_and_save()
+        except Exception:
+            if isinstance(self.fetcher, ReadAheadFetcher):
+                self.fetcher.close()
+            self._finish_uploads(log_errors_only=True)
+            raise
+        self._finish_uploads()
+        if self.num_records == 0:
+            raise NoRecordsFetchedException
+        msg = ' '.join((str(self.num_records), 'records harvested'))
+        self.logger.info(msg)
+        return self.num_records
+
+    def _finish_uploads(self, log_errors_only=False):
+        '''Wait for the background S3 uploads to finish and report.
+        If log_errors_only, upload errors are logged instead of raised, so
+        they don't hide the exception that stopped the harvest.
+        '''
+        if not self.uploader:
+            return
+        uploader = self.uploader
+        self.uploader = None
+        try:
+            stats = uploader.join()
+        except Exception as e:
+            if not log_errors_only:
+                raise
+            self.logger.error(str(e))
+            return
+        self.logger.info(
+            'Uploaded {pages} pages, {bytes} bytes to S3 in {seconds:.1f} '
+            'seconds ({seconds_uploading:.1f} seconds in uploads)'.format(
+                **stats))
+
+    def _fetch_and_save(self):
+        '''Run the fetcher, adding registry data to each record and saving
+        each objset'''
         next_log_n = interval = 100
         for objset in self.fetcher:
             if isinstance(objset, list):
@@ -267,12 +343,6 @@ class HarvestController(object):
                     interval = 10 * interval
                 next_log_n += interval
 
-        if self.num_records == 0:
-            raise NoRecordsFetchedException
-        msg = ' '.join((str(self.num_records), 'records harvested'))
-        self.logger.info(msg)
-        return self.num_records
-
 
 def parse_args():
     import argparse
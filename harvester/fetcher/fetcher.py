@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import sys
+import threading
+import Queue
 import logbook
 
 
@@ -24,6 +27,89 @@ class Fetcher(object):
         raise NotImplementedError
 
 
+class ReadAheadFetcher(object):
+    '''Wrap a paginated fetcher so that its pages are fetched in a
+    background thread while the caller processes earlier pages.
+
+    Up to pages objsets are buffered ahead of the caller. Exceptions raised
+    by the wrapped fetcher are re-raised from next in the caller's thread,
+    in order. The log handlers of the caller's thread are pushed in the
+    background thread too. Other attributes are looked up on the wrapped
+    fetcher.
+    '''
+    _done = object()
+
+    def __init__(self, fetcher, pages=2):
+        self.fetcher = fetcher
+        self._queue = Queue.Queue(maxsize=pages)
+        self._stop = threading.Event()
+        self._thread = None
+        self._finished = False
+
+    def __getattr__(self, name):
+        return getattr(self.fetcher, name)
+
+    def __iter__(self):
+        return self
+
+    def _put(self, item):
+        '''Put item on the queue, giving up if the reader has closed'''
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _read_ahead(self, handlers):
+        # handlers bound to the caller's thread aren't seen by this one
+        seen = set(logbook.Handler.stack_manager.iter_context_objects())
+        pushed = [h for h in reversed(handlers) if h not in seen]
+        for handler in pushed:
+            handler.push_thread()
+        try:
+            self._fetch_pages()
+        finally:
+            for handler in reversed(pushed):
+                handler.pop_thread()
+
+    def _fetch_pages(self):
+        try:
+            for objset in self.fetcher:
+                if not self._put((objset, None)):
+                    return
+        except Exception:
+            self._put((None, sys.exc_info()))
+            return
+        self._put((self._done, None))
+
+    def next(self):
+        if self._finished:
+            raise StopIteration
+        if self._thread is None:
+            handlers = list(
+                logbook.Handler.stack_manager.iter_context_objects())
+            self._thread = threading.Thread(
+                target=self._read_ahead,
+                args=(handlers, ),
+                name='ReadAhead-{}'.format(type(self.fetcher).__name__))
+            self._thread.daemon = True
+            self._thread.start()
+        objset, exc_info = self._queue.get()
+        if exc_info:
+            self._finished = True
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if objset is self._done:
+            self._finished = True
+            raise StopIteration
+        return objset
+
+    def close(self):
+        '''Stop reading ahead'''
+        self._stop.set()
+
+
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
 # Redistribution and use in source and binary forms, with or without
@@ -1,10 +1,43 @@
 # -*- coding: utf-8 -*-
 import os
-import urllib
 import re
+import time
+import threading
+from multiprocessing.pool import ThreadPool
 from xml.etree import ElementTree as ET
+import requests
 from .fetcher import Fetcher
 
+# The Flickr API allows 3600 queries per hour per key
+FLICKR_API_CALLS_PER_SECOND = 3600 / 3600.0
+
+
+class TokenBucket(object):
+    '''A thread safe token bucket rate limiter.
+    Tokens are added at rate per second up to capacity. acquire blocks until
+    a token is available and takes it.
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.capacity, self._tokens +
+                                   (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
 
 class Flickr_Fetcher(Fetcher):
     '''A fetcher for the Flickr API.
@@ -19,7 +52,10 @@ class Flickr_Fetcher(Fetcher):
     to get the list of all photos.
 
     It then proceeds to use flickr.photos.getInfo to get metadata for the
-    photos
+    photos. With info_workers > 1 the getInfo calls for a page are made
+    concurrently, and all API calls are rate limited to rate_limit calls
+    per second (default FLICKR_API_CALLS_PER_SECOND) by a token bucket.
+    Requests reuse connections from a pooled requests Session.
     '''
 
     url_get_user_photos_template = 'https://api.flickr.com/services/rest/' \
@@ -36,6 +72,8 @@ class Flickr_Fetcher(Fetcher):
                  extra_data,
                  page_size=500,
                  page_range=None,
+                 info_workers=1,
+                 rate_limit=None,
                  **kwargs):
         self.url_base = url_harvest
         self.user_id = extra_data
@@ -44,7 +82,20 @@ class Flickr_Fetcher(Fetcher):
         self.page_current = 1
         self.doc_current = 0
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_current).read()
+        self._session = requests.Session()
+        self._session.mount(
+            'https://',
+            requests.adapters.HTTPAdapter(pool_maxsize=max(info_workers, 1)))
+        self._pool = None
+        if info_workers > 1:
+            self._pool = ThreadPool(info_workers)
+            if not rate_limit:
+                rate_limit = FLICKR_API_CALLS_PER_SECOND
+        self._rate_limiter = None
+        if rate_limit:
+            self._rate_limiter = TokenBucket(
+                rate_limit, capacity=max(info_workers, 1))
+        xml = self._get(self.url_current)
         total = re.search('total="(?P<total>\d+)"', xml)
         self.docs_total = int(total.group('total'))
         page_total = re.search('pages="(?P<page_total>\d+)"', xml)
@@ -80,6 +131,28 @@ class Flickr_Fetcher(Fetcher):
                 per_page=self.page_size,
                 page=self.page_current)
 
+    def _get(self, url):
+        '''Get the body of an API call, waiting for the rate limiter'''
+        if self._rate_limiter:
+            self._rate_limiter.acquire()
+        return self._session.get(url).content
+
+    def _get_photo_info(self, photo_obj):
+        '''Get the info for the photo and add to the photo object'''
+        url_photo_info = self.url_get_photo_info_template.format(
+            api_key=self.api_key, photo_id=photo_obj['id'])
+        ptree = ET.fromstring(self._get(url_photo_info))
+        photo_info = ptree.find('.//photo')
+        photo_obj.update(photo_info.attrib)
+        photo_obj.update(
+            self.parse_tags_for_photo_info(photo_info.getchildren()))
+        return photo_obj
+
+    def _close_pool(self):
+        if self._pool:
+            self._pool.close()
+            self._pool = None
+
     def parse_tags_for_photo_info(self, info_tree):
         '''Parse the sub tags of a photo info objects and add to the
         photo dictionary.
@@ -110,27 +183,22 @@ class Flickr_Fetcher(Fetcher):
                     total reported by server ({1})"
                     .format(self.docs_fetched, self.docs_total))
             else:
+                self._close_pool()
                 raise StopIteration
         if hasattr(self, 'page_end') and self.page_current > self.page_end:
+            self._close_pool()
             raise StopIteration
         # for the given page of public photos results,
         # for each <photo> tag, create an object with id, server & farm saved
         # then get the info for the photo and add to object
         # return the full list of objects to the harvest controller
-        tree = ET.fromstring(urllib.urlopen(self.url_current).read())
-        photo_list = tree.findall('.//photo')
-        objset = []
-        for photo in photo_list:
-            photo_obj = photo.attrib
-            url_photo_info = self.url_get_photo_info_template.format(
-                api_key=self.api_key, photo_id=photo_obj['id'])
-            ptree = ET.fromstring(urllib.urlopen(url_photo_info).read())
-            photo_info = ptree.find('.//photo')
-            photo_obj.update(photo_info.attrib)
-            photo_obj.update(
-                self.parse_tags_for_photo_info(photo_info.getchildren()))
-            self.docs_fetched += 1
-            objset.append(photo_obj)
+        tree = ET.fromstring(self._get(self.url_current))
+        photo_list = [photo.attrib for photo in tree.findall('.//photo')]
+        if self._pool:
+            objset = self._pool.map(self._get_photo_info, photo_list)
+        else:
+            objset = [self._get_photo_info(p) for p in photo_list]
+        self.docs_fetched += len(objset)
 
         self.page_current += 1
         self.doc_current += len(objset)
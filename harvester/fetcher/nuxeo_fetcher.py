@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
 import urlparse
 import json
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
 import pynux.utils
 import boto
 from .fetcher import Fetcher
@@ -11,12 +15,28 @@ NUXEO_MEDIUM_IMAGE_URL_FORMAT = "https://nuxeo.cdlib.org/Nuxeo/nxpicsfile/" \
     "default/{}/Medium:content/"
 NUXEO_S3_THUMB_URL_FORMAT = "https://s3.amazonaws.com/" \
     "static.ucldc.cdlib.org/ucldc-nuxeo-thumb-media/{}"
+# number of objects to fetch from Nuxeo concurrently. 1 fetches serially
+NUXEO_FETCH_WORKERS = int(os.environ.get('NUXEO_FETCH_WORKERS', 1))
+# number of media json files to download in parallel ahead of the records
+# when fetching serially. 0 downloads each with its record
+STRUCTMAP_PREFETCH = 20
+STRUCTMAP_PREFETCH_WORKERS = 4
+# component types that can provide an image or a thumbnail for isShownBy
+COMPONENT_TYPES_WITH_MEDIA = ('SampleCustomPicture', 'CustomFile',
+                              'CustomVideo')
 
 
 class NuxeoFetcher(Fetcher):
     '''Harvest a Nuxeo FILE. Can be local or at a URL'''
 
-    def __init__(self, url_harvest, extra_data, conf_pynux={}, **kwargs):
+    def __init__(self,
+                 url_harvest,
+                 extra_data,
+                 conf_pynux={},
+                 fetch_workers=NUXEO_FETCH_WORKERS,
+                 prefetch=None,
+                 structmap_prefetch=STRUCTMAP_PREFETCH,
+                 **kwargs):
         '''
         uses pynux (https://github.com/ucldc/pynux) to grab objects from
         the Nuxeo API
@@ -26,6 +46,16 @@ class NuxeoFetcher(Fetcher):
 
         the pynux config file should have user & password
         and X-NXDocumemtProperties values filled in.
+
+        If fetch_workers > 1, the metadata, media json and component
+        lookups for the next prefetch (default 2 * fetch_workers) objects
+        are fetched concurrently by a pool of fetch_workers threads.
+        Records are still returned in fetch_objects order. fetch_workers
+        limits the number of concurrent requests to the Nuxeo server.
+
+        When fetching serially, the media json for the next
+        structmap_prefetch objects is downloaded in parallel ahead of the
+        records and the structmap_text is served from memory.
         '''
         super(NuxeoFetcher, self).__init__(url_harvest, extra_data, **kwargs)
         self._url = url_harvest
@@ -33,6 +63,13 @@ class NuxeoFetcher(Fetcher):
         self._nx = pynux.utils.Nuxeo(conf=conf_pynux)
         self._nx.conf['api'] = self._url
         self._structmap_bucket = STRUCTMAP_S3_BUCKET
+        self._component_cache = {}
+        # boto connections aren't thread safe, keep one per thread
+        self._s3_local = threading.local()
+        self._structmap_texts = {}
+        self._structmap_prefetch = structmap_prefetch
+        self._structmap_pool = None
+        self._upcoming = deque()
 
         # get harvestable child objects
         conf_pynux['api'] = self._url
@@ -40,12 +77,50 @@ class NuxeoFetcher(Fetcher):
 
         self._children = iter(self._dh.fetch_objects())
 
+        self._pool = None
+        self._pending = deque()
+        if fetch_workers > 1:
+            self._pool = ThreadPool(fetch_workers)
+            self._prefetch = prefetch or 2 * fetch_workers
+
     def _get_structmap_url(self, bucket, obj_key):
         '''Get structmap_url property for object'''
         structmap_url = "s3://{0}/{1}{2}".format(bucket, obj_key,
                                                  '-media.json')
         return structmap_url
 
+    def _get_structmap_s3_bucket(self):
+        '''Return the media json bucket, connecting to S3 once per thread.
+        The bucket is not validated, saving a request per connection'''
+        bucket = getattr(self._s3_local, 'bucket', None)
+        if bucket is None:
+            bucketpath = self._structmap_bucket.strip("/")
+            bucketbase = bucketpath.split("/")[0]
+            conn = boto.connect_s3()
+            bucket = conn.get_bucket(bucketbase, validate=False)
+            self._s3_local.bucket = bucket
+        return bucket
+
+    def _prefetch_structmap_text(self):
+        '''Read the next structmap_prefetch objects ahead and download the
+        media json for all of them in parallel'''
+        while len(self._upcoming) < self._structmap_prefetch:
+            try:
+                self._upcoming.append(self._children.next())
+            except StopIteration:
+                break
+        urls = [
+            self._get_structmap_url(self._structmap_bucket, doc['uid'])
+            for doc in self._upcoming
+        ]
+        urls = [url for url in urls if url not in self._structmap_texts]
+        if not urls:
+            return
+        if not self._structmap_pool:
+            self._structmap_pool = ThreadPool(STRUCTMAP_PREFETCH_WORKERS)
+        texts = self._structmap_pool.map(self._get_structmap_text, urls)
+        self._structmap_texts.update(zip(urls, texts))
+
     def _get_structmap_text(self, structmap_url):
         '''
            Get structmap_text for object. This is all the words from 'label'
@@ -54,13 +129,10 @@ class NuxeoFetcher(Fetcher):
         '''
         structmap_text = ""
 
-        bucketpath = self._structmap_bucket.strip("/")
-        bucketbase = bucketpath.split("/")[0]
         parts = urlparse.urlsplit(structmap_url)
 
         # get contents of <nuxeo_id>-media.json file
-        conn = boto.connect_s3()
-        bucket = conn.get_bucket(bucketbase)
+        bucket = self._get_structmap_s3_bucket()
         key = bucket.get_key(parts.path)
         if not key:  # media_json hasn't been harvested yet for this record
             self.logger.error('Media json at: {} missing.'.format(parts.path))
@@ -100,8 +172,8 @@ class NuxeoFetcher(Fetcher):
             return is_shown_by
 
         # 2) if component(s) have image, use first one we can find
-        first_image_component_uid = self._get_first_image_component(
-            nuxeo_metadata)
+        first_image_component_uid, first_thumb_component_uid = \
+            self._scan_components(nuxeo_metadata)
         self.logger.info("first_image_component_uid: {}".format(
             first_image_component_uid))
         if first_image_component_uid:
@@ -123,8 +195,6 @@ class NuxeoFetcher(Fetcher):
             return is_shown_by
 
         # 4) if component(s) have PDF or video, use first component image stashed on S3 we can find
-        first_thumb_component_uid = self._get_first_thumb_component(
-            nuxeo_metadata)
         self.logger.info("first_thumb_component_uid: {}".format(
             first_thumb_component_uid))
         if first_thumb_component_uid:
@@ -171,46 +241,94 @@ class NuxeoFetcher(Fetcher):
         else:
             return False
 
-    def _get_first_image_component(self, parent_metadata):
-        ''' get first image component we can find '''
-        component_uid = None
-
+    def _get_component_summary(self, child):
+        '''Return (has_image, has_s3_thumbnail) for a component listed by
+        an NXQL query. Only components of a type that can have an image
+        or thumbnail have their metadata fetched, and results are cached
+        by uid for the life of the fetcher.
+        '''
+        uid = child['uid']
+        summary = self._component_cache.get(uid)
+        if summary is not None:
+            return summary
+        if 'type' in child and child['type'] not in \
+                COMPONENT_TYPES_WITH_MEDIA:
+            summary = (False, False)
+        else:
+            if 'file:content' in child.get('properties', {}):
+                child_metadata = child
+            else:
+                child_metadata = self._nx.get_metadata(uid=uid)
+            summary = (self._has_image(child_metadata),
+                       self._has_s3_thumbnail(child_metadata))
+        self._component_cache[uid] = summary
+        return summary
+
+    def _scan_components(self, parent_metadata):
+        '''Find the first image component and the first non-image
+        component with a thumbnail in one pass over the components.
+        Returns a tuple of (image component uid, thumb component uid),
+        either of which may be None. The scan stops at the first image
+        component, since an image takes precedence over any thumbnail.
+        '''
+        image_uid = thumb_uid = None
         query = "SELECT * FROM Document WHERE ecm:parentId = '{}' AND " \
                 "ecm:currentLifeCycleState != 'deleted' ORDER BY " \
                 "ecm:pos".format(parent_metadata['uid'])
         for child in self._nx.nxql(query):
-            child_metadata = self._nx.get_metadata(uid=child['uid'])
-            if self._has_image(child_metadata):
-                component_uid = child_metadata['uid']
+            has_image, has_thumb = self._get_component_summary(child)
+            if has_image:
+                image_uid = child['uid']
                 break
-
-        return component_uid
-
-    def _get_first_thumb_component(self, parent_metadata):
-        ''' get first non-image component with thumbnail we can find '''
-        component_uid = None
-
-        query = "SELECT * FROM Document WHERE ecm:parentId = '{}' AND " \
-                "ecm:currentLifeCycleState != 'deleted' ORDER BY " \
-                "ecm:pos".format(parent_metadata['uid'])
-        for child in self._nx.nxql(query):
-            child_metadata = self._nx.get_metadata(uid=child['uid'])
-            if self._has_s3_thumbnail(child_metadata):
-                component_uid = child_metadata['uid']
+            if has_thumb and not thumb_uid:
+                thumb_uid = child['uid']
+        return image_uid, thumb_uid
+
+    def _fetch_record(self, uid):
+        '''Get the metadata for the object with the given uid and fill in
+        the structmap and isShownBy values'''
+        metadata = self._nx.get_metadata(uid=uid)
+        structmap_url = self._get_structmap_url(self._structmap_bucket, uid)
+        metadata['structmap_url'] = structmap_url
+        structmap_text = self._structmap_texts.pop(structmap_url, None)
+        if structmap_text is None:
+            structmap_text = self._get_structmap_text(structmap_url)
+        metadata['structmap_text'] = structmap_text
+        metadata['isShownBy'] = self._get_isShownBy(metadata)
+        return metadata
+
+    def _next_prefetched(self):
+        '''Keep the pool working on the next objects and return the
+        oldest pending record'''
+        while self._pool and len(self._pending) < self._prefetch:
+            try:
+                doc = self._children.next()
+            except StopIteration:
+                self._pool.close()
+                self._pool = None
                 break
-
-        return component_uid
+            self._pending.append(
+                self._pool.apply_async(self._fetch_record, (doc['uid'], )))
+        if not self._pending:
+            raise StopIteration
+        return self._pending.popleft().get()
 
     def next(self):
         '''Return Nuxeo record by record to the controller'''
-        doc = self._children.next()
-        self.metadata = self._nx.get_metadata(uid=doc['uid'])
-        self.structmap_url = self._get_structmap_url(self._structmap_bucket,
-                                                     doc['uid'])
-        self.metadata['structmap_url'] = self.structmap_url
-        self.metadata['structmap_text'] = self._get_structmap_text(
-            self.structmap_url)
-        self.metadata['isShownBy'] = self._get_isShownBy(self.metadata)
+        if self._pool or self._pending:
+            self.metadata = self._next_prefetched()
+        else:
+            if not self._upcoming and self._structmap_prefetch:
+                self._prefetch_structmap_text()
+            if self._upcoming:
+                doc = self._upcoming.popleft()
+            else:
+                if self._structmap_pool:
+                    self._structmap_pool.close()
+                    self._structmap_pool = None
+                doc = self._children.next()
+            self.metadata = self._fetch_record(doc['uid'])
+        self.structmap_url = self.metadata['structmap_url']
 
         return self.metadata
 
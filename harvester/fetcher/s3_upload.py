@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''Background upload stage for harvested pages.
+
+The HarvestController hands completed page buffers to an S3PageUploader,
+which ships them to S3 from a small pool of worker threads fed by a bounded queue. The fetch loop only blocks
+when the queue is full. Large pages are sent as multipart uploads and
+failed uploads are retried with exponential backoff. Missing AWS
+credentials are not retried: the uploader fails on the next page queued.
+'''
+import io
+import time
+import threading
+import Queue
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import NoCredentialsError
+import logbook
+
+S3_UPLOAD_WORKERS = 4
+S3_UPLOAD_QUEUE_SIZE = 8
+S3_UPLOAD_RETRIES = 5
+S3_UPLOAD_BACKOFF = 1  # seconds, doubled on each retry
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+
+class S3UploadError(Exception):
+    pass
+
+
+class S3PageUploader(object):
+    '''Upload pages to an S3 bucket from a pool of worker threads.
+
+    put_page enqueues an upload and returns immediately unless the queue
+    is full. join waits for all queued uploads to finish, stops the
+    workers and returns the upload statistics. If any upload failed after
+    all retries, join raises S3UploadError.
+    If there are no AWS credentials the queued uploads are dropped and
+    put_page raises S3UploadError.
+    '''
+
+    def __init__(self,
+                 bucket,
+                 workers=S3_UPLOAD_WORKERS,
+                 queue_size=S3_UPLOAD_QUEUE_SIZE,
+                 retries=S3_UPLOAD_RETRIES,
+                 backoff=S3_UPLOAD_BACKOFF,
+                 multipart_threshold=S3_MULTIPART_THRESHOLD):
+        self.bucket = bucket
+        self.retries = retries
+        self.backoff = backoff
+        self.logger = logbook.Logger('S3PageUploader')
+        # boto3 clients are thread safe, resources are not
+        self._client = boto3.client('s3')
+        self._transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+            max_concurrency=2)
+        self._queue = Queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self.num_pages = 0
+        self.num_bytes = 0
+        self.seconds_uploading = 0.0
+        self.errors = []
+        self._no_credentials = None
+        self._time_start = time.time()
+        self._workers = []
+        for n in range(workers):
+            t = threading.Thread(
+                target=self._work, name='S3PageUploader-{}'.format(n))
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def _check_credentials(self):
+        if self._no_credentials:
+            raise S3UploadError(self._no_credentials)
+
+    def put_page(self, key, body):
+        '''Queue a page body (string) for upload to key'''
+        self._check_credentials()
+        self._queue.put((key, body))
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._upload(*task)
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, key, body):
+        if self._no_credentials:
+            return
+        for attempt in range(self.retries + 1):
+            time_start = time.time()
+            try:
+                self._client.upload_fileobj(
+                    io.BytesIO(body), self.bucket, key,
+                    Config=self._transfer_config)
+                nbytes = len(body)
+            except NoCredentialsError as e:
+                msg = 'No credentials to upload to s3://{}: {}'.format(
+                    self.bucket, e)
+                self.logger.error(msg)
+                with self._lock:
+                    self._no_credentials = msg
+                    self.errors.append(msg)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    msg = 'Failed upload of page to s3://{}/{}: {}'.format(
+                        self.bucket, key, e)
+                    self.logger.error(msg)
+                    with self._lock:
+                        self.errors.append(msg)
+                    return
+                delay = self.backoff * 2**attempt
+                self.logger.warning(
+                    'Upload of s3://{}/{} failed, retry in {}s: {}'.format(
+                        self.bucket, key, delay, e))
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self.num_pages += 1
+                self.num_bytes += nbytes
+                self.seconds_uploading += time.time() - time_start
+            return
+
+    def join(self):
+        '''Wait for queued uploads to finish and stop the workers.
+        Returns a dictionary of upload statistics.
+        '''
+        for t in self._workers:
+            self._queue.put(None)
+        for t in self._workers:
+            t.join()
+        self._workers = []
+        stats = {
+            'pages': self.num_pages,
+            'bytes': self.num_bytes,
+            'seconds_uploading': self.seconds_uploading,
+            'seconds': time.time() - self._time_start,
+        }
+        if self.errors:
+            raise S3UploadError('{} uploads failed. First error: {}'.format(
+                len(self.errors), self.errors[0]))
+        return stats
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
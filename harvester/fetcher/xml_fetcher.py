@@ -10,55 +10,71 @@ from itertools import islice
 
 class XML_Fetcher(Fetcher):
     '''Harvests 1,000 records at a time from
-    static XML document at url_harvest'''
+    static XML document at url_harvest.
+    The document is parsed as a stream and each <record> element is
+    discarded once converted, so memory use doesn't grow with the size of
+    the document.'''
+
+    page_size = 1000
 
     def __init__(self, url_harvest, extra_data, **kwargs):
         self.url_base = url_harvest
-        self.doc_current = 1
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_base).read()
-        total = re.findall('<record>', xml)
-        self.docs_total = len(total)
-        # Use etree to pythonize
-        tree = ET.fromstring(xml)
-        self.hits = tree.findall(".//record")
         self.re_ns_strip = re.compile('{.*}(?P<tag>.*)$')
+        self._records = self._iter_records(urllib.urlopen(self.url_base))
 
-    def _dochits_to_objset(self, docHits):
-        '''Returns list of objects.
+    def _iter_records(self, stream):
+        '''Yield each <record> element as soon as it is parsed, then
+        remove it from the tree.
+        Records nested in another record are yielded before it and are kept
+        until the outer record has been yielded, as they are part of its
+        data.
         '''
-        objset = []
-        # Use islice w/ self.docs_fetched  to iterate through docHits
-        for d in islice(docHits, self.docs_fetched, None):
-            obj = {}
-            obj_mdata = defaultdict(list)
-            for mdata in d.iter():
-                # Find elements w/ text value and no children
-                if mdata.text and (len(mdata) is 0):
-                    if self.re_ns_strip.match(mdata.tag):
-                        key = self.re_ns_strip.match(mdata.tag).group('tag')
-                    else:
-                        key = mdata.tag
-                    obj_mdata[key].append(mdata.text)
-                # Find elements w/ attribute value and no children
-                if mdata.attrib and (len(mdata) is 0):
-                    for elem in mdata.attrib:
-                        obj_mdata[elem].append(mdata.get(elem))
-            obj['metadata'] = dict(obj_mdata)
-            objset.append(obj)
-            self.docs_fetched += 1
-            self.doc_current += 1
-            # Once 1000 records in objset, reset self.doc_current & break/return
-            if self.doc_current == 1000 or self.docs_fetched >= self.docs_total:
-                self.doc_current = 0
-                break
-        return objset
+        path = []
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                path.append(elem)
+                continue
+            path.pop()
+            if elem.tag != 'record':
+                continue
+            yield elem
+            if 'record' not in [e.tag for e in path]:
+                elem.clear()
+                if path:
+                    path[-1].remove(elem)
+        stream.close()
+
+    def _record_to_obj(self, d):
+        '''Returns the object for a <record> element.
+        '''
+        obj = {}
+        obj_mdata = defaultdict(list)
+        for mdata in d.iter():
+            # Find elements w/ text value and no children
+            if mdata.text and (len(mdata) is 0):
+                if self.re_ns_strip.match(mdata.tag):
+                    key = self.re_ns_strip.match(mdata.tag).group('tag')
+                else:
+                    key = mdata.tag
+                obj_mdata[key].append(mdata.text)
+            # Find elements w/ attribute value and no children
+            if mdata.attrib and (len(mdata) is 0):
+                for elem in mdata.attrib:
+                    obj_mdata[elem].append(mdata.get(elem))
+        obj['metadata'] = dict(obj_mdata)
+        return obj
 
     def next(self):
-        '''get next objset, use etree to pythonize'''
-        if self.docs_fetched >= self.docs_total:
+        '''get next objset of up to page_size records'''
+        objset = [
+            self._record_to_obj(d)
+            for d in islice(self._records, self.page_size)
+        ]
+        if not objset:
             raise StopIteration
-        return self._dochits_to_objset(self.hits)
+        self.docs_fetched += len(objset)
+        return objset
 
 
 # Copyright © 2016, Regents of the University of California
@@ -10,6 +10,11 @@ import datetime
 import time
 import urlparse
 import urllib
+import hashlib
+import json
+import tempfile
+import threading
+from multiprocessing.pool import ThreadPool
 from couchdb import ResourceConflict
 import requests
 import md5s3stash
@@ -17,10 +22,11 @@ import boto.s3
 import logging
 from collections import namedtuple
 from collections import defaultdict
+from itertools import islice, izip, dropwhile
 from harvester.couchdb_init import get_couchdb
 from harvester.config import config
 from redis import Redis
-import redis_collections
+from harvester.redis_cache import RedisHashCache
 from harvester.couchdb_pager import couchdb_pager
 from harvester.cleanup_dir import cleanup_work_dir
 from harvester.sns_message import publish_to_harvesting
@@ -33,6 +39,29 @@ BUCKET_BASES = os.environ.get(
 COUCHDB_VIEW = 'all_provider_docs/by_provider_name'
 URL_OAC_CONTENT_BASE = os.environ.get('URL_OAC_CONTENT_BASE',
                                       'http://content.cdlib.org')
+IMAGE_CHUNK_SIZE = 64 * 1024  # bytes read from an image response at a time
+# docs whose object cache entries are read from redis at once
+IMAGE_CACHE_PRELOAD_SIZE = 500
+COUCHDB_BULK_SIZE = 100  # docs per _bulk_docs write of image results
+COUCHDB_CONFLICT_RETRIES = 3
+IMAGE_OBJECT_FIELDS = ('object', 'object_dimensions')
+IMAGE_HARVEST_CHECKPOINT_KEY = 'ucldc:harvester:image-harvest-checkpoint:{}'
+IMAGE_HARVEST_CHECKPOINT_TTL = 7 * 24 * 60 * 60  # a week, in seconds
+# leading bytes of the image formats we harvest
+IMAGE_MAGIC_NUMBERS = (
+    ('\xff\xd8\xff', 'image/jpeg'),
+    ('\x89PNG\r\n\x1a\n', 'image/png'),
+    ('GIF87a', 'image/gif'),
+    ('GIF89a', 'image/gif'),
+    ('II*\x00', 'image/tiff'),
+    ('MM\x00*', 'image/tiff'),
+    ('\x00\x00\x00\x0cjP  \r\n\x87\n', 'image/jp2'),
+    ('\xffO\xffQ', 'image/jp2'),  # bare JPEG 2000 codestream
+    ('BM', 'image/bmp'),
+)
+
+StashReport = namedtuple('StashReport',
+                         'url, md5, s3_url, mime_type, dimensions')
 
 logging.basicConfig(level=logging.DEBUG, )
 
@@ -64,42 +93,150 @@ class FailsImageTest(ImageHarvestError):
     dict_key = 'Fails the link is to image test'
 
 
+def sniff_image_type(head):
+    '''Return the image mime type for the magic number at the start of
+    head, or None if the bytes are not from a known image format'''
+    for magic, mime_type in IMAGE_MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    if head[:4] == 'RIFF' and head[8:12] == 'WEBP':
+        return 'image/webp'
+    return None
+
+
+class ImageProbe(object):
+    '''A single streamed GET of an image link.
+
+    The content type comes from the response headers, or from the first
+    bytes of the body when the headers don't say image (some servers send
+    text/html or no content-type for images). Only the first chunk of the
+    body is read until spool is called, so probing a link that isn't
+    stashed costs one request & a chunk of data.
+    With a url_cache, the request is made conditional on the ETag &
+    Last-Modified of the last download, as md5s3stash does, as long as the
+    hash_cache can fill in the report. If the image hasn't changed
+    not_modified is True & md5 is the cached md5.
+    '''
+
+    def __init__(self, doc_id, url, auth=None, url_cache=None,
+                 hash_cache=None):
+        self.doc_id = doc_id
+        self.url = url
+        self.url_cache = url_cache
+        self.not_modified = False
+        self.md5 = None
+        self.mime_type = None
+        self._head = ''
+        self._chunks = iter(())
+        headers = {}
+        cached = url_cache.get(url) if url_cache is not None else None
+        if cached and cached.get('md5') and \
+                (hash_cache is None or cached['md5'] in hash_cache):
+            for header in ('If-None-Match', 'If-Modified-Since'):
+                if header in cached:
+                    headers[header] = cached[header]
+        if md5s3stash.is_s3_url(url):
+            auth = None  # S3 returns a 400 if sent http auth
+        self.response = requests.get(
+            url, headers=headers, auth=auth, stream=True,
+            allow_redirects=True)
+        if headers and self.response.status_code == 304:
+            self.close()
+            self.not_modified = True
+            self.md5 = cached['md5']
+            return
+        # requests throws if can't connect
+        if self.response.status_code != 200:
+            self.close()
+            raise ImageHTTPError(
+                'HTTP ERROR: {}'.format(self.response.status_code),
+                doc_id=doc_id)
+        self._chunks = self.response.iter_content(IMAGE_CHUNK_SIZE)
+        self._head = next(self._chunks, '')
+        content_type = self.response.headers.get('content-type', None)
+        if content_type:
+            self.mime_type = content_type.split(';', 1)[0].strip()
+        if not self._is_image_type(self.mime_type):
+            self.mime_type = sniff_image_type(self._head) or self.mime_type
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    @staticmethod
+    def _is_image_type(mime_type):
+        return bool(mime_type) and \
+            mime_type.split('/', 1)[0].lower() == 'image'
+
+    @property
+    def is_image(self):
+        '''An unmodified link was stashed as an image before'''
+        return self.not_modified or self._is_image_type(self.mime_type)
+
+    def spool(self):
+        '''Read the rest of the body into a temp file, hashing it as it
+        goes. Sets md5, records the download in the url_cache & returns
+        the path to the file, which the caller should remove.
+        '''
+        hasher = hashlib.md5()
+        temp_file = tempfile.NamedTemporaryFile(delete=False, prefix='md5s3_')
+        try:
+            with temp_file:
+                chunk = self._head
+                while chunk:
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+                    chunk = next(self._chunks, '')
+        except:
+            os.remove(temp_file.name)
+            raise
+        finally:
+            self.close()
+        self.md5 = hasher.hexdigest()
+        if self.url_cache is not None:
+            cached = {'md5': self.md5}
+            headers = self.response.headers
+            if 'ETag' in headers:
+                cached['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                cached['If-Modified-Since'] = headers['Last-Modified']
+            self.url_cache[self.url] = cached
+        return temp_file.name
+
+    def close(self):
+        self.response.close()
+
+
 def link_is_to_image(doc_id, url, auth=None):
     '''Check if the link points to an image content type.
     Return True or False accordingly.
     '''
-    if md5s3stash.is_s3_url(url):
-        response = requests.head(url, allow_redirects=True)
-    else:
-        response = requests.head(url, allow_redirects=True, auth=auth)
-    # have a server that returns a 403 here, does have content-type of
-    # text/html. Dropping this test here. requests throws if can't connect
-    if response.status_code != 200:
-        # many servers do not support HEAD requests, try get
-        if md5s3stash.is_s3_url(url):
-            response = requests.get(url, allow_redirects=True)
-        else:
-            response = requests.get(url, allow_redirects=True, auth=auth)
-        if response.status_code != 200:
-            raise ImageHTTPError(
-                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id)
-    content_type = response.headers.get('content-type', None)
-    if not content_type:
+    with ImageProbe(doc_id, url, auth=auth) as probe:
+        return probe.is_image
+
+
+def md5_to_s3_url(md5, bucket_base):
+    '''The s3 url for an image in the bucket_base, md5s3stash's "simple"
+    bucket scheme'''
+    return 's3://{}/{}'.format(bucket_base, md5)
+
+
+def upload_image_file(path, s3_url, mime_type, conn):
+    '''Upload the file at path to s3_url, unless the key already exists.
+    Return True if the file was uploaded.
+    '''
+    parts = urlparse.urlsplit(s3_url)
+    bucket = conn.get_bucket(parts.netloc, validate=False)
+    if bucket.get_key(parts.path) is not None:
         return False
-    reg_type = content_type.split('/', 1)[0].lower()
-    # situation where a server returned 'text/html' to HEAD requests
-    # but returned 'image/jpeg' for GET.
-    # try a slower GET if not image type
-    if reg_type != 'image':
-        response = requests.get(url, allow_redirects=True, auth=auth)
-        if response.status_code != 200:
-            raise ImageHTTPError(
-                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id)
-        content_type = response.headers.get('content-type', None)
-        if not content_type:
-            return False
-        reg_type = content_type.split('/', 1)[0].lower()
-    return reg_type == 'image'
+    key = bucket.new_key(parts.path)
+    # metadata has to be set before the contents
+    if mime_type:
+        key.set_metadata('Content-Type', mime_type)
+    key.set_contents_from_filename(path)
+    return True
 
 
 # Need to make each download a separate job.
@@ -108,12 +245,17 @@ def stash_image_for_doc(doc,
                         hash_cache,
                         ignore_content_type,
                         bucket_bases=BUCKET_BASES,
-                        auth=None):
-    '''Stash the images in s3, using md5s3stash
+                        auth=None,
+                        s3_connection=None,
+                        pool=None):
+    '''Stash the images in s3, as md5s3stash does.
     Duplicate it among the "BUCKET_BASES" list. This will give redundancy
     in case some idiot (me) deletes one of the copies. Not tons of data so
     cheap to replicate them.
-    Return md5s3stash report if image found
+    The image is requested once: the same streamed GET decides if the link
+    is to an image & is spooled to a temp file for upload to the buckets.
+    See stash_image_file for s3_connection & pool.
+    Return the list of stash reports if image found
     If link is not an image type, don't stash & raise
     '''
     try:
@@ -136,33 +278,134 @@ def stash_image_for_doc(doc,
         msg = 'Link not http URL for {} - {}'.format(doc['_id'], url_image)
         print >> sys.stderr, msg
         raise FailsImageTest(msg, doc_id=doc['_id'])
-    reports = []
-    # If '--ignore_content_type' set, don't check link_is_to_image
-    if link_is_to_image(doc['_id'], url_image, auth) or ignore_content_type:
-        for bucket_base in bucket_bases:
-            try:
-                logging.getLogger('image_harvest.stash_image').info(
-                    'bucket_base:{0} url_image:{1}'.format(bucket_base,
-                                                           url_image))
-                region, bucket_base = bucket_base.split(':')
-                conn = boto.s3.connect_to_region(region)
-                report = md5s3stash.md5s3stash(
-                    url_image,
-                    bucket_base=bucket_base,
-                    conn=conn,
-                    url_auth=auth,
-                    url_cache=url_cache,
-                    hash_cache=hash_cache)
-                reports.append(report)
-            except TypeError as e:
-                print >> sys.stderr, 'TypeError for doc:{} {} Msg: {} Args:' \
-                    ' {}'.format(
-                        doc['_id'], url_image, e.message, e.args)
-        return reports
+    with ImageProbe(doc['_id'], url_image, auth=auth, url_cache=url_cache,
+                    hash_cache=hash_cache) as probe:
+        # If '--ignore_content_type' set, don't check the link is to image
+        if not probe.is_image and not ignore_content_type:
+            msg = 'Not an image for {} - {}'.format(doc['_id'], url_image)
+            print >> sys.stderr, msg
+            raise FailsImageTest(msg, doc_id=doc['_id'])
+        if probe.not_modified:
+            # already stashed, the caches have the report
+            mime_type, dimensions = hash_cache[probe.md5][1:]
+            return [StashReport(url_image, probe.md5,
+                                md5_to_s3_url(probe.md5, b.split(':')[1]),
+                                mime_type, dimensions)
+                    for b in bucket_bases]
+        path = probe.spool()
+    try:
+        return stash_image_file(url_image, path, probe.md5,
+                                probe.mime_type, hash_cache, bucket_bases,
+                                s3_connection=s3_connection, pool=pool)
+    finally:
+        os.remove(path)
+
+
+def stash_image_file(url_image, path, md5, mime_type, hash_cache,
+                     bucket_bases=BUCKET_BASES,
+                     s3_connection=None,
+                     pool=None):
+    '''Upload the downloaded image file to each of the bucket_bases.
+    The file is hashed & its image info read once for all the buckets.
+    s3_connection is a function returning a boto connection for a region,
+    by default a new connection is made for each upload. With a thread
+    pool, the uploads to the buckets run concurrently.
+    Return the list of stash reports.
+    '''
+    if s3_connection is None:
+        s3_connection = boto.s3.connect_to_region
+    if md5 in hash_cache:
+        image_mime_type, dimensions = hash_cache[md5][1:]
     else:
-        msg = 'Not an image for {} - {}'.format(doc['_id'], url_image)
-        print >> sys.stderr, msg
-        raise FailsImageTest(msg, doc_id=doc['_id'])
+        image_mime_type, dimensions = md5s3stash.image_info(path)
+
+    def stash(bucket_base):
+        logging.getLogger('image_harvest.stash_image').info(
+            'bucket_base:{0} url_image:{1}'.format(bucket_base, url_image))
+        region, bucket_base = bucket_base.split(':')
+        s3_url = md5_to_s3_url(md5, bucket_base)
+        upload_image_file(path, s3_url, mime_type, s3_connection(region))
+        return StashReport(url_image, md5, s3_url, image_mime_type,
+                           dimensions)
+
+    if pool and len(bucket_bases) > 1:
+        reports = pool.map(stash, bucket_bases)
+    else:
+        reports = [stash(bucket_base) for bucket_base in bucket_bases]
+    if reports and md5 not in hash_cache:
+        hash_cache[md5] = (reports[0].s3_url, image_mime_type, dimensions)
+    return reports
+
+
+class CouchDBObjectWriter(object):
+    '''Write the image object fields of docs to couchdb in _bulk_docs
+    batches of batch_size.
+
+    If the doc has been changed in couchdb since it was read, the latest
+    revision is read back & the image object fields applied to it again,
+    up to retries times.
+    '''
+
+    def __init__(self,
+                 db,
+                 batch_size=COUCHDB_BULK_SIZE,
+                 retries=COUCHDB_CONFLICT_RETRIES):
+        self._db = db
+        self.batch_size = batch_size
+        self.retries = retries
+        self._docs = []
+        self.num_saved = 0
+        self.num_failed = 0
+
+    def add(self, doc):
+        self._docs.append(doc)
+        if len(self._docs) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''Write the pending docs'''
+        docs, self._docs = self._docs, []
+        for attempt in range(self.retries + 1):
+            if not docs:
+                return
+            conflicts = []
+            for doc, (ok, doc_id, rev_or_exc) in izip(
+                    docs, self._db.update(docs)):
+                if ok:
+                    self.num_saved += 1
+                elif isinstance(rev_or_exc, ResourceConflict) and \
+                        attempt < self.retries:
+                    conflicts.append(doc)
+                else:
+                    self.num_failed += 1
+                    msg = '{} for doc: {} - {}'.format(
+                        type(rev_or_exc).__name__, doc_id, rev_or_exc)
+                    print >> sys.stderr, msg
+            docs = self._reapply(conflicts)
+
+    def _reapply(self, conflicts):
+        '''Read the latest revisions of the conflicted docs in one request
+        & set the image object fields on them again'''
+        if not conflicts:
+            return []
+        latest = dict(
+            (row.id, row.doc)
+            for row in self._db.view(
+                '_all_docs', keys=[d['_id'] for d in conflicts],
+                include_docs=True) if row.doc)
+        docs = []
+        for doc in conflicts:
+            doc_latest = latest.get(doc['_id'])
+            if doc_latest is None:
+                self.num_failed += 1
+                msg = 'Doc deleted before image saved: {}'.format(
+                    doc['_id'])
+                print >> sys.stderr, msg
+                continue
+            for field in IMAGE_OBJECT_FIELDS:
+                doc_latest[field] = doc[field]
+            docs.append(doc_latest)
+        return docs
 
 
 class ImageHarvester(object):
@@ -187,7 +430,11 @@ class ImageHarvester(object):
             if not url_couchdb:
                 url_couchdb = self._config['couchdb_url']
             self._couchdb = get_couchdb(url=url_couchdb, dbname=couchdb_name)
+        self._couch_writer = CouchDBObjectWriter(self._couchdb)
         self._bucket_bases = bucket_bases
+        # boto connections aren't thread safe, keep one per thread & region
+        self._s3_local = threading.local()
+        self._stash_pool = None
         self._view = couch_view
         # auth is a tuple of username, password
         self._auth = object_auth
@@ -198,37 +445,71 @@ class ImageHarvester(object):
             port=self._config['redis_port'],
             password=self._config['redis_password'],
             socket_connect_timeout=self._config['redis_connect_timeout'])
+        # the caches are read in batches & written in pipelines, see
+        # RedisHashCache. flush_caches writes out any pending sets
         self._url_cache = url_cache if url_cache is not None else \
-            redis_collections.Dict(key='ucldc-image-url-cache',
-                                   redis=self._redis)
+            RedisHashCache(self._redis, 'ucldc-image-url-cache')
         self._hash_cache = hash_cache if hash_cache is not None else \
-            redis_collections.Dict(key='ucldc-image-hash-cache',
-                                   redis=self._redis)
+            RedisHashCache(self._redis, 'ucldc-image-hash-cache')
         self._object_cache = harvested_object_cache if harvested_object_cache \
             else \
-            redis_collections.Dict(
-                key='ucldc:harvester:harvested-images',
-                redis=self._redis)
+            RedisHashCache(self._redis, 'ucldc:harvester:harvested-images')
+
+    def preload_object_cache(self, doc_ids):
+        '''Read the object cache entries for a batch of docs at once'''
+        if hasattr(self._object_cache, 'preload'):
+            self._object_cache.preload(doc_ids)
+
+    def flush_caches(self):
+        '''Write any buffered cache sets to redis'''
+        for cache in (self._url_cache, self._hash_cache, self._object_cache):
+            if hasattr(cache, 'flush'):
+                cache.flush()
+
+    def flush(self):
+        '''Write the pending doc updates to couchdb & the caches to redis'''
+        self._couch_writer.flush()
+        self.flush_caches()
+
+    def close(self):
+        '''Stop the threads uploading to the buckets. A new pool is started
+        if more images are stashed after this'''
+        if self._stash_pool:
+            self._stash_pool.close()
+            self._stash_pool.join()
+            self._stash_pool = None
+
+    def _s3_connection(self, region):
+        '''Return the S3 connection to the region for this thread,
+        connecting on first use'''
+        conns = getattr(self._s3_local, 'conns', None)
+        if conns is None:
+            conns = self._s3_local.conns = {}
+        if region not in conns:
+            conns[region] = boto.s3.connect_to_region(region)
+        return conns[region]
 
     def stash_image(self, doc):
+        if not self._stash_pool and len(self._bucket_bases) > 1:
+            # upload to all the buckets at once
+            self._stash_pool = ThreadPool(len(self._bucket_bases))
         return stash_image_for_doc(
             doc,
             self._url_cache,
             self._hash_cache,
             self.ignore_content_type,
             bucket_bases=self._bucket_bases,
-            auth=self._auth)
+            auth=self._auth,
+            s3_connection=self._s3_connection,
+            pool=self._stash_pool)
 
     def update_doc_object(self, doc, report):
-        '''Update the object field to point to an s3 bucket'''
+        '''Update the object field to point to an s3 bucket.
+        The doc is saved to couchdb with the next bulk write, see flush.
+        '''
         doc['object'] = report.md5
         doc['object_dimensions'] = report.dimensions
-        try:
-            self._couchdb.save(doc)
-        except ResourceConflict as e:
-            msg = 'ResourceConflictfor doc: {} - {}'.format(doc[
-                '_id'], e.message)
-            print >> sys.stderr, msg
+        self._couch_writer.add(doc)
         return doc['object']
 
     def harvest_image_for_doc(self, doc, force=False):
@@ -269,49 +550,124 @@ class ImageHarvester(object):
     def by_doc_id(self, doc_id):
         '''For a list of ids, harvest images'''
         doc = self._couchdb[doc_id]
-        dt_start = dt_end = datetime.datetime.now()
         report_errors = defaultdict(list)
         try:
             reports = self.harvest_image_for_doc(doc, force=True)
         except ImageHarvestError as e:
             report_errors[e.dict_key].append((e.doc_id, str(e)))
-        dt_end = datetime.datetime.now()
-        time.sleep((dt_end - dt_start).total_seconds())
+        finally:
+            self.flush()
+            self.close()
         return report_errors
 
-    def by_collection(self, collection_key=None):
+    def _checkpoint_key(self, collection_key):
+        return IMAGE_HARVEST_CHECKPOINT_KEY.format(collection_key or 'all')
+
+    def get_checkpoint(self, collection_key=None):
+        '''Return the checkpoint of an unfinished by_collection run, a
+        dictionary with the last_doc_id processed, the num_docs processed
+        & the count of each type of error, or None'''
+        data = self._redis.get(self._checkpoint_key(collection_key))
+        return json.loads(data) if data else None
+
+    def save_checkpoint(self, collection_key, checkpoint):
+        self._redis.set(self._checkpoint_key(collection_key),
+                        json.dumps(checkpoint),
+                        ex=IMAGE_HARVEST_CHECKPOINT_TTL)
+
+    def clear_checkpoint(self, collection_key=None):
+        self._redis.delete(self._checkpoint_key(collection_key))
+
+    def by_collection(self, collection_key=None, resume=False):
         '''If collection_key is none, trying to grab all of the images. (Not
         recommended)
+        A checkpoint is saved in redis after each batch of docs is written.
+        With resume, the harvest restarts after the last checkpointed doc
+        of an unfinished run, instead of paging through the whole view.
         '''
+        checkpoint = self.get_checkpoint(collection_key) if resume else None
+        if checkpoint:
+            last_doc_id = checkpoint['last_doc_id']
+            num_docs_before = checkpoint['num_docs']
+            errors_before = checkpoint['errors']
+            print >> sys.stderr, 'Resume image harvest after {} docs at ' \
+                '{}'.format(num_docs_before, last_doc_id)
+        else:
+            self.clear_checkpoint(collection_key)
+            last_doc_id = None
+            num_docs_before = 0
+            errors_before = {}
         if collection_key:
             v = couchdb_pager(
                 self._couchdb,
                 view_name=self._view,
                 startkey='"{0}"'.format(collection_key),
+                startkey_docid=last_doc_id,
                 endkey='"{0}"'.format(collection_key),
                 include_docs='true')
+        elif checkpoint:
+            v = couchdb_pager(
+                self._couchdb,
+                startkey=json.dumps(last_doc_id),
+                include_docs='true')
         else:
             # use _all_docs view
             v = couchdb_pager(self._couchdb, include_docs='true')
         doc_ids = []
         report_errors = defaultdict(list)
-        for r in v:
-            dt_start = dt_end = datetime.datetime.now()
-            try:
-                reports = self.harvest_image_for_doc(r.doc)
-            except ImageHarvestError as e:
-                report_errors[e.dict_key].append((e.doc_id, str(e)))
-            doc_ids.append(r.doc['_id'])
-            dt_end = datetime.datetime.now()
-            time.sleep((dt_end - dt_start).total_seconds())
+        rows = iter(v)
+        if checkpoint:
+            # the view starts at the last doc of the checkpoint
+            rows = dropwhile(lambda r: r.id == last_doc_id, rows)
+        try:
+            while True:
+                batch = list(islice(rows, IMAGE_CACHE_PRELOAD_SIZE))
+                if not batch:
+                    break
+                self.preload_object_cache([r.doc['_id'] for r in batch])
+                for r in batch:
+                    dt_start = dt_end = datetime.datetime.now()
+                    fetched = True
+                    try:
+                        reports = self.harvest_image_for_doc(r.doc)
+                    except ImageHarvestError as e:
+                        report_errors[e.dict_key].append(
+                            (e.doc_id, str(e)))
+                        fetched = not isinstance(
+                            e, (HasObject, RestoreFromObjectCache))
+                    doc_ids.append(r.doc['_id'])
+                    if fetched:
+                        # go easy on the image server
+                        dt_end = datetime.datetime.now()
+                        time.sleep((dt_end - dt_start).total_seconds())
+                self.flush()
+                errors = dict(errors_before)
+                for key, val in report_errors.items():
+                    errors[key] = errors.get(key, 0) + len(val)
+                self.save_checkpoint(collection_key, {
+                    'last_doc_id': batch[-1].id,
+                    'num_docs': num_docs_before + len(doc_ids),
+                    'errors': errors,
+                })
+        finally:
+            # don't lose the results of a harvest that is stopped
+            self.flush()
+            self.close()
+        self.clear_checkpoint(collection_key)
         report_list = [
             ' : '.join((key, str(val))) for key, val in report_errors.items()
         ]
+        if checkpoint:
+            report_list.insert(0, 'Resumed after {} documents'.format(
+                num_docs_before))
+            report_list.extend('{} before resume : {}'.format(key, val)
+                               for key, val in errors_before.items())
         report_msg = '\n'.join(report_list)
         subject = format_results_subject(collection_key,
                                          'Image harvest to CouchDB {env}')
         publish_to_harvesting(subject, ''.join(
-            ('Processed {} documents\n'.format(len(doc_ids)), report_msg)))
+            ('Processed {} documents\n'.format(
+                num_docs_before + len(doc_ids)), report_msg)))
         return doc_ids, report_errors
 
 
@@ -319,6 +675,7 @@ def harvest_image_for_doc(doc_id,
                           url_couchdb=None,
                           object_auth=None,
                           get_if_object=False,
+                          ignore_content_type=False,
                           force=False):
     '''Wrapper to call from rqworker.
     Creates ImageHarvester object & then calls harvest_image_for_doc
@@ -334,20 +691,26 @@ def harvest_image_for_doc(doc_id,
     if not get_if_object and 'object' in doc and not force:
         print >> sys.stderr, 'Skipping {}, has object field'.format(doc['_id'])
     else:
-        harvester.harvest_image_for_doc(doc, force=force)
+        try:
+            harvester.harvest_image_for_doc(doc, force=force)
+        finally:
+            harvester.flush()
+            harvester.close()
 
 
 def main(collection_key=None,
          url_couchdb=None,
          object_auth=None,
          get_if_object=False,
-         ignore_content_type=False):
+         ignore_content_type=False,
+         resume=False):
     cleanup_work_dir()  # remove files from /tmp
     doc_ids, report_errors = ImageHarvester(
         url_couchdb=url_couchdb,
         object_auth=object_auth,
         get_if_object=get_if_object,
-        ignore_content_type=ignore_content_type).by_collection(collection_key)
+        ignore_content_type=ignore_content_type).by_collection(
+            collection_key, resume=resume)
 
 
 if __name__ == '__main__':
@@ -367,6 +730,12 @@ if __name__ == '__main__':
         default=False,
         help='Should image harvester not get image if the object field exists '
         'for the doc (default: False, always get)')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help='Restart from the checkpoint of an unfinished harvest of the '
+        'collection')
     args = parser.parse_args()
     print(args)
     object_auth = None
@@ -377,4 +746,5 @@ if __name__ == '__main__':
         args.collection_key,
         object_auth=object_auth,
         url_couchdb=args.url_couchdb,
-        get_if_object=args.get_if_object)
+        get_if_object=args.get_if_object,
+        resume=args.resume)
@@ -0,0 +1,163 @@
+'''Cache successful nuxeo media checks for the solr sync.
+
+MediaJson(structmap_url).check_media() makes S3 requests for the media
+json & each file it references. A successful check is stored in redis with
+a TTL, along with the ETag of the media json when it is known, so media
+that hasn't changed is not checked again on every sync.
+With prefetch, the media json "directory" is listed from S3 once, giving
+the ETags of all the media json files in bulk. Media json files missing
+from the listing can be rejected without any further requests.
+The nuxeo media json prefix is shared by every collection, so listing it
+costs more than checking the docs of a small collection one by one. The
+listing is only made once more than prefetch_after media json urls under
+the prefix have been looked up.
+'''
+import os
+import urlparse
+from collections import defaultdict
+from itertools import islice
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+from redis import Redis
+from redis.exceptions import RedisError
+import logbook
+from harvester.config import config
+
+MEDIA_CHECK_KEY_PREFIX = 'ucldc-media-check:'
+MEDIA_CHECK_TTL = 7 * 24 * 60 * 60  # a week, in seconds
+MEDIA_PREFETCH_AFTER = 5000  # lookups under a prefix before it is listed
+MEDIA_CLEAR_BATCH_SIZE = 1000  # keys scanned & deleted at a time by clear
+
+
+def split_s3_url(url):
+    '''Return the bucket & key for an s3://bucket/key url'''
+    parts = urlparse.urlsplit(url)
+    return parts.netloc, parts.path.lstrip('/')
+
+
+class MediaCheckCache(object):
+    '''Redis backed record of media json that passed check_media.
+
+    If redis is unavailable the cache is turned off for the rest of the
+    run and every doc is checked, as if there were no cache.
+    '''
+
+    def __init__(self,
+                 redis=None,
+                 ttl=MEDIA_CHECK_TTL,
+                 prefetch=False,
+                 prefetch_after=MEDIA_PREFETCH_AFTER):
+        if redis is None:
+            conf = config()
+            redis = Redis(
+                host=conf['redis_host'],
+                port=conf['redis_port'],
+                password=conf['redis_password'],
+                socket_connect_timeout=conf['redis_connect_timeout'])
+        self._redis = redis
+        self.ttl = ttl
+        self.prefetch = prefetch
+        self.prefetch_after = prefetch_after
+        self.logger = logbook.Logger('MediaCheckCache')
+        self._listings = {}  # (bucket, prefix) -> {key: etag}
+        self._lookups = defaultdict(int)  # (bucket, prefix) -> count
+        self.hits = 0
+        self.misses = 0
+
+    def _redis_call(self, method, *args):
+        if self._redis is None:
+            return None
+        try:
+            return getattr(self._redis, method)(*args)
+        except RedisError as e:
+            self._turn_off(e)
+            return None
+
+    def _turn_off(self, error):
+        self.logger.warning(
+            'Media check cache off, redis error: {}'.format(error))
+        self._redis = None
+
+    def list_prefix(self, bucket, prefix):
+        '''List the objects under prefix in the S3 bucket & keep their
+        ETags. Returns the dictionary of key to ETag, or None if the
+        listing failed.
+        '''
+        if (bucket, prefix) in self._listings:
+            return self._listings[(bucket, prefix)]
+        etags = {}
+        try:
+            paginator = boto3.client('s3').get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    etags[obj['Key']] = obj['ETag'].strip('"')
+        except (BotoCoreError, ClientError) as e:
+            self.logger.warning('Failed to list s3://{}/{}: {}'.format(
+                bucket, prefix, e))
+            etags = None
+        self._listings[(bucket, prefix)] = etags
+        if etags is not None:
+            self.logger.info('Listed {} objects in s3://{}/{}'.format(
+                len(etags), bucket, prefix))
+        return etags
+
+    def listed_etag(self, structmap_url):
+        '''Return (listed, etag) for the media json at structmap_url.
+        listed is False when no S3 listing covers the url. When it is True,
+        etag is None if the media json is not in the bucket.
+        With prefetch, the prefix is listed on the first lookup after
+        prefetch_after lookups under it.
+        '''
+        if not structmap_url.startswith('s3://'):
+            return False, None
+        bucket, key = split_s3_url(structmap_url)
+        prefix = os.path.dirname(key)
+        prefix = prefix + '/' if prefix else ''
+        etags = self._listings.get((bucket, prefix))
+        if etags is None and self.prefetch and \
+                (bucket, prefix) not in self._listings:
+            self._lookups[(bucket, prefix)] += 1
+            if self._lookups[(bucket, prefix)] > self.prefetch_after:
+                etags = self.list_prefix(bucket, prefix)
+        if etags is None:
+            return False, None
+        return True, etags.get(key)
+
+    def is_checked(self, structmap_url, etag=None):
+        '''True if the media passed a check within the TTL. If the ETag
+        of the media json is given it must match the one checked.
+        '''
+        checked = self._redis_call('get',
+                                   MEDIA_CHECK_KEY_PREFIX + structmap_url)
+        if checked is not None and (etag is None or checked == etag):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def set_checked(self, structmap_url, etag=None):
+        '''Record that the media for structmap_url passed its check'''
+        self._redis_call('set', MEDIA_CHECK_KEY_PREFIX + structmap_url,
+                         etag or '', self.ttl)
+
+    def invalidate(self, structmap_url):
+        '''Forget the check for structmap_url, so it is checked again'''
+        self._redis_call('delete', MEDIA_CHECK_KEY_PREFIX + structmap_url)
+
+    def clear(self):
+        '''Forget all media checks.
+        The keys are found with SCAN & deleted in batches, KEYS would block
+        the shared redis while it goes through the whole keyspace.
+        '''
+        if self._redis is None:
+            return
+        try:
+            keys = self._redis.scan_iter(match=MEDIA_CHECK_KEY_PREFIX + '*',
+                                         count=MEDIA_CLEAR_BATCH_SIZE)
+            while True:
+                batch = list(islice(keys, MEDIA_CLEAR_BATCH_SIZE))
+                if not batch:
+                    break
+                self._redis.delete(*batch)
+        except RedisError as e:
+            self._turn_off(e)
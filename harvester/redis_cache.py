@@ -0,0 +1,103 @@
+'''Batched access to the redis hashes the image harvest uses as caches.
+
+redis_collections.Dict makes a round trip to redis, with pickling, for
+every get & set. RedisHashCache reads & writes the same redis hashes, field
+per key with a pickled value, so the two can be used on the same hash:
+ * preload gets the values for a batch of keys with one HMGET
+ * sets are buffered & written in a pipeline of HSETs by flush, which is
+   called automatically once write_batch sets are pending
+ * recently used values, and keys known not to be in redis, are kept in
+   an in-process LRU in front of redis
+'''
+import cPickle as pickle
+from collections import OrderedDict
+from itertools import izip
+
+REDIS_CACHE_LRU_SIZE = 10000  # values kept in process per cache
+REDIS_CACHE_WRITE_BATCH = 500  # sets buffered before they are written
+
+_MISSING = object()  # LRU marker for keys not in the redis hash
+
+
+class RedisHashCache(object):
+    '''A dict like cache on the redis hash at key.
+
+    Sets are not visible to other processes until they are flushed.
+    '''
+
+    def __init__(self,
+                 redis,
+                 key,
+                 lru_size=REDIS_CACHE_LRU_SIZE,
+                 write_batch=REDIS_CACHE_WRITE_BATCH):
+        self._redis = redis
+        self.key = key
+        self.lru_size = lru_size
+        self.write_batch = write_batch
+        self._lru = OrderedDict()
+        self._pending = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, value):
+        self._lru.pop(key, None)
+        self._lru[key] = value
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    @staticmethod
+    def _unpickle(data):
+        return _MISSING if data is None else pickle.loads(data)
+
+    def _lookup(self, key):
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key]
+        if key in self._lru:
+            self.hits += 1
+            value = self._lru[key]
+        else:
+            self.misses += 1
+            value = self._unpickle(self._redis.hget(self.key, key))
+        self._remember(key, value)
+        return value
+
+    def preload(self, keys):
+        '''Read the values for keys not already in the LRU with one HMGET'''
+        keys = [k for k in OrderedDict.fromkeys(keys)
+                if k not in self._lru and k not in self._pending]
+        if not keys:
+            return
+        for key, data in izip(keys, self._redis.hmget(self.key, keys)):
+            self._remember(key, self._unpickle(data))
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        self._pending.pop(key, None)
+        self._pending[key] = value
+        self._remember(key, value)
+        if len(self._pending) >= self.write_batch:
+            self.flush()
+
+    def flush(self):
+        '''Write the pending sets to redis in one pipeline'''
+        if not self._pending:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for key, value in self._pending.items():
+            pipe.hset(self.key, key,
+                      pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        pipe.execute()
+        self._pending.clear()
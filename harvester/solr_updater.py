@@ -7,7 +7,9 @@ import argparse
 import re
 import hashlib
 import json
-from collections import defaultdict
+import multiprocessing
+from collections import defaultdict, OrderedDict, deque
+from itertools import izip, islice
 from urlparse import urlparse
 import requests
 import boto3
@@ -17,6 +19,8 @@ from harvester.couchdb_init import get_couchdb
 from harvester.post_processing.couchdb_runner import CouchDBCollectionFilter
 from harvester.sns_message import publish_to_harvesting
 from harvester.sns_message import format_results_subject
+from harvester.media_check_cache import MediaCheckCache
+from harvester.collection_registry_client import Registry
 from facet_decade import facet_decade
 from mediajson import MediaJson
 import datetime
@@ -25,17 +29,32 @@ reload(sys)
 sys.setdefaultencoding('utf8')
 
 S3_BUCKET = 'solr.ucldc'
+SOLR_BATCH_SIZE = 500  # docs per add_many request
+# processes used to map couch docs to solr docs, 1 maps inline
+SOLR_MAP_WORKERS = int(os.environ.get('SOLR_MAP_WORKERS', 1))
+SOLR_MAP_CHUNKSIZE = 100  # couch docs sent to a map worker at a time
+SOLR_MAP_CHUNKS_AHEAD = 4  # chunks queued per map worker, ahead of the sync
+SOLR_DELETE_BATCH_SIZE = 200  # couch ids looked up per solr select
+CHANGES_CHUNK_SIZE = 5000  # _changes rows fetched & synced per checkpoint
+SOLR_HASH_FIELD = 'content_hash_s'  # hash of the mapped solr doc content
+SOLR_ID_PAGE_SIZE = 10000  # rows per request when listing collection ids
+# most collections synced at once, so the solr instance is not swamped
+SOLR_SYNC_WORKERS = int(os.environ.get('SOLR_SYNC_WORKERS', 4))
+COLLECTION_URL_FORMAT = 'https://registry.cdlib.org/api/v1/collection/{}/'
 
 RE_ARK_FINDER = re.compile('(ark:/\d\d\d\d\d/[^/|\s]*)')
 RE_ALPHANUMSPACE = re.compile(r'[^0-9A-Za-z\s]*')  # \W include "_" as does A-z
+RE_JSON_OBJECT_START = re.compile(r'\s*\{')
+RE_YYYY = re.compile(r'(\d\d\d\d)\Z')
+RE_YYYY_MM_DD = re.compile(r'(\d\d\d\d)-(\d\d)-(\d\d)\Z')
+DATE_MEMO_SIZE = 20000  # distinct date strings remembered per memo
+REGISTRY_MEMO_SIZE = 1000  # distinct registry collection blocks remembered
 
 
-def dict_for_data_field(field_src, data, field_dest):
-    '''For a given field_src  in the data, create a dictionary to
-    update the field_dest with.
-    If no values, make the dict {}, this will avoid empty data values
+def data_field_values(field_src, data):
+    '''Return the de-jsoned, non blank values for field_src in the data.
+    A string value is returned as is, otherwise a list is returned.
     '''
-    ddict = {}
     items_not_blank = []
     items = data.get(field_src)
 
@@ -49,6 +68,16 @@ def dict_for_data_field(field_src, data, field_dest):
             for i in items:
                 if i:
                     items_not_blank.append(i)
+    return items_not_blank
+
+
+def dict_for_data_field(field_src, data, field_dest):
+    '''For a given field_src  in the data, create a dictionary to
+    update the field_dest with.
+    If no values, make the dict {}, this will avoid empty data values
+    '''
+    ddict = {}
+    items_not_blank = data_field_values(field_src, data)
     if items_not_blank:
         ddict = {field_dest: items_not_blank}
     return ddict
@@ -61,6 +90,63 @@ def dict_for_data_to_fields(field_src, data, field_dests):
         data_dict.update(dict_for_data_field(field_src, data, field))
     return data_dict
 
+
+class DataField(object):
+    '''Mapping table entry copying a data field to solr doc field(s).
+
+    Called with the data, returns the dictionary to update the solr doc
+    with, as dict_for_data_to_fields does. write puts the values straight
+    into the solr doc, de-jsoning the source field once for all the
+    destination fields. If data_key is given, the field is read from
+    data[data_key].
+    '''
+
+    def __init__(self, field_src, *field_dests, **kwargs):
+        # unicode, like the keys of docs parsed from json
+        self.field_src = unicode(field_src)
+        self.field_dests = field_dests
+        self.data_key = kwargs.get('data_key', None)
+        if self.data_key:
+            self.data_key = unicode(self.data_key)
+
+    def __call__(self, d):
+        ddict = {}
+        self.write(d, ddict)
+        return ddict
+
+    def write(self, d, solr_doc):
+        data = d[self.data_key] if self.data_key else d
+        values = data_field_values(self.field_src, data)
+        if values:
+            solr_doc[self.field_dests[0]] = values
+            for field in self.field_dests[1:]:
+                solr_doc[field] = values if isinstance(values, basestring) \
+                    else list(values)
+
+
+def _update_writer(mapping_func):
+    def write(d, solr_doc):
+        solr_doc.update(mapping_func(d))
+    return write
+
+
+def compile_solr_mapping(mapping):
+    '''Compile a mapping table into a plan dictionary of
+    key -> write(data, solr_doc). DataField entries write their values
+    directly, other entries update the solr doc with their result.
+    '''
+    plan = {}
+    for key, mapping_func in mapping.items():
+        # couch docs parsed from json have unicode keys, matching str keys
+        # to them decodes the str on every lookup
+        key = unicode(key)
+        if isinstance(mapping_func, DataField):
+            plan[key] = mapping_func.write
+        else:
+            plan[key] = _update_writer(mapping_func)
+    return plan
+
+
 COUCHDOC_TO_SOLR_MAPPING = {
     '_id': lambda d: {'harvest_id_s': d['_id']},
     'object': lambda d: {'reference_image_md5': d['object']},
@@ -78,61 +164,59 @@ COUCHDOC_TO_SOLR_MAPPING = {
 # for the interim, spatial needs to map to coverage & spatial.
 # Will this wind up wiping out any sourceResource coverage values?
 COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING = {
-    'alternativeTitle': lambda d: dict_for_data_field('alternativeTitle', d,
-                                                      'alternative_title'),
-    'contributor': lambda d: dict_for_data_field('contributor', d,
-                                                 'contributor'),
-    'coverage': lambda d: dict_for_data_field('coverage', d, 'coverage'),
-    'spatial': lambda d: dict_for_data_to_fields('spatial', d, ('spatial',
-                                                                'coverage')),
-    'creator': lambda d: dict_for_data_field('creator', d, 'creator'),
+    'alternativeTitle': DataField('alternativeTitle', 'alternative_title'),
+    'contributor': DataField('contributor', 'contributor'),
+    'coverage': DataField('coverage', 'coverage'),
+    'spatial': DataField('spatial', 'spatial', 'coverage'),
+    'creator': DataField('creator', 'creator'),
     'date': lambda d:  map_date(d),
-    'description': lambda d: dict_for_data_field('description', d,
-                                                 'description'),
-    'extent': lambda d: dict_for_data_field('extent', d, 'extent'),
-    'format': lambda d: dict_for_data_field('format', d, 'format'),
-    'genre': lambda d: dict_for_data_field('genre', d, 'genre'),
-    'identifier': lambda d: dict_for_data_field('identifier', d, 'identifier'),
+    'description': DataField('description', 'description'),
+    'extent': DataField('extent', 'extent'),
+    'format': DataField('format', 'format'),
+    'genre': DataField('genre', 'genre'),
+    'identifier': DataField('identifier', 'identifier'),
     'language': lambda d: {
         'language': [
             l.get('name', l.get('iso639_3', None))
             if isinstance(l, dict) else l for l in d['language']]},
-    'publisher': lambda d: dict_for_data_field('publisher', d, 'publisher'),
-    'relation': lambda d: dict_for_data_field('relation', d, 'relation'),
-    'rights': lambda d: dict_for_data_field('rights', d, 'rights'),
-    'rightsURI': lambda d: dict_for_data_field('rightsURI', d, 'rights_uri'),
+    'publisher': DataField('publisher', 'publisher'),
+    'relation': DataField('relation', 'relation'),
+    'rights': DataField('rights', 'rights'),
+    'rightsURI': DataField('rightsURI', 'rights_uri'),
     'subject': lambda d: {'subject': [s['name']
                                       if isinstance(s, dict)
                                       else dejson('subject', s)
                                       for s in d['subject']]},
     'temporal': lambda d: {'temporal': unpack_date(d.get('temporal',
                                                          None))[0]},
-    'title': lambda d: dict_for_data_field('title', d, 'title'),
-    'type': lambda d: dict_for_data_field('type', d, 'type'),
-    'provenance': lambda d: dict_for_data_field('provenance', d, 'provenance'),
+    'title': DataField('title', 'title'),
+    'type': DataField('type', 'type'),
+    'provenance': DataField('provenance', 'provenance'),
 }
 
 COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING = {
     #    'location': lambda d: {'location': d.get('location', None)},
-    'dateCopyrighted':
-    lambda d: dict_for_data_field('dateCopyrighted', d, 'rights_date'),
-    'rightsHolder':
-    lambda d: dict_for_data_field('rightsHolder', d, 'rights_holder'),
-    'rightsNote':
-    lambda d: dict_for_data_field('rightsNote', d, 'rights_note'),
-    'source': lambda d: dict_for_data_field('source', d, 'source'),
-    'structmap_text':
-    lambda d: dict_for_data_field('structmap_text', d, 'structmap_text'),
-    'structmap_url':
-    lambda d: dict_for_data_field('structmap_url', d, 'structmap_url'),
-    'transcription':
-    lambda d: dict_for_data_field('transcription', d, 'transcription'),
+    'dateCopyrighted': DataField('dateCopyrighted', 'rights_date'),
+    'rightsHolder': DataField('rightsHolder', 'rights_holder'),
+    'rightsNote': DataField('rightsNote', 'rights_note'),
+    'source': DataField('source', 'source'),
+    'structmap_text': DataField('structmap_text', 'structmap_text'),
+    'structmap_url': DataField('structmap_url', 'structmap_url'),
+    'transcription': DataField('transcription', 'transcription'),
 
     # UCLDC/DC metadata: use schema prefix & d['properties']
     'ucldc_schema:physlocation':
-    lambda d: dict_for_data_field('ucldc_schema:physlocation', d['properties'], 'location'),
+    DataField('ucldc_schema:physlocation', 'location', data_key='properties'),
 }
 
+# compiled once, map_couch_to_solr_doc uses these plans. Recompile if the
+# mapping tables are changed at runtime.
+COUCHDOC_TO_SOLR_PLAN = compile_solr_mapping(COUCHDOC_TO_SOLR_MAPPING)
+COUCHDOC_SRC_RESOURCE_TO_SOLR_PLAN = compile_solr_mapping(
+    COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING)
+COUCHDOC_ORIGINAL_RECORD_TO_SOLR_PLAN = compile_solr_mapping(
+    COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING)
+
 
 def getjobj(data):
     jobj = None
@@ -149,6 +233,8 @@ def unpack_if_json(field, data):
     In general if there is a field 'name' that is the data
     '''
     flatdata = data
+    if isinstance(data, basestring) and not RE_JSON_OBJECT_START.match(data):
+        return flatdata  # only a json object can have a 'name'
     j = getjobj(data)
     if j:
         try:
@@ -194,7 +280,41 @@ class UTCtz(datetime.tzinfo):
 UTC = UTCtz()
 
 
-def make_datetime(dstring):
+class LRUMemo(object):
+    '''Bounded, least recently used memo for a function whose first
+    argument is a hashable key. Any other arguments are only passed on to
+    the function on a miss. Counts hits & misses.
+    '''
+
+    def __init__(self, func, maxsize=DATE_MEMO_SIZE):
+        self.func = func
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, key, *args):
+        try:
+            value = self._cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            value = self.func(key, *args)
+            if len(self._cache) >= self.maxsize:
+                self._cache.popitem(last=False)
+        self._cache[key] = value
+        return value
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = self.misses = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+
+def _make_datetime(dstring):
     '''make a datetime from a valid date string
     Right now formats are YYYY or YYYY-MM-DD
     '''
@@ -225,6 +345,37 @@ def make_datetime(dstring):
     return dt
 
 
+def _parse_datetime(dstring):
+    '''Fast path for the common YYYY & YYYY-MM-DD date strings, falls
+    back to _make_datetime for anything else'''
+    match = RE_YYYY.match(dstring)
+    if match:
+        ymd = (int(dstring), 1, 1)
+    else:
+        match = RE_YYYY_MM_DD.match(dstring)
+        if not match:
+            return _make_datetime(dstring)
+        ymd = [int(g) for g in match.groups()]
+    try:
+        return datetime.datetime(ymd[0], ymd[1], ymd[2], tzinfo=UTC)
+    except ValueError:
+        return None
+
+
+def make_datetime(dstring):
+    '''make a datetime from a valid date string
+    Right now formats are YYYY or YYYY-MM-DD
+    Results for strings are memoized, the datetimes are shared so don't
+    modify them (datetimes are immutable anyway)
+    '''
+    if isinstance(dstring, basestring):
+        return MAKE_DATETIME_MEMO(dstring)
+    return _make_datetime(dstring)
+
+
+MAKE_DATETIME_MEMO = LRUMemo(_parse_datetime)
+
+
 def get_dates_from_date_obj(date_obj):
     '''Return list of display date, start dates, end dates'''
     if isinstance(date_obj, dict):
@@ -238,7 +389,7 @@ def get_dates_from_date_obj(date_obj):
         return None, None, None
 
 
-def unpack_date(date_obj):
+def _unpack_date(date_obj):
     '''Unpack a couchdb date object'''
     dates = []
     dates_start = []
@@ -268,6 +419,46 @@ def unpack_date(date_obj):
     return dates, dates_start, dates_end
 
 
+def _date_key(date_obj):
+    '''Hashable key for a couchdb date object, TypeError if it can't
+    be made hashable'''
+    if isinstance(date_obj, dict):
+        return ('dict', tuple(sorted(date_obj.items())))
+    if isinstance(date_obj, list):
+        return ('list', tuple(_date_key(d) for d in date_obj))
+    return ('value', date_obj)
+
+
+def _unpack_date_key(key):
+    '''unpack_date for a memo key, returns tuples'''
+    def thaw(key):
+        kind, value = key
+        if kind == 'dict':
+            return dict(value)
+        if kind == 'list':
+            return [thaw(k) for k in value]
+        return value
+    dates = _unpack_date(thaw(key))
+    return tuple(tuple(d) if d is not None else None for d in dates)
+
+
+UNPACK_DATE_MEMO = LRUMemo(_unpack_date_key)
+
+
+def unpack_date(date_obj):
+    '''Unpack a couchdb date object
+    Results are memoized on the content of the date object. The lists
+    returned are new for each call.
+    '''
+    try:
+        key = _date_key(date_obj)
+        hash(key)
+    except TypeError:  # has unhashable values
+        return _unpack_date(date_obj)
+    dates = UNPACK_DATE_MEMO(key)
+    return tuple(list(d) if d is not None else None for d in dates)
+
+
 def map_date(d):
     date_map = {}
     date_source = d.get('date', None)
@@ -482,7 +673,11 @@ class OldCollectionException(Exception):
     pass
 
 
-def map_registry_data(collections):
+class CollectionSyncError(Exception):
+    pass
+
+
+def _map_registry_data(collections):
     '''Map the collections data to corresponding data fields in the solr doc
     '''
     collection_urls = []
@@ -544,18 +739,86 @@ def map_registry_data(collections):
     return registry_dict
 
 
+
+def _registry_key(collection):
+    '''Hashable key of the registry collection data that
+    _map_registry_data uses, so that changed registry data gets a new key.
+    (unicode literals match the json keys without decoding)
+    '''
+    campuses = None
+    if u'campus' in collection:
+        campuses = tuple((campus[u'@id'], campus[u'name'])
+                         for campus in collection[u'campus'])
+    repositories = None
+    if u'repository' in collection:
+        repositories = tuple(
+            (repo[u'@id'], repo[u'name'],
+             repo[u'campus'][0][u'name']
+             if u'campus' in repo and len(repo[u'campus']) else None)
+            for repo in collection[u'repository'])
+    return (collection[u'@id'], collection[u'name'], campuses, repositories)
+
+
+def _map_registry_key(key, collections):
+    return _map_registry_data(collections)
+
+
+REGISTRY_MEMO = LRUMemo(_map_registry_key, maxsize=REGISTRY_MEMO_SIZE)
+
+
+def map_registry_data(collections):
+    '''Map the collections data to corresponding data fields in the solr doc
+    The mapped fields are memoized on the registry data of the collections,
+    every doc in a collection shares the same registry data. The lists in
+    the returned dictionary are new for each call.
+    '''
+    try:
+        key = tuple(_registry_key(c) for c in collections)
+    except (KeyError, IndexError, TypeError):
+        return _map_registry_data(collections)
+    registry_dict = REGISTRY_MEMO(key, collections)
+    return dict((k, list(v)) for k, v in registry_dict.items())
+
+
+def _facet_decades(date_string):
+    facet_decade_set = set()  # don't repeat values
+    for decade in facet_decade(date_string):
+        facet_decade_set.add(decade)
+    return frozenset(facet_decade_set)
+
+
+FACET_DECADES_MEMO = LRUMemo(_facet_decades)
+
+
 def get_facet_decades(date):
     '''Return set of decade string for given date structure.
     date is a dict with a "displayDate" key.
+    Results are memoized on the date string.
     '''
     if isinstance(date, dict):
-        facet_decades = facet_decade(date.get('displayDate', ''))
+        date_string = date.get('displayDate', '')
     else:
-        facet_decades = facet_decade(str(date))
-    facet_decade_set = set()  # don't repeat values
-    for decade in facet_decades:
-        facet_decade_set.add(decade)
-    return facet_decade_set
+        date_string = str(date)
+    if isinstance(date_string, basestring):
+        return set(FACET_DECADES_MEMO(date_string))
+    return set(_facet_decades(date_string))
+
+
+MAPPING_MEMOS = (('make_datetime', MAKE_DATETIME_MEMO),
+                 ('unpack_date', UNPACK_DATE_MEMO),
+                 ('facet_decades', FACET_DECADES_MEMO),
+                 ('registry_data', REGISTRY_MEMO))
+
+
+def memo_report():
+    '''Return a list of lines with the hit rates of the mapping memos, for
+    the memos used in this process'''
+    lines = []
+    for name, memo in MAPPING_MEMOS:
+        if memo.hits or memo.misses:
+            lines.append('Memo {} hit rate : {:.1%} ({}/{})'.format(
+                name, memo.hit_rate(), memo.hits, memo.hits + memo.misses))
+    return lines
 
 
 def normalize_sort_field(sort_field,
@@ -662,15 +925,29 @@ class MissingMediaJSON(ValueError):
     dict_key = 'Missing Media Json'
 
 
-def check_nuxeo_media(doc):
+def check_nuxeo_media(doc, media_cache=None):
     '''Check that the media_json and jp2000 exist for a given solr doc.
     Raise exception if not
+    If a MediaCheckCache is given, media that passed a check recently
+    (with the same media json ETag, when known) is not checked again.
     '''
     if 'structmap_url' not in doc:
         return
+    structmap_url = doc['structmap_url']
+    etag = None
+    if media_cache and isinstance(structmap_url, basestring):
+        listed, etag = media_cache.listed_etag(structmap_url)
+        if listed and etag is None:
+            message = '---- OMITTED: Doc:{} missing media json {}'.format(
+                doc['harvest_id_s'],
+                'not found in S3 listing')
+            print(message, file=sys.stderr)
+            raise MissingMediaJSON(message)
+        if media_cache.is_checked(structmap_url, etag):
+            return
     # check that there is an object at the structmap_url
     try:
-        MediaJson(doc['structmap_url']).check_media()
+        MediaJson(structmap_url).check_media()
     except ClientError as e:
         message = '---- OMITTED: Doc:{} missing media json {}'.format(
             doc['harvest_id_s'],
@@ -683,16 +960,19 @@ def check_nuxeo_media(doc):
             e)
         print(message, file=sys.stderr)
         raise MediaJSONError(message)
+    if media_cache and isinstance(structmap_url, basestring):
+        media_cache.set_checked(structmap_url, etag)
 
 
 def map_couch_to_solr_doc(doc):
     '''Return a json document suitable for updating the solr index
     how to make schema aware mapping?'''
     solr_doc = {}
-    for p in doc.keys():
-        if p in COUCHDOC_TO_SOLR_MAPPING:
+    for p in doc:
+        write = COUCHDOC_TO_SOLR_PLAN.get(p)
+        if write:
             try:
-                solr_doc.update(COUCHDOC_TO_SOLR_MAPPING[p](doc))
+                write(doc, solr_doc)
             except TypeError as e:
                 print(
                     'TypeError for doc {} on COUCHDOC_TO_SOLR_MAPPING {}'.
@@ -703,11 +983,11 @@ def map_couch_to_solr_doc(doc):
     reg_data_dict = map_registry_data(doc['originalRecord']['collection'])
     solr_doc.update(reg_data_dict)
     sourceResource = doc['sourceResource']
-    for p in sourceResource.keys():
-        if p in COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING:
+    for p in sourceResource:
+        write = COUCHDOC_SRC_RESOURCE_TO_SOLR_PLAN.get(p)
+        if write:
             try:
-                solr_doc.update(COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING[p](
-                    sourceResource))
+                write(sourceResource, solr_doc)
             except TypeError as e:
                 print(
                     'TypeError for doc {} on sourceResource {}'.format(
@@ -715,23 +995,23 @@ def map_couch_to_solr_doc(doc):
                     file=sys.stderr)
                 raise e
     originalRecord = doc['originalRecord']
-    for k in originalRecord.keys():
-        if k in COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING:
+    for k in originalRecord:
+        write = COUCHDOC_ORIGINAL_RECORD_TO_SOLR_PLAN.get(k)
+        if write:
             try:
-                solr_doc.update(COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING[k](originalRecord))
-
+                write(originalRecord, solr_doc)
             except TypeError as e:
                 print(
                     'TypeError for doc {} on originalRecord {}'.format(
                         doc['_id'], k),
                     file=sys.stderr)
                 raise e
-        if k == 'properties':
+        if k == u'properties':
             for p in originalRecord['properties']:
-                if p in COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING:
+                write = COUCHDOC_ORIGINAL_RECORD_TO_SOLR_PLAN.get(p)
+                if write:
                     try:
-                        solr_doc.update(COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING[p](
-                            originalRecord))
+                        write(originalRecord, solr_doc)
                     except TypeError as e:
                         print(
                             'TypeError for doc {} on originalRecord {}'.format(
@@ -745,6 +1025,101 @@ def map_couch_to_solr_doc(doc):
     return solr_doc
 
 
+def _hash_default(obj):
+    if isinstance(obj, set):
+        return sorted(obj)
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def solr_doc_hash(solr_doc):
+    '''Return an md5 hex digest of the content of a mapped solr doc.
+    Stored in the SOLR_HASH_FIELD so that incremental syncs can skip
+    docs that haven't changed.
+    '''
+    content = dict((k, v) for k, v in solr_doc.items()
+                   if k != SOLR_HASH_FIELD)
+    data = json.dumps(content, sort_keys=True, default=_hash_default)
+    return hashlib.md5(data).hexdigest()
+
+
+def check_and_map_couch_doc(doc):
+    '''Check a couch doc has the required fields & map it to a solr doc,
+    with the SOLR_HASH_FIELD set.
+    Returns a tuple of (solr_doc, rejected, error). If the couch doc was
+    rejected by the field checks, rejected is the KeyError or ValueError
+    with a dict_key for the report. If mapping failed, error is the
+    exception raised. Exceptions are returned, not raised, so that the
+    function can run in a process pool.
+    '''
+    try:
+        doc = fill_in_title(doc)
+        has_required_fields(doc)
+    except (KeyError, ValueError) as e:
+        return None, e, None
+    try:
+        solr_doc = map_couch_to_solr_doc(doc)
+        solr_doc[SOLR_HASH_FIELD] = solr_doc_hash(solr_doc)
+        return solr_doc, None, None
+    except Exception as e:
+        return None, None, e
+
+
+def _map_couch_chunk(docs):
+    return [check_and_map_couch_doc(doc) for doc in docs]
+
+
+def _map_in_pool(pool, docs, chunksize, max_chunks):
+    '''Map the docs in pool a chunk at a time, yielding the results in
+    order. pool.imap reads the whole docs iterable as fast as it can, here
+    only max_chunks chunks are read ahead of the results consumed.
+    '''
+    docs = iter(docs)
+    pending = deque()
+    while True:
+        while len(pending) < max_chunks:
+            chunk = list(islice(docs, chunksize))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_map_couch_chunk, (chunk, )))
+        if not pending:
+            return
+        for result in pending.popleft().get():
+            yield result
+
+
+def map_couch_docs(docs, workers=SOLR_MAP_WORKERS,
+                   chunksize=SOLR_MAP_CHUNKSIZE, pool=None):
+    '''Yield check_and_map_couch_doc results for an iterable of couch docs,
+    in order. With more than one worker, the docs are mapped in chunks by
+    a process pool while the caller consumes the results. At most
+    SOLR_MAP_CHUNKS_AHEAD chunks per worker are waiting to be consumed.
+    A pool that is passed in is used instead & left open for the caller to
+    reuse & close.
+    '''
+    max_chunks = max(workers, 1) * SOLR_MAP_CHUNKS_AHEAD
+    if pool is not None:
+        for result in _map_in_pool(pool, docs, chunksize, max_chunks):
+            yield result
+        return
+    if workers <= 1:
+        for doc in docs:
+            yield check_and_map_couch_doc(doc)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in _map_in_pool(pool, docs, chunksize, max_chunks):
+            yield result
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
 def push_doc_to_solr(solr_doc, solr_db):
     '''Push one couch doc to solr'''
     n = 1
@@ -766,6 +1141,95 @@ def push_doc_to_solr(solr_doc, solr_db):
     return n
 
 
+class SolrBatchWriter(object):
+    '''Buffer solr docs and add them to solr in batches with add_many.
+
+    If solr rejects a batch with a 400 the batch is split in half and each
+    half is retried, down to single docs, so that only the bad docs are
+    dropped and reported. num_added is the count of docs solr accepted.
+    '''
+
+    def __init__(self, solr_db, batch_size=SOLR_BATCH_SIZE):
+        self.solr_db = solr_db
+        self.batch_size = batch_size
+        self.num_added = 0
+        self._docs = []
+
+    def add(self, solr_doc):
+        '''Queue a doc, sending the batch if it is full.
+        Returns the number of docs added to solr by this call'''
+        self._docs.append(solr_doc)
+        if len(self._docs) >= self.batch_size:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        '''Send any buffered docs to solr.
+        Returns the number of docs added'''
+        docs = self._docs
+        self._docs = []
+        n = self._add_batch(docs) if docs else 0
+        self.num_added += n
+        return n
+
+    def _add_batch(self, docs):
+        if len(docs) == 1:
+            return push_doc_to_solr(docs[0], solr_db=self.solr_db)
+        try:
+            self.solr_db.add_many(docs)
+        except SolrException as e:
+            if not e.httpcode == 400:
+                raise e
+            mid = len(docs) // 2
+            return self._add_batch(docs[:mid]) + self._add_batch(docs[mid:])
+        for solr_doc in docs:
+            print(
+                "++++ ADDED: {} :harvest_id_s {}".format(
+                    solr_doc['id'], solr_doc['harvest_id_s']),
+                file=sys.stderr)
+        return len(docs)
+
+
+def solr_quote(value):
+    '''Quote a value as a solr phrase'''
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def delete_solr_docs_for_couch_ids(solr_db, couch_ids,
+                                   batch_size=SOLR_DELETE_BATCH_SIZE):
+    '''Delete the solr docs for deleted couch docs.
+    The solr docs are looked up by harvest_id_s batch_size couch ids at a
+    time with one OR query, and each batch that is found is removed with
+    one delete request. As before, a couch id is only deleted from solr if
+    exactly one solr doc has it as harvest_id_s.
+    Returns the number of solr docs deleted.
+    '''
+    n_delete = 0
+    for i in range(0, len(couch_ids), batch_size):
+        batch = couch_ids[i:i + batch_size]
+        q = 'harvest_id_s:({})'.format(
+            ' OR '.join(solr_quote(cid) for cid in batch))
+        resp = solr_db.select(q=q, fields='id,harvest_id_s', rows=len(batch))
+        if resp.numFound > len(resp.results):
+            resp = solr_db.select(
+                q=q, fields='id,harvest_id_s', rows=resp.numFound)
+        found = defaultdict(list)
+        for sdoc in resp.results:
+            found[sdoc['harvest_id_s']].append(sdoc['id'])
+        solr_ids = []
+        for cid in batch:
+            if len(found[cid]) == 1:
+                print('====DELETING: {0} -- {1}'.format(cid, found[cid][0]))
+                solr_ids.append(found[cid][0])
+            else:
+                print("-----DELETION of {} - FOUND {} docs".format(
+                    cid, len(found[cid])))
+        if solr_ids:
+            solr_db.delete(ids=solr_ids)
+            n_delete += len(solr_ids)
+    return n_delete
+
+
 def get_key_for_env():
     '''Get key based on DATA_BRANCH env var'''
     if 'DATA_BRANCH' not in os.environ:
@@ -791,10 +1255,54 @@ class CouchdbLastSeq_S3(object):
         self.s3object.put(Body=str(value))
 
 
+def changes_chunks(db, since, chunk_size=CHANGES_CHUNK_SIZE):
+    '''Page through the couchdb _changes feed after since, with the docs
+    included in the rows. Yields (results, last_seq) for each chunk of at
+    most chunk_size rows; last_seq is the seq to resume from after the
+    chunk.
+    '''
+    while True:
+        changes = db.changes(
+            since=since, limit=chunk_size, include_docs='true')
+        results = changes['results']
+        since = int(changes['last_seq'])
+        if not results:
+            return
+        yield results, since
+        if len(results) < chunk_size:
+            return
+
+
+def get_solr_collection_hashes(solr_db, collection_key,
+                               page_size=SOLR_ID_PAGE_SIZE):
+    '''Return a dictionary of solr id to content hash for the docs in solr
+    for the collection. The hash is None for docs indexed without one.
+    The docs are paged through with a cursorMark, a start offset gets
+    slower with each page of a large collection.
+    '''
+    q = 'collection_url:{}'.format(
+        solr_quote(COLLECTION_URL_FORMAT.format(collection_key)))
+    hashes = {}
+    cursor = '*'
+    while True:
+        resp = solr_db.select(
+            q=q,
+            fields='id,{}'.format(SOLR_HASH_FIELD),
+            sort='id asc',
+            rows=page_size,
+            cursorMark=cursor)
+        for sdoc in resp.results:
+            hashes[sdoc['id']] = sdoc.get(SOLR_HASH_FIELD)
+        # the cursor stays the same once all the docs are read
+        next_cursor = getattr(resp, 'nextCursorMark', cursor)
+        if next_cursor == cursor:
+            return hashes
+        cursor = next_cursor
+
+
 def delete_solr_collection(collection_key):
     '''Delete a solr  collection for the environment'''
     url_solr = os.environ['URL_SOLR']
-    COLLECTION_URL_FORMAT = 'https://registry.cdlib.org/api/v1/collection/{}/'
     collection_url = COLLECTION_URL_FORMAT.format(collection_key)
     query = 'stream.body=<delete><query>collection_url:\"{}\"</query>' \
             '</delete>&commit=true'.format(collection_url)
@@ -807,71 +1315,243 @@ def delete_solr_collection(collection_key):
                           'DELETED {}'.format(collection_key))
 
 
-def harvesting_report(collection_key, updated_docs, num_added, report):
-    '''Make the nice report for the harvesting channel'''
+def harvesting_report(collection_key, updated_docs, num_added, report,
+                      memo_report=None, failures=None):
+    '''Make the nice report for the harvesting channel.
+    collection_key can be a list of the keys for a multi-collection sync &
+    updated_docs either the list of couch docs synced or their number.
+    failures is a dictionary of collection key to error for the
+    collections that failed to sync.
+    '''
     report_list = [' : '.join((key, str(val))) for key, val in report.items()]
+    if memo_report:
+        report_list.extend(memo_report)
+    if failures:
+        report_list.extend('FAILED {} : {}'.format(key, err)
+                           for key, err in failures.items())
     report_msg = '\n'.join(report_list)
-    msg = ''.join(('Synced collection {} to solr.\n'.format(collection_key),
-                   '{} Couch Docs.\n'.format(len(updated_docs)),
+    if isinstance(collection_key, list):
+        synced = '{} collections'.format(len(collection_key))
+    else:
+        synced = 'collection {}'.format(collection_key)
+    if not isinstance(updated_docs, (int, long)):
+        updated_docs = len(updated_docs)
+    msg = ''.join(('Synced {} to solr.\n'.format(synced),
+                   '{} Couch Docs.\n'.format(updated_docs),
                    '{} solr documents updated\n'.format(num_added),
                    report_msg))
     return msg
 
 
-def sync_couch_collection_to_solr(collection_key):
-    # This works from inside an environment with default URLs for couch & solr
-    delete_solr_collection(collection_key)
-    URL_SOLR = os.environ.get('URL_SOLR', None)
-    collection_key = str(collection_key)  # Couch need string keys
+def sync_collection(collection_key, solr_db,
+                    batch_size=SOLR_BATCH_SIZE,
+                    map_workers=SOLR_MAP_WORKERS,
+                    incremental=False):
+    '''Add the couchdb docs for a collection to solr_db & commit, see
+    sync_couch_collection_to_solr.
+    Returns the number of synced solr docs, the number added & the report.
+    '''
+    if incremental:
+        solr_hashes = get_solr_collection_hashes(solr_db, collection_key)
+    else:
+        delete_solr_collection(collection_key)
     v = CouchDBCollectionFilter(
         couchdb_obj=get_couchdb(), collection_key=collection_key)
-    solr_db = Solr(URL_SOLR)
-    updated_docs = []
-    num_added = 0
+    solr_writer = SolrBatchWriter(solr_db, batch_size=batch_size)
+    media_cache = MediaCheckCache(prefetch=True)
+    n_docs = 0
     report = defaultdict(int)
-    for r in v:
-        try:
-            fill_in_title(r.doc)
-            has_required_fields(r.doc)
-        except KeyError as e:
-            report[e.dict_key] += 1
-            print(e.message, file=sys.stderr)
-            continue
-        except ValueError as e:
-            report[e.dict_key] += 1
-            print(e.message, file=sys.stderr)
+    docs = (r.doc for r in v)
+    mapped = map_couch_docs(docs, workers=map_workers)
+    for solr_doc, rejected, error in mapped:
+        if rejected:
+            report[rejected.dict_key] += 1
+            print(rejected.message, file=sys.stderr)
             continue
-        solr_doc = map_couch_to_solr_doc(r.doc)
-        # TODO: here is where to check if existing and compare collection vals
+        if error:
+            raise error
         try:
-            check_nuxeo_media(solr_doc)
+            check_nuxeo_media(solr_doc, media_cache=media_cache)
         except ValueError as e:
             print(e.message, file=sys.stderr)
             report[e.dict_key] += 1
             continue
-        updated_docs.append(solr_doc)
-        num_added += push_doc_to_solr(solr_doc, solr_db=solr_db)
+        n_docs += 1
+        if incremental:
+            solr_hash = solr_hashes.pop(solr_doc['id'], None)
+            if solr_hash == solr_doc[SOLR_HASH_FIELD]:
+                report['Unchanged in solr'] += 1
+                continue
+        solr_writer.add(solr_doc)
+    solr_writer.flush()
+    print('Media check cache hits:{} misses:{}'.format(
+        media_cache.hits, media_cache.misses), file=sys.stderr)
+    if incremental and solr_hashes:
+        # left over solr docs are no longer in the collection
+        solr_ids = sorted(solr_hashes)
+        for i in range(0, len(solr_ids), SOLR_DELETE_BATCH_SIZE):
+            solr_db.delete(ids=solr_ids[i:i + SOLR_DELETE_BATCH_SIZE])
+        report['Deleted from solr'] += len(solr_ids)
     solr_db.commit()
+    return n_docs, solr_writer.num_added, report
+
+
+def sync_couch_collection_to_solr(collection_key,
+                                  batch_size=SOLR_BATCH_SIZE,
+                                  map_workers=SOLR_MAP_WORKERS,
+                                  incremental=False):
+    '''Sync the couchdb docs for a collection to solr.
+    By default the collection is deleted from solr and all of its docs
+    re-added. With incremental, the existing solr ids & content hashes for
+    the collection are fetched first; only new or changed docs are added
+    and solr docs no longer in the collection are deleted, so the
+    collection stays in the index during the sync.
+    Returns the number of couch docs synced & the report.
+    '''
+    # This works from inside an environment with default URLs for couch & solr
+    URL_SOLR = os.environ.get('URL_SOLR', None)
+    collection_key = str(collection_key)  # Couch need string keys
+    solr_db = Solr(URL_SOLR)
+    n_docs, num_added, report = sync_collection(
+        collection_key,
+        solr_db,
+        batch_size=batch_size,
+        map_workers=map_workers,
+        incremental=incremental)
     publish_to_harvesting(
         'Synced collection {} to solr'.format(collection_key),
         harvesting_report(
             collection_key,
-            updated_docs,
+            n_docs,
             num_added,
-            report))
-    return updated_docs, report
+            report,
+            memo_report=memo_report()))
+    return n_docs, report
+
+
+def get_collections_ready_for_publication(registry=None):
+    '''Return the keys of the registry collections that are ready for
+    publication'''
+    if registry is None:
+        registry = Registry()
+    return [c.id for c in registry.resource_iter('collection')
+            if c['ready_for_publication']]
+
+
+def _sync_collection_task(task):
+    '''Sync one collection for sync_collections_to_solr, in a worker.
+    Only the counts & report go back to the parent, not the solr docs.
+    '''
+    collection_key, batch_size = task
+    try:
+        solr_db = Solr(os.environ.get('URL_SOLR', None))
+        n_docs, num_added, report = sync_collection(
+            collection_key,
+            solr_db,
+            batch_size=batch_size,
+            map_workers=1,
+            incremental=True)
+    except Exception as e:
+        return collection_key, 0, 0, {}, '{}: {}'.format(
+            type(e).__name__, e)
+    return collection_key, n_docs, num_added, dict(report), None
+
+
+def sync_collections_to_solr(collection_keys=None,
+                             workers=None,
+                             batch_size=SOLR_BATCH_SIZE):
+    '''Sync a number of collections to solr in parallel.
+    collection_keys is a list of collection keys or a ";" separated string
+    of them. If not given, all registry collections that are ready for
+    publication are synced.
+    The collections are handed out one at a time to a pool of worker
+    processes, by default one per CPU up to SOLR_SYNC_WORKERS. A failed
+    collection is reported & the rest of the sync carries on.
+    The collections are synced incrementally & each is committed once it
+    is complete, so a collection is never deleted from the index during
+    the sync. A failed collection is left with its old docs & possibly
+    some of the changed ones, nothing of it is deleted.
+    A single consolidated report is published to the harvesting channel.
+    If any collection failed, CollectionSyncError is raised after the
+    report.
+    Returns the number of couch docs synced, the number of solr docs
+    added & the combined report.
+    '''
+    if collection_keys is None:
+        collection_keys = get_collections_ready_for_publication()
+    elif isinstance(collection_keys, basestring):
+        collection_keys = collection_keys.split(';')
+    collection_keys = [str(k) for k in collection_keys if k]
+    if not collection_keys:
+        return 0, 0, {}
+    if not workers:
+        workers = min(multiprocessing.cpu_count(), SOLR_SYNC_WORKERS)
+    workers = min(workers, len(collection_keys))
+    print('Syncing {} collections to solr with {} workers'.format(
+        len(collection_keys), workers), file=sys.stderr)
+    tasks = [(k, batch_size) for k in collection_keys]
+    n_docs = num_added = 0
+    report = defaultdict(int)
+    failed = OrderedDict()
+    pool = multiprocessing.Pool(workers)
+    try:
+        for collection_key, n_coll_docs, n_coll_added, coll_report, error \
+                in pool.imap_unordered(_sync_collection_task, tasks):
+            if error:
+                print('Sync of collection {} failed: {}'.format(
+                    collection_key, error), file=sys.stderr)
+                failed[collection_key] = error
+                continue
+            print('Synced collection {}: {} couch docs, {} added'.format(
+                collection_key, n_coll_docs, n_coll_added), file=sys.stderr)
+            n_docs += n_coll_docs
+            num_added += n_coll_added
+            for key, val in coll_report.items():
+                report[key] += val
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    report['Collections synced'] = len(collection_keys) - len(failed)
+    if failed:
+        report['Collections failed'] = len(failed)
+        msg = 'Sync of {} collections failed, re-run them to finish ' \
+              'their sync'.format(len(failed))
+        print(msg, file=sys.stderr)
+        publish_to_harvesting(
+            'FAILED sync of {} collections to solr'.format(
+                len(collection_keys)),
+            harvesting_report(
+                collection_keys, n_docs, num_added, report,
+                failures=failed))
+        raise CollectionSyncError(msg)
+    publish_to_harvesting(
+        'Synced {} collections to solr'.format(len(collection_keys)),
+        harvesting_report(collection_keys, n_docs, num_added, report))
+    return n_docs, num_added, report
 
 
 def main(url_couchdb=None,
          dbname=None,
          url_solr=None,
          all_docs=False,
-         since=None):
+         since=None,
+         batch_size=SOLR_BATCH_SIZE,
+         map_workers=SOLR_MAP_WORKERS,
+         chunk_size=CHANGES_CHUNK_SIZE):
     '''Use the _changes feed with a "since" parameter to only catch new
     changes to docs. The _changes feed will only have the *last* event on
     a document and does not retain intermediate changes.
     Setting the "since" to 0 will result in getting a _changes record for
     each document, essentially dumping the db to solr
+    The feed is read in chunks of chunk_size rows, with the docs included.
+    After each chunk is committed to solr the last seq in S3 is advanced,
+    so a failed run picks up from the last completed chunk.
+    With map_workers > 1 the couch docs are mapped to solr docs in a
+    process pool while the docs are read from couch & added to solr. The
+    pool is started once & used for every chunk.
     '''
     print('Solr update PID: {}'.format(os.getpid()))
     dt_start = datetime.datetime.now()
@@ -887,65 +1567,77 @@ def main(url_couchdb=None,
     print('Getting changes since:{}'.format(since))
     sys.stdout.flush()  # put pd
     db = get_couchdb(url=url_couchdb, dbname=dbname)
-    changes = db.changes(since=since)
-    previous_since = since
-    last_since = int(
-        changes['last_seq'])  # get new last_since for changes feed
-    results = changes['results']
+    previous_since = last_since = since
     n_up = n_design = n_delete = 0
     solr_db = Solr(url_solr)
+    solr_writer = SolrBatchWriter(solr_db, batch_size=batch_size)
+    media_cache = MediaCheckCache()
     start_time = datetime.datetime.now()
-    for row in results:
-        cur_id = row['id']
-        if '_design' in cur_id:
-            n_design += 1
-            print("Skip {0}".format(cur_id))
-            continue
-        if row.get('deleted', False):
-            # need to get the solr doc for this couch
-            resp = solr_db.select(q=''.join(('harvest_id_s:"', cur_id, '"')))
-            if resp.numFound == 1:
-                sdoc = resp.results[0]
-                print('====DELETING: {0} -- {1}'.format(cur_id, sdoc['id']))
-                solr_db.delete(id=sdoc['id'])
-                n_delete += 1
-            else:
-                print("-----DELETION of {} - FOUND {} docs".format(
-                    cur_id, resp.numFound))
-        else:
-            doc = db.get(cur_id)
-            try:
-                doc = fill_in_title(doc)
-                has_required_fields(doc)
-            except KeyError as e:
-                print(e.message)
-                continue
-            except ValueError as e:
-                print(e.message)
-                continue
-            try:
-                try:
-                    solr_doc = map_couch_to_solr_doc(doc)
-                except OldCollectionException:
+    # one mapping pool for all the chunks, so its workers keep their memos
+    pool = multiprocessing.Pool(map_workers) if map_workers > 1 else None
+    try:
+        for results, last_since in changes_chunks(db, since, chunk_size):
+            update_rows = []
+            deleted_ids = []
+            for row in results:
+                cur_id = row['id']
+                if '_design' in cur_id:
+                    n_design += 1
+                    print("Skip {0}".format(cur_id))
+                    continue
+                if row.get('deleted', False):
+                    deleted_ids.append(cur_id)
+                    n_up += 1
+                else:
+                    update_rows.append(row)
+            # need to get the solr docs for the deleted couch docs
+            n_delete += delete_solr_docs_for_couch_ids(solr_db, deleted_ids)
+            docs = (row['doc'] for row in update_rows)
+            mapped = map_couch_docs(docs, workers=map_workers,
+                                    pool=pool)
+            for row, (solr_doc, rejected, error) in izip(update_rows, mapped):
+                cur_id = row['id']
+                if rejected:
+                    print(rejected.message)
+                    continue
+                if isinstance(error, OldCollectionException):
                     print('---- ERROR: OLD COLLECTION FOR:{}'.format(cur_id))
                     continue
+                if isinstance(error, TypeError):
+                    print('TypeError for {0} : {1}'.format(cur_id, error))
+                    continue
+                if error:
+                    raise error
                 try:
-                    check_nuxeo_media(solr_doc)
+                    check_nuxeo_media(solr_doc, media_cache=media_cache)
                 except ValueError as e:
                     print(e.message)
                     continue
-                solr_doc = push_doc_to_solr(solr_doc, solr_db=solr_db)
-            except TypeError as e:
-                print('TypeError for {0} : {1}'.format(cur_id, e))
-                continue
-        n_up += 1
-        if n_up % 1000 == 0:
-            elapsed_time = datetime.datetime.now() - start_time
-            print("Updated {} so far in {}".format(n_up, elapsed_time))
-    solr_db.commit()
-    if not all_docs:
-        s3_seq_cache.last_seq = last_since
+                solr_writer.add(solr_doc)
+                n_up += 1
+                if n_up % 1000 == 0:
+                    elapsed_time = datetime.datetime.now() - start_time
+                    print("Updated {} so far in {}".format(n_up, elapsed_time))
+            # the chunk is in solr, checkpoint so a failed run can resume here
+            solr_writer.flush()
+            solr_db.commit()
+            if not all_docs:
+                s3_seq_cache.last_seq = last_since
+            print("CHECKPOINT SINCE:{0}".format(last_since))
+            sys.stdout.flush()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    else:
+        if pool:
+            pool.close()
+    finally:
+        if pool:
+            pool.join()
     print("UPDATED {0} DOCUMENTS. DELETED:{1}".format(n_up, n_delete))
+    for line in memo_report():
+        print(line)
     print("PREVIOUS SINCE:{0}".format(previous_since))
     print("LAST SINCE:{0}".format(last_since))
     run_time = datetime.datetime.now() - dt_start
@@ -967,6 +1659,21 @@ if __name__ == '__main__':
         action='store_true',
         help=''.join(('Harvest all couchdb docs. Safest bet. ',
                       'Will not set last sequence in s3')))
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=SOLR_BATCH_SIZE,
+        help='Number of docs to send to solr in each add request')
+    parser.add_argument(
+        '--map_workers',
+        type=int,
+        default=SOLR_MAP_WORKERS,
+        help='Number of processes mapping couch docs to solr docs')
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=CHANGES_CHUNK_SIZE,
+        help='Number of couchdb changes to sync between checkpoints')
 
     args = parser.parse_args()
     print('Warning: this may take some time')
@@ -975,4 +1682,7 @@ if __name__ == '__main__':
         dbname=args.dbname,
         url_solr=args.url_solr,
         all_docs=args.all_docs,
-        since=args.since)
+        since=args.since,
+        batch_size=args.batch_size,
+        map_workers=args.map_workers,
+        chunk_size=args.chunk_size)
@@ -0,0 +1,172 @@
+#! /bin/env python
+# -*- coding: utf-8 -*-
+'''Micro-benchmark the couch to solr doc mapping.
+
+Times map_couch_to_solr_doc, which runs the compiled mapping plans,
+against map_couch_to_solr_doc_by_update below, which walks the same
+mapping tables key by key & merges a dictionary per entry into the solr
+doc, as map_couch_to_solr_doc used to. It checks both give the same solr
+docs and prints docs/second for each.
+
+This is not a comparison with the old solr_updater code. Both paths use
+the current DataField tables & field functions, and the LRU memos for
+dates & registry data. So the speedup measured is only that of the
+compiled plans over the per entry updates. The memos are cleared before
+each timed run, so neither run uses a cache warmed by the other.
+
+The corpus is a list of couch docs, or a couchdb view response with
+"rows", in one or more JSON files. Defaults to the test fixtures.
+'''
+from __future__ import print_function
+import sys
+import glob
+import json
+import copy
+import time
+import argparse
+from harvester import solr_updater
+from harvester.solr_updater import map_couch_to_solr_doc, DataField
+from harvester.solr_updater import dict_for_data_to_fields
+from harvester.solr_updater import COUCHDOC_TO_SOLR_MAPPING
+from harvester.solr_updater import COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING
+from harvester.solr_updater import COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING
+
+FIXTURES = 'test/fixtures/*couchdb*.json'
+
+
+def table_update(mapping, key, data, solr_doc):
+    '''Update the solr doc from the mapping entry for key, de-jsoning the
+    source field for each destination field as the lambdas used to'''
+    mapping_func = mapping[key]
+    if isinstance(mapping_func, DataField):
+        if mapping_func.data_key:
+            data = data[mapping_func.data_key]
+        solr_doc.update(dict_for_data_to_fields(
+            mapping_func.field_src, data, mapping_func.field_dests))
+    else:
+        solr_doc.update(mapping_func(data))
+
+
+def map_couch_to_solr_doc_by_update(doc):
+    '''The mapping loop as it was before the mapping plans, over the
+    current mapping tables'''
+    solr_doc = {}
+    for p in doc.keys():
+        if p in COUCHDOC_TO_SOLR_MAPPING:
+            table_update(COUCHDOC_TO_SOLR_MAPPING, p, doc, solr_doc)
+    solr_doc.update(solr_updater.map_registry_data(
+        doc['originalRecord']['collection']))
+    sourceResource = doc['sourceResource']
+    for p in sourceResource.keys():
+        if p in COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING:
+            table_update(COUCHDOC_SRC_RESOURCE_TO_SOLR_MAPPING, p,
+                         sourceResource, solr_doc)
+    originalRecord = doc['originalRecord']
+    for k in originalRecord.keys():
+        if k in COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING:
+            table_update(COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING, k,
+                         originalRecord, solr_doc)
+        if k == 'properties':
+            for p in originalRecord['properties']:
+                if p in COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING:
+                    table_update(COUCHDOC_ORIGINAL_RECORD_TO_SOLR_MAPPING, p,
+                                 originalRecord, solr_doc)
+    solr_updater.normalize_type(solr_doc)
+    solr_updater.add_sort_title(doc, solr_doc)
+    solr_updater.add_facet_decade(doc, solr_doc)
+    solr_doc['id'] = solr_updater.get_solr_id(doc)
+    return solr_doc
+
+
+def load_corpus(paths):
+    '''Return the couch docs in the JSON files that map without error'''
+    docs = []
+    for path in paths:
+        try:
+            data = json.load(open(path))
+        except ValueError:
+            continue
+        if isinstance(data, dict) and 'rows' in data:
+            data = [row.get('doc', row.get('value')) for row in data['rows']]
+        elif isinstance(data, dict):
+            data = [data]
+        for doc in data:
+            try:
+                map_couch_to_solr_doc(copy.deepcopy(doc))
+            except Exception:
+                continue
+            docs.append(doc)
+    return docs
+
+
+def clear_memos():
+    for memo in (solr_updater.MAKE_DATETIME_MEMO,
+                 solr_updater.UNPACK_DATE_MEMO, solr_updater.REGISTRY_MEMO):
+        memo.clear()
+
+
+def docs_per_second(mapper, docs, repeat):
+    # mapping modifies the doc (add_sort_title etc.), so map copies
+    corpus = [copy.deepcopy(doc) for doc in docs for n in range(repeat)]
+    clear_memos()
+    time_start = time.time()
+    for doc in corpus:
+        mapper(doc)
+    return len(corpus) / (time.time() - time_start)
+
+
+def main(paths, repeat=1000):
+    docs = load_corpus(paths)
+    if not docs:
+        print('No couch docs found in {}'.format(paths), file=sys.stderr)
+        return 1
+    for doc in docs:
+        if map_couch_to_solr_doc(copy.deepcopy(doc)) != \
+                map_couch_to_solr_doc_by_update(copy.deepcopy(doc)):
+            print('Mappings differ for {}'.format(doc['_id']),
+                  file=sys.stderr)
+            return 1
+    before = docs_per_second(map_couch_to_solr_doc_by_update, docs, repeat)
+    after = docs_per_second(map_couch_to_solr_doc, docs, repeat)
+    print('{} couch docs x {}'.format(len(docs), repeat))
+    print('update per mapping entry: {:.0f} docs/sec'.format(before))
+    print('compiled mapping plan:    {:.0f} docs/sec'.format(after))
+    print('speedup: {:.2f}x'.format(after / before))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark mapping couch docs to solr docs')
+    parser.add_argument(
+        'paths', nargs='*', help='JSON files of couch docs. Default: {}'
+        .format(FIXTURES))
+    parser.add_argument(
+        '--repeat', type=int, default=1000,
+        help='Number of times to map each doc')
+    args = parser.parse_args()
+    sys.exit(main(args.paths or glob.glob(FIXTURES), repeat=args.repeat))
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import harvester.image_harvest
-harvester.image_harvest.link_is_to_image = lambda x,y: True
 from harvester.image_harvest import ImageHarvester
 from harvester.image_harvest import COUCHDB_VIEW, BUCKET_BASES
 
@@ -23,6 +21,7 @@ class ImageHarvesterOPLPreservica(ImageHarvester):
                  bucket_bases=bucket_bases,
                  object_auth=object_auth,
                  get_if_object=get_if_object,
+                 ignore_content_type=True,
                  url_cache=url_cache,
                  hash_cache=hash_cache,
                  harvested_object_cache=harvested_object_cache)
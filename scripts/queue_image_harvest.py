@@ -52,6 +52,13 @@ def def_args():
         help='Should image harvester not check content type in URL '
         'header if false or missing (default: False, always check)'
     )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help='Restart from the checkpoint of an unfinished image harvest '
+        'of the collection'
+    )
     return parser
 
 
@@ -65,6 +72,7 @@ def queue_image_harvest(redis_host,
                         object_auth=None,
                         get_if_object=False,
                         ignore_content_type=False,
+                        resume=False,
                         harvest_timeout=IMAGE_HARVEST_TIMEOUT):
     rQ = Queue(
         rq_queue,
@@ -80,7 +88,8 @@ def queue_image_harvest(redis_host,
             url_couchdb=url_couchdb,
             object_auth=object_auth,
             get_if_object=get_if_object,
-            ignore_content_type=ignore_content_type),
+            ignore_content_type=ignore_content_type,
+            resume=resume),
         timeout=harvest_timeout)
     return job
 
@@ -145,6 +154,8 @@ if __name__ == '__main__':
         kwargs['get_if_object'] = args.get_if_object
     if args.ignore_content_type:
         kwargs['ignore_content_type'] = args.ignore_content_type
+    if args.resume:
+        kwargs['resume'] = True
     main(
         args.user_email,
         args.url_api_collection,
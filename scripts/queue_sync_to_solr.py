@@ -17,6 +17,11 @@ def def_args():
         'collection_key',
         type=str,
         help='URL for the collection Django tastypie api resource')
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only add changed docs & delete removed docs, '
+        'instead of deleting & re-adding the collection')
     return parser
 
 
@@ -26,6 +31,7 @@ def queue_sync_to_solr(redis_host,
                        redis_timeout,
                        rq_queue,
                        collection_key,
+                       incremental=False,
                        timeout=JOB_TIMEOUT):
     rQ = Queue(
         rq_queue,
@@ -37,7 +43,8 @@ def queue_sync_to_solr(redis_host,
     job = rQ.enqueue_call(
         func='harvester.solr_updater.sync_couch_collection_to_solr',
         kwargs=dict(
-            collection_key=collection_key),
+            collection_key=collection_key,
+            incremental=incremental),
             timeout=timeout)
     return job
 
@@ -73,6 +80,8 @@ if __name__ == '__main__':
         parser.print_help()
         sys.exit(27)
     kwargs = {}
+    if args.incremental:
+        kwargs['incremental'] = True
     main(args.collection_key, rq_queue=args.rq_queue, **kwargs)
 
 # Copyright © 2016, Regents of the University of California
@@ -0,0 +1,65 @@
+#! /bin/env python
+# -*- coding: utf-8 -*-
+'''Sync a set of collections to solr in parallel. Only changed docs are
+added & removed docs deleted, each collection is committed when complete.
+Run from inside an environment with default URLs for couch & solr.
+'''
+import sys
+import argparse
+from harvester.solr_updater import sync_collections_to_solr
+from harvester.solr_updater import SOLR_BATCH_SIZE
+
+
+def def_args():
+    parser = argparse.ArgumentParser(
+        description='Sync collections to solr in parallel')
+    parser.add_argument(
+        'collection_keys',
+        nargs='?',
+        help='";" separated collection keys. Defaults to all collections '
+        'ready for publication in the registry')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Number of collections to sync at once. Defaults to the '
+        'number of CPUs, up to SOLR_SYNC_WORKERS')
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=SOLR_BATCH_SIZE,
+        help='Number of docs to send to solr in each add request')
+    return parser
+
+
+if __name__ == '__main__':
+    args = def_args().parse_args(sys.argv[1:])
+    n_docs, num_added, report = sync_collections_to_solr(
+        args.collection_keys,
+        workers=args.workers,
+        batch_size=args.batch_size)
+    print 'Synced {} couch docs, {} solr docs updated'.format(
+        n_docs, num_added)
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -5,7 +5,7 @@ import os
 from solr import Solr
 from harvester.post_processing.couchdb_runner import CouchDBCollectionFilter
 from harvester.couchdb_init import get_couchdb
-from harvester.solr_updater import map_couch_to_solr_doc, push_doc_to_solr
+from harvester.solr_updater import map_couch_to_solr_doc, SolrBatchWriter
 from harvester.solr_updater import has_required_fields, fill_in_title
 
 # This works from inside an environment with default URLs for couch & solr
@@ -16,6 +16,7 @@ def main(collection_key):
     v = CouchDBCollectionFilter(
         couchdb_obj=get_couchdb(), collection_key=collection_key)
     solr_db = Solr(URL_SOLR)
+    solr_writer = SolrBatchWriter(solr_db)
     results = []
     for r in v:
         dt_start = dt_end = datetime.datetime.now()
@@ -27,8 +28,9 @@ def main(collection_key):
             continue
         solr_doc = map_couch_to_solr_doc(r.doc)
         results.append(solr_doc)
-        solr_doc = push_doc_to_solr(solr_doc, solr_db=solr_db)
+        solr_writer.add(solr_doc)
         dt_end = datetime.datetime.now()
+    solr_writer.flush()
     solr_db.commit()
     return results
 
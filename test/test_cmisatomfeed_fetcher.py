@@ -17,8 +17,10 @@ class CMISAtomFeedFetcherTestCase(LogOverrideMixin, TestCase):
         h = fetcher.CMISAtomFeedFetcher(
                 'http://cmis-atom-endpoint/descendants',
                 'uname, pswd')
-        self.assertTrue(hasattr(h, 'objects'))
-        self.assertEqual(42, len(h.objects))
+        self.assertTrue(hasattr(h, 'objects_iter'))
+        obj = h.next()
+        self.assertIn('{http://www.w3.org/2005/Atom}entry', obj)
+        self.assertEqual(41, len([o for o in h]))
 
     @httpretty.activate
     def testFetching(self):
@@ -34,6 +36,28 @@ class CMISAtomFeedFetcherTestCase(LogOverrideMixin, TestCase):
             num_fetched += 1
         self.assertEqual(num_fetched, 42)
 
+    @httpretty.activate
+    def testFetchingNextPage(self):
+        '''Test that the next link for a paged feed is followed'''
+        feed = open(DIR_FIXTURES+'/cmis-atom-descendants.xml').read()
+        feed_page_1 = feed.replace(
+            '<atom:link rel="service"',
+            '<atom:link rel="next" href="http://cmis-atom-endpoint/'
+            'descendants?skipCount=42"/>\n  <atom:link rel="service"', 1)
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://cmis-atom-endpoint/descendants',
+            responses=[
+                httpretty.Response(body=feed_page_1, status=200),
+                httpretty.Response(body=feed, status=200),
+            ])
+        h = fetcher.CMISAtomFeedFetcher(
+                'http://cmis-atom-endpoint/descendants',
+                'uname, pswd')
+        self.assertEqual(84, len([o for o in h]))
+        self.assertEqual(httpretty.last_request().querystring,
+                         {'skipCount': ['42']})
+
 
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
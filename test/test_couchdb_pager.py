@@ -0,0 +1,45 @@
+import json
+from unittest import TestCase
+from mock import MagicMock
+from harvester.couchdb_pager import couchdb_pager
+
+
+class CouchdbPagerTestCase(TestCase):
+    '''Test the paging through a couchdb view'''
+
+    def setUp(self):
+        self.all_rows = [MagicMock(id='doc-{}'.format(i),
+                                   key='doc-{}'.format(i))
+                         for i in range(7)]
+        self.calls = []
+
+        def view(view_name, **options):
+            self.calls.append(dict(options))
+            rows = self.all_rows
+            if 'start_key' in options:
+                start = json.loads(options['start_key'])
+                rows = [r for r in rows if r.key >= start]
+            rows = rows[:options['limit']]
+            return MagicMock(rows=rows, __len__=lambda s: len(rows))
+        self.db = MagicMock()
+        self.db.view.side_effect = view
+
+    def testPages(self):
+        '''Each page starts at the extra row of the page before'''
+        rows = list(couchdb_pager(self.db, bulk=3, include_docs='true'))
+        self.assertEqual([r.id for r in rows],
+                         [r.id for r in self.all_rows])
+        self.assertEqual(len(self.calls), 3)
+        self.assertNotIn('start_key', self.calls[0])
+        self.assertEqual(self.calls[1]['start_key'], '"doc-3"')
+        self.assertEqual(self.calls[1]['startkey_docid'], 'doc-3')
+        self.assertEqual(self.calls[2]['start_key'], '"doc-6"')
+        self.assertEqual(self.calls[2]['include_docs'], 'true')
+
+    def testPagesFromStartkey(self):
+        '''A listing that starts at a key moves on to the next pages'''
+        rows = list(couchdb_pager(self.db, startkey='"doc-2"', bulk=2))
+        self.assertEqual([r.id for r in rows],
+                         ['doc-{}'.format(i) for i in range(2, 7)])
+        self.assertEqual([c['start_key'] for c in self.calls],
+                         ['"doc-2"', '"doc-4"', '"doc-6"'])
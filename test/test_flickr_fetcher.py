@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 from unittest import TestCase
+from mock import patch
 import harvester.fetcher as fetcher
+from harvester.fetcher.flickr_fetcher import TokenBucket
 from test.utils import DIR_FIXTURES
 from test.utils import LogOverrideMixin
 from mypretty import httpretty
@@ -319,6 +321,57 @@ class FlickrFetcherTestCase(LogOverrideMixin, TestCase):
         for k, v in key_list_values.items():
             self.assertEqual(photo_obj[k], v)
 
+    @httpretty.activate
+    def test_fetching_concurrent(self):
+        '''Test getting photo info with a pool of workers'''
+        url = 'https://example.edu'
+        user_id = 'testuser'
+        page_size = 10
+        url_first = fetcher.Flickr_Fetcher.url_get_user_photos_template.format(
+            api_key='boguskey', user_id=user_id, per_page=page_size, page=1)
+        info = open(DIR_FIXTURES + '/flickr-photo-info-0.xml').read()
+        responses = [
+            httpretty.Response(
+                body=open(DIR_FIXTURES + '/flickr-public-photos-1.xml').read(),
+                status=200)
+        ]
+        for n, n_photos in ((1, 3), (2, 3), (3, 3), (4, 1)):
+            responses.append(
+                httpretty.Response(
+                    body=open(DIR_FIXTURES +
+                              '/flickr-public-photos-{}.xml'.format(n)).read(),
+                    status=200))
+            responses.extend(
+                [httpretty.Response(body=info, status=200)] * n_photos)
+        httpretty.register_uri(httpretty.GET, url_first, responses=responses)
+        h = fetcher.Flickr_Fetcher(
+            url, user_id, page_size=page_size, info_workers=3,
+            rate_limit=1000)
+        self.assertIsNotNone(h._pool)
+        self.assertEqual(h._rate_limiter.rate, 1000)
+        all_objs = []
+        for objs in h:
+            all_objs.extend(objs)
+        self.assertEqual(len(all_objs), 10)
+        self.assertIsNone(h._pool)
+        self.assertEqual(all_objs[0]['title'],
+                         {'text': 'Ryan Aeronautical Image'})
+
+    @patch('time.sleep')
+    def test_token_bucket(self, mock_sleep):
+        '''Test the rate limiter waits once the burst is used up'''
+        bucket = TokenBucket(10, capacity=2)
+        with patch('time.time', return_value=1000.0):
+            bucket._last = 1000.0
+            bucket.acquire()
+            bucket.acquire()
+            mock_sleep.assert_not_called()
+            mock_sleep.side_effect = lambda t: setattr(
+                bucket, '_last', bucket._last - t)
+            bucket.acquire()
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 0.1)
+
     @httpretty.activate
     def test_photoset_fetching(self):
         url = 'https://example.edu'
@@ -5,6 +5,7 @@ import shutil
 import re
 import json
 import datetime
+import logbook
 from mypretty import httpretty
 # import httpretty
 from mock import patch
@@ -284,12 +285,24 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
                          'https://registry.cdlib.org/api/v1/campus/12/')
         self.assertEqual(obj['collection'][0]['repository'][0]['@id'],
                          'https://registry.cdlib.org/api/v1/repository/37/')
+        # registry data is computed once & shared by all objects
+        obj2 = {'id': 'fakey2', 'collection': 'source collection'}
+        with patch('urlparse.urlparse') as mock_urlparse:
+            controller._add_registry_data(obj2)
+            mock_urlparse.assert_not_called()
+        self.assertIs(obj2['collection'], obj['collection'])
+        self.assertEqual(obj2['source_collection_name'], 'source collection')
 
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testObjectsHaveRegistryData(self, mock_boto3):
+    def testObjectsHaveRegistryData(self, mock_boto3, mock_client):
         '''Test that the registry data is being attached to objects from
         the harvest controller'''
         self.controller_oai.harvest()
+        # pages are uploaded in the background
+        self.assertIsNone(self.controller_oai.uploader)
+        mock_boto3().Bucket().put_object.assert_not_called()
+        self.assertEqual(mock_client().upload_fileobj.call_count, 128)
         dir_list = os.listdir(self.controller_oai.dir_save)
         self.assertEqual(len(dir_list), 128)
         objset_saved = json.loads(
@@ -326,6 +339,16 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
             }]
         }])
 
+    @patch('boto3.client', autospec=True)
+    def testHarvestSyncUpload(self, mock_client):
+        '''With no upload workers pages are saved in the fetch loop'''
+        self.controller_oai.s3_upload_workers = 0
+        with patch('boto3.resource', autospec=True) as mock_boto3:
+            self.controller_oai.harvest()
+            self.assertEqual(
+                mock_boto3().Bucket().put_object.call_count, 128)
+        mock_client.assert_not_called()
+
     @httpretty.activate
     def testFailsIfNoRecords(self):
         '''Test that the Controller throws an error if no records come back
@@ -356,3 +379,68 @@ class FetcherClassTestCase(TestCase):
     def testClassExists(self):
         h = fetcher.Fetcher
         h = h('url_harvest', 'extra_data')
+
+
+class ReadAheadFetcherTestCase(TestCase):
+    '''Test the read ahead fetcher wrapper'''
+
+    class PageFetcher(fetcher.Fetcher):
+        def __init__(self, url_harvest, extra_data, pages=5, fail_at=None,
+                     **kwargs):
+            super(ReadAheadFetcherTestCase.PageFetcher, self).__init__(
+                url_harvest, extra_data)
+            self.pages = iter(range(pages))
+            self.fail_at = fail_at
+
+        def next(self):
+            page = self.pages.next()
+            if page == self.fail_at:
+                raise ValueError('Boom!')
+            self.logger.info('Fetched page {}'.format(page))
+            return [{'page': page}]
+
+    def testReadAhead(self):
+        f = self.PageFetcher('url_harvest', 'extra_data', pages=5)
+        h = fetcher.ReadAheadFetcher(f, pages=2)
+        self.assertEqual(h.url, 'url_harvest')
+        self.assertEqual([objset[0]['page'] for objset in h], range(5))
+        self.assertRaises(StopIteration, h.next)
+
+    def testReadAheadLogs(self):
+        '''The wrapped fetcher logs to the caller's thread handlers'''
+        log_handler = logbook.TestHandler()
+        with log_handler.threadbound():
+            h = fetcher.ReadAheadFetcher(
+                self.PageFetcher('url_harvest', 'extra_data', pages=3))
+            self.assertEqual(len(list(h)), 3)
+        self.assertEqual(
+            [r.message for r in log_handler.records],
+            ['Fetched page 0', 'Fetched page 1', 'Fetched page 2'])
+
+    def testReadAheadException(self):
+        h = fetcher.ReadAheadFetcher(
+            self.PageFetcher('url_harvest', 'extra_data', fail_at=3))
+        self.assertEqual(h.next(), [{'page': 0}])
+        self.assertEqual(h.next(), [{'page': 1}])
+        self.assertEqual(h.next(), [{'page': 2}])
+        self.assertRaises(ValueError, h.next)
+        self.assertRaises(StopIteration, h.next)
+
+    @httpretty.activate
+    def testControllerWrapsPaginatedFetchers(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://registry.cdlib.org/api/v1/collection/197/",
+            body=open(DIR_FIXTURES + '/collection_api_test.json').read())
+        collection = Collection(
+            'https://registry.cdlib.org/api/v1/collection/197/')
+        collection.harvest_type = 'UCB'
+        with patch.dict(fetcher.controller.HARVEST_TYPES,
+                        {'UCB': self.PageFetcher}):
+            controller = fetcher.HarvestController(
+                'email@example.com', collection, pages=3)
+        shutil.rmtree(controller.dir_save)
+        self.assertIsInstance(controller.fetcher, fetcher.ReadAheadFetcher)
+        self.assertEqual(controller.fetcher.fetcher.url,
+                         collection.url_harvest)
+        self.assertEqual(len([objset for objset in controller.fetcher]), 3)
@@ -1,4 +1,6 @@
 import os
+import json
+import hashlib
 from unittest import TestCase
 from collections import namedtuple
 from mock import patch
@@ -11,11 +13,15 @@ from harvester.image_harvest import ImageHTTPError
 from harvester.image_harvest import IsShownByError
 from harvester.image_harvest import HasObject
 from harvester.image_harvest import RestoreFromObjectCache
+from couchdb import ResourceConflict
 
 #TODO: make this importable from md5s3stash
 StashReport = namedtuple('StashReport',
                          'url, md5, s3_url, mime_type, dimensions')
 
+JPEG_BODY = '\xff\xd8\xff\xe0\x00\x10JFIF' + 'x' * 100
+JPEG_MD5 = hashlib.md5(JPEG_BODY).hexdigest()
+
 
 class ImageHarvestTestCase(TestCase):
     '''Test the md5 s3 image harvesting calls.....
@@ -30,62 +36,84 @@ class ImageHarvestTestCase(TestCase):
         if self.old_url_couchdb:
             os.environ['COUCHDB_URL'] = self.old_url_couchdb
 
-    @patch('boto.s3.connect_to_region', return_value='S3Conn to a region')
+    @patch('boto.s3.connect_to_region')
     @patch('harvester.image_harvest.Redis', autospec=True)
     @patch('couchdb.Server')
-    @patch(
-        'md5s3stash.md5s3stash',
-        autospec=True,
-        return_value=StashReport('test url', 'md5 test value', 's3 url object',
-                                 'mime_type', 'dimensions'))
+    @patch('md5s3stash.image_info', return_value=('image/jpeg', (10, 20)))
     @httpretty.activate
-    def test_stash_image(self, mock_stash, mock_couch, mock_redis,
+    def test_stash_image(self, mock_image_info, mock_couch, mock_redis,
                          mock_s3_connect):
         '''Test the stash image calls are correct'''
         doc = {'_id': 'TESTID'}
+        url_cache = {}
+        hash_cache = {}
         image_harvester = image_harvest.ImageHarvester(
-            url_cache={}, hash_cache={}, bucket_bases=['region:x'])
+            url_cache=url_cache, hash_cache=hash_cache,
+            bucket_bases=['region:x', 'region2:y/z'])
         self.assertRaises(IsShownByError, image_harvester.stash_image, doc)
         doc['isShownBy'] = None
         self.assertRaises(IsShownByError, image_harvester.stash_image, doc)
         doc['isShownBy'] = ['ark:/test_local_url_ark:']
         url_test = 'http://content.cdlib.org/ark:/test_local_url_ark:'
         httpretty.register_uri(
-            httpretty.HEAD,
+            httpretty.GET,
             url_test,
-            body='',
-            content_length='0',
+            body=JPEG_BODY,
             content_type='image/jpeg;',
+            etag='"an-etag"',
             connection='close', )
+        # a connection per region, the buckets are uploaded to concurrently
+        conns = {'region': MagicMock(), 'region2': MagicMock()}
+        mock_s3_connect.side_effect = lambda region: conns[region]
+        buckets = [conns[r].get_bucket.return_value
+                   for r in ('region', 'region2')]
+        for bucket in buckets:
+            bucket.get_key.return_value = None
         ret = image_harvester.stash_image(doc)
-        mock_stash.assert_called_with(
-            url_test,
-            url_auth=None,
-            bucket_base='x',
-            conn='S3Conn to a region',
-            hash_cache={},
-            url_cache={})
-        self.assertEqual('s3 url object', ret[0].s3_url)
-        ret = image_harvester.stash_image(doc)
-        mock_stash.assert_called_with(
+        self.assertEqual(httpretty.last_request().method, 'GET')
+        self.assertEqual(ret, [
+            StashReport(url_test, JPEG_MD5, 's3://x/' + JPEG_MD5,
+                        'image/jpeg', (10, 20)),
+            StashReport(url_test, JPEG_MD5, 's3://y/z/' + JPEG_MD5,
+                        'image/jpeg', (10, 20))])
+        self.assertEqual(mock_image_info.call_count, 1)
+        mock_s3_connect.assert_any_call('region')
+        mock_s3_connect.assert_any_call('region2')
+        buckets[0].new_key.assert_called_once_with('/' + JPEG_MD5)
+        buckets[1].new_key.assert_called_once_with('/z/' + JPEG_MD5)
+        for bucket in buckets:
+            key = bucket.new_key.return_value
+            key.set_metadata.assert_called_with('Content-Type', 'image/jpeg')
+            self.assertEqual(key.set_contents_from_filename.call_count, 1)
+            self.assertFalse(os.path.exists(
+                key.set_contents_from_filename.call_args[0][0]))
+        self.assertEqual(url_cache[url_test], {
+            'md5': JPEG_MD5, 'If-None-Match': '"an-etag"'})
+        self.assertEqual(hash_cache[JPEG_MD5],
+                         ('s3://x/' + JPEG_MD5, 'image/jpeg', (10, 20)))
+        # unchanged image is not downloaded again
+        httpretty.register_uri(
+            httpretty.GET, url_test, body='', status=304)
+        for bucket in buckets:
+            bucket.new_key.reset_mock()
+        ret2 = image_harvester.stash_image(doc)
+        self.assertEqual(ret2, ret)
+        self.assertEqual(httpretty.last_request().headers['If-None-Match'],
+                         '"an-etag"')
+        self.assertFalse(any(b.new_key.called for b in buckets))
+        httpretty.register_uri(
+            httpretty.GET,
             url_test,
-            url_auth=None,
-            bucket_base='x',
-            conn='S3Conn to a region',
-            hash_cache={},
-            url_cache={})
+            body=JPEG_BODY,
+            content_type='image/jpeg;',
+            connection='close', )
         ret = image_harvest.ImageHarvester(
             bucket_bases=['region:x'],
             object_auth=('tstuser', 'tstpswd'),
             url_cache={},
             hash_cache={}).stash_image(doc)
-        mock_stash.assert_called_with(
-            url_test,
-            url_auth=('tstuser', 'tstpswd'),
-            bucket_base='x',
-            conn='S3Conn to a region',
-            hash_cache={},
-            url_cache={})
+        self.assertIn('Authorization', httpretty.last_request().headers)
+        self.assertEqual(ret[0].md5, JPEG_MD5)
         doc['isShownBy'] = ['not a url']
         self.assertRaises(FailsImageTest, image_harvester.stash_image, doc)
 
@@ -97,15 +125,93 @@ class ImageHarvestTestCase(TestCase):
         db = MagicMock()
         image_harvester = image_harvest.ImageHarvester(
             cdb=db, url_cache={}, hash_cache={}, bucket_bases=['region:x'])
+        db.update.return_value = [(True, 'TESTID', '2-rev')]
         ret = image_harvester.update_doc_object(doc, r)
         self.assertEqual('md5 test value', ret)
         self.assertEqual('md5 test value', doc['object'])
         self.assertEqual(doc['object_dimensions'], 'dimensions-x:y')
-        db.save.assert_called_with({
+        self.assertFalse(db.update.called)
+        image_harvester.flush()
+        db.update.assert_called_with([{
             '_id': 'TESTID',
             'object': 'md5 test value',
             'object_dimensions': 'dimensions-x:y'
-        })
+        }])
+        self.assertFalse(db.save.called)
+
+    def test_couchdb_object_writer(self):
+        '''Docs are written in bulk & conflicts are retried on the latest
+        revision of the doc'''
+        db = MagicMock()
+        writer = image_harvest.CouchDBObjectWriter(db, batch_size=2)
+        docs = [{'_id': str(i), '_rev': '1-a', 'object': 'md5-{}'.format(i),
+                 'object_dimensions': [i, i]} for i in range(3)]
+        db.update.side_effect = [
+            [(True, '0', '2-a'),
+             (False, '1', ResourceConflict('Document update conflict.'))],
+            [(True, '1', '3-a')],
+        ]
+        latest = {'_id': '1', '_rev': '2-b', 'title': 'changed'}
+        db.view.return_value = [MagicMock(id='1', doc=latest)]
+        writer.add(docs[0])
+        self.assertFalse(db.update.called)
+        writer.add(docs[1])
+        self.assertEqual(db.update.call_count, 2)
+        db.update.assert_called_with([{
+            '_id': '1', '_rev': '2-b', 'title': 'changed',
+            'object': 'md5-1', 'object_dimensions': [1, 1]}])
+        db.view.assert_called_once_with('_all_docs', keys=['1'],
+                                        include_docs=True)
+        self.assertEqual(writer.num_saved, 2)
+        writer.flush()
+        self.assertEqual(db.update.call_count, 2)
+        # gives up after the retries
+        writer = image_harvest.CouchDBObjectWriter(db, retries=1)
+        db.view.return_value = [MagicMock(id='2', doc={'_id': '2'})]
+        db.update.side_effect = lambda docs: [
+            (False, d['_id'], ResourceConflict('conflict')) for d in docs]
+        writer.add(docs[2])
+        writer.flush()
+        self.assertEqual(db.update.call_count, 4)
+        self.assertEqual(writer.num_failed, 1)
+        self.assertEqual(writer.num_saved, 0)
+
+    @patch('boto.s3.connect_to_region')
+    @patch('harvester.image_harvest.Redis', autospec=True)
+    @patch('couchdb.Server')
+    @patch('md5s3stash.image_info', return_value=('image/jpeg', (10, 20)))
+    @httpretty.activate
+    def test_stash_image_fan_out(self, mock_image_info, mock_couch,
+                                 mock_redis, mock_s3_connect):
+        '''The S3 connections are kept & existing keys not uploaded'''
+        url = 'http://example.edu/test.jpg'
+        httpretty.register_uri(
+            httpretty.GET, url, body=JPEG_BODY, content_type='image/jpeg')
+        bucket = mock_s3_connect.return_value.get_bucket.return_value
+        bucket.get_key.return_value = None
+        image_harvester = image_harvest.ImageHarvester(
+            url_cache={}, hash_cache={}, bucket_bases=['region:x'])
+        image_harvester.stash_image({'_id': 'TESTID', 'isShownBy': url})
+        image_harvester._hash_cache.clear()
+        image_harvester._url_cache.clear()
+        bucket.get_key.return_value = 'a key'
+        reports = image_harvester.stash_image(
+            {'_id': 'TESTID2', 'isShownBy': url})
+        mock_s3_connect.assert_called_once_with('region')
+        self.assertEqual(bucket.new_key.call_count, 1)
+        bucket.get_key.assert_called_with('/' + JPEG_MD5)
+        self.assertEqual(reports[0].s3_url, 's3://x/' + JPEG_MD5)
+        # uploads to several buckets go through the thread pool
+        image_harvester = image_harvest.ImageHarvester(
+            url_cache={}, hash_cache={},
+            bucket_bases=['region:x', 'region:y', 'region:z'])
+        reports = image_harvester.stash_image(
+            {'_id': 'TESTID', 'isShownBy': url})
+        self.assertEqual([r.s3_url for r in reports],
+                         ['s3://{}/{}'.format(b, JPEG_MD5)
+                          for b in ('x', 'y', 'z')])
+        self.assertIsNotNone(image_harvester._stash_pool)
+        self.assertEqual(mock_image_info.call_count, 3)
 
     @httpretty.activate
     def test_link_is_to_image(self):
@@ -130,24 +236,16 @@ class ImageHarvestTestCase(TestCase):
         self.assertRaises(ImageHTTPError, image_harvest.link_is_to_image,
                           'TESTID', url)
         url = 'http://getthisimage/notanimage'
-        httpretty.register_uri(
-            httpretty.HEAD,
-            url,
-            body='',
-            content_length='0',
-            content_type='text/plain; charset=utf-8',
-            connection='close', )
         httpretty.register_uri(
             httpretty.GET,
             url,
-            body='',
-            content_length='0',
+            body='<html></html>',
             content_type='text/html; charset=utf-8',
             connection='close', )
         self.assertFalse(image_harvest.link_is_to_image('TESTID', url))
         url = 'http://getthisimage/isanimage'
         httpretty.register_uri(
-            httpretty.HEAD,
+            httpretty.GET,
             url,
             body='',
             content_length='0',
@@ -156,83 +254,71 @@ class ImageHarvestTestCase(TestCase):
         self.assertTrue(image_harvest.link_is_to_image('TESTID', url))
         url_redirect = 'http://gethisimage/redirect'
         httpretty.register_uri(
-            httpretty.HEAD, url, body='', status=301, location=url_redirect)
+            httpretty.GET, url, body='', status=301, location=url_redirect)
         httpretty.register_uri(
-            httpretty.HEAD,
+            httpretty.GET,
             url_redirect,
             body='',
             content_length='0',
             content_type='image/jpeg; charset=utf-8',
             connection='close', )
         self.assertTrue(image_harvest.link_is_to_image('TESTID', url))
-        httpretty.register_uri(
-            httpretty.HEAD,
-            url,
-            body='',
-            content_length='0',
-            content_type='text/html; charset=utf-8',
-            connection='close', )
+        # wrong content-type, but the content is an image
         httpretty.register_uri(
             httpretty.GET,
             url,
-            body='',
-            content_length='0',
-            content_type='image/jpeg; charset=utf-8',
+            body=JPEG_BODY,
+            content_type='text/html; charset=utf-8',
             connection='close', )
         self.assertTrue(image_harvest.link_is_to_image('TESTID', url))
+        self.assertEqual(httpretty.last_request().method, 'GET')
+
+    def test_sniff_image_type(self):
+        '''Image types are recognized from the first bytes'''
+        self.assertEqual(image_harvest.sniff_image_type(JPEG_BODY),
+                         'image/jpeg')
+        self.assertEqual(image_harvest.sniff_image_type('II*\x00xxxx'),
+                         'image/tiff')
+        self.assertEqual(image_harvest.sniff_image_type(
+            '\x00\x00\x00\x0cjP  \r\n\x87\nxxxx'), 'image/jp2')
+        self.assertEqual(image_harvest.sniff_image_type(
+            'RIFF\x00\x00\x00\x00WEBPVP8 '), 'image/webp')
+        self.assertIsNone(image_harvest.sniff_image_type('<html>'))
+        self.assertIsNone(image_harvest.sniff_image_type(''))
 
+    @patch('boto.s3.connect_to_region')
     @patch('couchdb.Server')
-    @patch(
-        'md5s3stash.md5s3stash',
-        autospec=True,
-        return_value=StashReport('test url', 'md5 test value', 's3 url object',
-                                 'mime_type', 'dimensions'))
+    @patch('md5s3stash.image_info', return_value=('mime_type', 'dimensions'))
     @httpretty.activate
-    def test_ignore_content_type(self, mock_stash, mock_couch):
+    def test_ignore_content_type(self, mock_image_info, mock_couch,
+                                 mock_s3_connect):
         '''Test that content type check is not called if  --ignore_content_type parameter given'''
         url = 'http://getthisimage/image'
         doc = {'_id': 'IGNORE_CONTENT', 'isShownBy': url}
-        httpretty.register_uri(
-            httpretty.HEAD,
-            url,
-            body='',
-            content_length='0',
-            content_type='text/plain; charset=utf-8',
-            connection='close', )
         httpretty.register_uri(
             httpretty.GET,
             url,
-            body='',
-            content_length='0',
+            body='text',
             content_type='text/html; charset=utf-8',
             connection='close', )
         image_harvester = image_harvest.ImageHarvester(
             url_cache={}, hash_cache={}, bucket_bases=['region:x'], ignore_content_type=True)
-        r = StashReport('test url', 'md5 test value', 's3 url object',
-                        'mime_type', 'dimensions')
+        md5 = hashlib.md5('text').hexdigest()
+        r = StashReport(url, md5, 's3://x/' + md5, 'mime_type', 'dimensions')
         ret = image_harvester.stash_image(doc)
         self.assertEqual(ret, [r])
 
+    @patch('boto.s3.connect_to_region')
     @patch('couchdb.Server')
-    @patch(
-        'md5s3stash.md5s3stash',
-        autospec=True,
-        return_value=StashReport('test url', 'md5 test value', 's3 url object',
-                                 'mime_type', 'dimensions'))
+    @patch('md5s3stash.image_info', return_value=('mime_type', 'dimensions'))
     @httpretty.activate
-    def test_check_content_type(self, mock_stash, mock_couch):
+    def test_check_content_type(self, mock_image_info, mock_couch,
+                                mock_s3_connect):
         '''Test that the check for content type correctly aborts if the
         type is not a image
         '''
         url = 'http://getthisimage/notanimage'
         doc = {'_id': 'TESTID', 'isShownBy': url}
-        httpretty.register_uri(
-            httpretty.HEAD,
-            url,
-            body='',
-            content_length='0',
-            content_type='text/plain; charset=utf-8',
-            connection='close', )
         httpretty.register_uri(
             httpretty.GET,
             url,
@@ -244,28 +330,23 @@ class ImageHarvestTestCase(TestCase):
             url_cache={}, hash_cache={}, bucket_bases=['region:x'])
         self.assertRaises(FailsImageTest, image_harvester.stash_image, doc)
         httpretty.register_uri(
-            httpretty.HEAD,
+            httpretty.GET,
             url,
-            body='',
-            content_length='0',
+            body='image',
             content_type='image/plain; charset=utf-8',
             connection='close', )
-        r = StashReport('test url', 'md5 test value', 's3 url object',
-                        'mime_type', 'dimensions')
+        md5 = hashlib.md5('image').hexdigest()
+        r = StashReport(url, md5, 's3://x/' + md5, 'mime_type', 'dimensions')
         ret = image_harvester.stash_image(doc)
         self.assertEqual(ret, [r])
 
-    @patch('boto.s3.connect_to_region', return_value='S3Conn to a region')
+    @patch('boto.s3.connect_to_region')
     @patch('harvester.image_harvest.Redis', autospec=True)
     @patch('couchdb.Server')
-    @patch(
-        'md5s3stash.md5s3stash',
-        autospec=True,
-        return_value=StashReport('test url', 'md5 test value', 's3 url object',
-                                 'mime_type', 'dimensions'))
+    @patch('md5s3stash.image_info', return_value=('mime_type', 'dimensions'))
     @httpretty.activate
-    def test_harvest_image_for_doc(self, mock_stash, mock_couch, mock_redis,
-                                   mock_s3_connect):
+    def test_harvest_image_for_doc(self, mock_image_info, mock_couch,
+                                   mock_redis, mock_s3_connect):
         image_harvester = image_harvest.ImageHarvester(
             url_cache={},
             hash_cache={},
@@ -293,7 +374,7 @@ class ImageHarvestTestCase(TestCase):
         url = 'http://example.edu/test.jpg'
         doc = {'_id': 'XXX-TESTID', 'isShownBy': url}
         httpretty.register_uri(
-            httpretty.HEAD,
+            httpretty.GET,
             url,
             body='',
             content_length='0',
@@ -312,3 +393,105 @@ class ImageHarvestTestCase(TestCase):
         exception.
         '''
         pass
+
+    @patch('harvester.image_harvest.time.sleep')
+    @patch('harvester.image_harvest.format_results_subject')
+    @patch('harvester.image_harvest.publish_to_harvesting')
+    @patch('harvester.image_harvest.couchdb_pager')
+    @patch('harvester.image_harvest.Redis', autospec=True)
+    @patch('couchdb.Server')
+    def test_by_collection_cache_batches(self, mock_couch, mock_redis,
+                                         mock_pager, mock_publish,
+                                         mock_subject, mock_sleep):
+        '''The object cache is read a batch of docs at a time'''
+        rows = [MagicMock(id=str(i), doc={'_id': str(i), 'object': 'md5',
+                                          'object_dimensions': [1, 2]})
+                for i in range(5)]
+        mock_pager.return_value = rows
+        object_cache = MagicMock()
+        object_cache.get.return_value = False
+        image_harvester = image_harvest.ImageHarvester(
+            url_cache={}, hash_cache={}, bucket_bases=['region:x'],
+            harvested_object_cache=object_cache)
+        with patch('harvester.image_harvest.IMAGE_CACHE_PRELOAD_SIZE', 2):
+            doc_ids, report_errors = image_harvester.by_collection('1')
+        self.assertEqual(doc_ids, ['0', '1', '2', '3', '4'])
+        self.assertEqual(len(report_errors[HasObject.dict_key]), 5)
+        preloads = object_cache.preload.call_args_list
+        self.assertEqual([c[0][0] for c in preloads],
+                         [['0', '1'], ['2', '3'], ['4']])
+        object_cache.__setitem__.assert_called_with('4', ['md5', [1, 2]])
+        self.assertEqual(object_cache.flush.call_count, 4)
+        # the docs with an object aren't fetched, no need to wait
+        self.assertFalse(mock_sleep.called)
+        # a checkpoint is saved after each batch & cleared at the end
+        redis = mock_redis.return_value
+        checkpoints = [json.loads(c[0][1]) for c in redis.set.call_args_list]
+        self.assertEqual([c['last_doc_id'] for c in checkpoints],
+                         ['1', '3', '4'])
+        self.assertEqual(checkpoints[-1], {
+            'last_doc_id': '4', 'num_docs': 5,
+            'errors': {HasObject.dict_key: 5}})
+        self.assertEqual(redis.set.call_args[0][0],
+                         'ucldc:harvester:image-harvest-checkpoint:1')
+        redis.delete.assert_called_with(
+            'ucldc:harvester:image-harvest-checkpoint:1')
+
+    @patch('harvester.image_harvest.time.sleep')
+    @patch('harvester.image_harvest.format_results_subject')
+    @patch('harvester.image_harvest.publish_to_harvesting')
+    @patch('harvester.image_harvest.couchdb_pager')
+    @patch('harvester.image_harvest.Redis', autospec=True)
+    @patch('couchdb.Server')
+    def test_by_collection_resume(self, mock_couch, mock_redis, mock_pager,
+                                  mock_publish, mock_subject, mock_sleep):
+        '''A resumed harvest starts from the checkpointed doc'''
+        mock_redis.return_value.get.return_value = json.dumps({
+            'last_doc_id': '2', 'num_docs': 3,
+            'errors': {HasObject.dict_key: 3}})
+        mock_pager.return_value = [
+            MagicMock(id=str(i), doc={'_id': str(i), 'object': 'md5',
+                                      'object_dimensions': [1, 2]})
+            for i in range(2, 5)]
+        image_harvester = image_harvest.ImageHarvester(
+            url_cache={}, hash_cache={}, bucket_bases=['region:x'],
+            harvested_object_cache={'2': 'x', '3': 'x', '4': 'x'})
+        doc_ids, report_errors = image_harvester.by_collection(
+            '1', resume=True)
+        self.assertEqual(doc_ids, ['3', '4'])
+        self.assertEqual(mock_pager.call_args[1]['startkey_docid'], '2')
+        self.assertEqual(mock_pager.call_args[1]['startkey'], '"1"')
+        msg = mock_publish.call_args[0][1]
+        self.assertTrue(msg.startswith('Processed 5 documents\n'
+                                       'Resumed after 3 documents\n'))
+        self.assertIn('Has Object already before resume : 3', msg)
+        # without resume the checkpoint is ignored
+        mock_pager.return_value = []
+        image_harvester.by_collection('1')
+        self.assertIsNone(mock_pager.call_args[1]['startkey_docid'])
+
+    @patch('harvester.image_harvest.time.sleep')
+    @patch('harvester.image_harvest.couchdb_pager')
+    @patch('harvester.image_harvest.Redis', autospec=True)
+    @patch('couchdb.Server')
+    def test_stash_pool_closed(self, mock_couch, mock_redis, mock_pager,
+                               mock_sleep):
+        '''The upload pool is closed when a harvest finishes or fails'''
+        image_harvester = image_harvest.ImageHarvester(
+            url_cache={}, hash_cache={},
+            bucket_bases=['region:x', 'region:y'],
+            harvested_object_cache=MagicMock())
+        image_harvester._object_cache.get.return_value = False
+
+        def stash_image(doc):
+            image_harvester._stash_pool = MagicMock()
+            if doc['_id'] == 'BAD':
+                raise ValueError('boom')
+        image_harvester.stash_image = stash_image
+        mock_couch.return_value.__getitem__.return_value.__getitem__.\
+            return_value = {'_id': 'TESTID'}
+        image_harvester.by_doc_id('TESTID')
+        self.assertIsNone(image_harvester._stash_pool)
+        mock_pager.return_value = [MagicMock(id='BAD', doc={'_id': 'BAD'})]
+        self.assertRaises(ValueError, image_harvester.by_collection, '1')
+        self.assertIsNone(image_harvester._stash_pool)
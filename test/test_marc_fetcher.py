@@ -83,8 +83,9 @@ class Harvest_MARC_ControllerTestCase(ConfigFileOverrideMixin,
         shutil.rmtree(self.controller.dir_save)
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testMARCHarvest(self, mock_boto3):
+    def testMARCHarvest(self, mock_boto3, mock_client):
         '''Test the function of the MARC harvest'''
         httpretty.register_uri(
             httpretty.GET,
@@ -0,0 +1,104 @@
+from unittest import TestCase
+from mock import patch
+from redis.exceptions import ConnectionError
+from harvester.media_check_cache import MediaCheckCache
+from harvester.media_check_cache import MEDIA_CHECK_KEY_PREFIX
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.scans = []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match=None, count=None):
+        self.scans.append(count)
+        return iter([k for k in self.data if k.startswith(match.rstrip('*'))])
+
+
+class MediaCheckCacheTestCase(TestCase):
+    '''Test the cache of nuxeo media checks'''
+    url = 's3://static.ucldc.cdlib.org/media_json/a-UUID-media.json'
+
+    def testCheckedWithTTL(self):
+        redis = FakeRedis()
+        cache = MediaCheckCache(redis=redis, ttl=60)
+        self.assertFalse(cache.is_checked(self.url))
+        cache.set_checked(self.url, 'etag1')
+        self.assertEqual(redis.ttls[MEDIA_CHECK_KEY_PREFIX + self.url], 60)
+        self.assertTrue(cache.is_checked(self.url))
+        self.assertTrue(cache.is_checked(self.url, 'etag1'))
+        self.assertFalse(cache.is_checked(self.url, 'etag2'))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        cache.invalidate(self.url)
+        self.assertFalse(cache.is_checked(self.url))
+        cache.set_checked(self.url)
+        cache.set_checked('s3://x/y')
+        cache.clear()
+        self.assertEqual(redis.data, {})
+
+    def testRedisDown(self):
+        redis = FakeRedis()
+        cache = MediaCheckCache(redis=redis)
+        with patch.object(redis, 'get', side_effect=ConnectionError('down')):
+            self.assertFalse(cache.is_checked(self.url))
+        cache.set_checked(self.url)  # cache is off now
+        self.assertEqual(redis.data, {})
+
+    @patch('harvester.media_check_cache.MEDIA_CLEAR_BATCH_SIZE', 2)
+    def testClearInBatches(self):
+        '''The keys are scanned & deleted a batch at a time'''
+        redis = FakeRedis()
+        cache = MediaCheckCache(redis=redis)
+        for i in range(5):
+            cache.set_checked('s3://x/{}'.format(i))
+        redis.set('other-key', 'x')
+        with patch.object(redis, 'delete', wraps=redis.delete) as delete:
+            cache.clear()
+        self.assertEqual([len(c[0]) for c in delete.call_args_list],
+                         [2, 2, 1])
+        self.assertEqual(redis.scans, [2])
+        self.assertEqual(redis.data, {'other-key': 'x'})
+        with patch.object(redis, 'scan_iter',
+                          side_effect=ConnectionError('down')):
+            cache.clear()
+        cache.set_checked(self.url)  # cache is off now
+        self.assertEqual(redis.data, {'other-key': 'x'})
+
+    @patch('boto3.client')
+    def testListedEtag(self, mock_client):
+        paginator = mock_client.return_value.get_paginator.return_value
+        paginator.paginate.return_value = [
+            {'Contents': [{'Key': 'media_json/a-UUID-media.json',
+                           'ETag': '"etag1"'}]},
+            {'Contents': [{'Key': 'media_json/b-UUID-media.json',
+                           'ETag': '"etag2"'}]},
+        ]
+        cache = MediaCheckCache(redis=FakeRedis())
+        self.assertEqual(cache.listed_etag(self.url), (False, None))
+        self.assertFalse(mock_client.called)
+        cache = MediaCheckCache(redis=FakeRedis(), prefetch=True,
+                                prefetch_after=2)
+        # the prefix is only listed after prefetch_after lookups
+        self.assertEqual(cache.listed_etag(self.url), (False, None))
+        self.assertEqual(cache.listed_etag(self.url), (False, None))
+        self.assertFalse(mock_client.called)
+        self.assertEqual(cache.listed_etag(self.url), (True, 'etag1'))
+        paginator.paginate.assert_called_once_with(
+            Bucket='static.ucldc.cdlib.org', Prefix='media_json/')
+        self.assertEqual(
+            cache.listed_etag(self.url.replace('a-UUID', 'c-UUID')),
+            (True, None))
+        self.assertEqual(paginator.paginate.call_count, 1)
+        self.assertEqual(cache.listed_etag('w/x/y/z'), (False, None))
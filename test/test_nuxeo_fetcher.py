@@ -74,9 +74,16 @@ class NuxeoFetcherTestCase(LogOverrideMixin, TestCase):
             's3://static.ucldc.cdlib.org/media_json/'
             '81249b9c-5a87-43af-877c-fb161325b1a0-media.json')
         mock_boto.assert_called_with()
-        mock_boto().get_bucket.assert_called_with('static.ucldc.cdlib.org')
+        mock_boto().get_bucket.assert_called_with('static.ucldc.cdlib.org',
+                                                  validate=False)
         mock_boto().get_bucket().get_key.assert_called_with(
             '/media_json/81249b9c-5a87-43af-877c-fb161325b1a0-media.json')
+        # connection is reused
+        mock_boto.reset_mock()
+        h._get_structmap_text(
+            's3://static.ucldc.cdlib.org/media_json/'
+            '81249b9c-5a87-43af-877c-fb161325b1a0-media.json')
+        mock_boto.assert_not_called()
         self.assertEqual(structmap_text, "Angela Davis socializing with "
                          "students at UC Irvine AS-061_A69-013_001.tif "
                          "AS-061_A69-013_002.tif AS-061_A69-013_003.tif "
@@ -142,6 +149,46 @@ class NuxeoFetcherTestCase(LogOverrideMixin, TestCase):
             docs[0]['isShownBy'],
             'https://nuxeo.cdlib.org/Nuxeo/nxpicsfile/default/'
             '40677ed1-f7c2-476f-886d-bf79c3fec8c4/Medium:content/')
+        # media json was prefetched for all records
+        self.assertEqual(h._structmap_texts, {})
+        self.assertEqual(
+            mock_boto().get_bucket().get_key.call_count, 3)
+
+    @httpretty.activate
+    @patch('boto.connect_s3', autospec=True)
+    @patch('harvester.fetcher.nuxeo_fetcher.DeepHarvestNuxeo', autospec=True)
+    def testFetchConcurrent(self, mock_deepharvest, mock_boto):
+        '''Test that concurrent fetching returns records in order'''
+        media_json = open(DIR_FIXTURES + '/nuxeo_media_structmap.json').read()
+        deepharvest_mocker(mock_deepharvest)
+        mock_boto.return_value.get_bucket.return_value.\
+            get_key.return_value.\
+            get_contents_as_string.return_value = media_json
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile('https://example.edu/api/v1/id/.*'),
+            body=open(DIR_FIXTURES + '/nuxeo_doc.json').read())
+        h = fetcher.NuxeoFetcher('https://example.edu/api/v1',
+                                 'path-to-asset/here',
+                                 fetch_workers=2,
+                                 prefetch=2)
+        self.assertIsNotNone(h._pool)
+        docs = [d for d in h]
+        self.assertEqual(3, len(docs))
+        self.assertIsNone(h._pool)
+        self.assertEqual([d['structmap_url'] for d in docs], [
+            's3://static.ucldc.cdlib.org/media_json/'
+            '416789a4-ae06-4abf-b1f7-44a680c6cff8-media.json',
+            's3://static.ucldc.cdlib.org/media_json/'
+            'd34ece39-a5f1-4448-b20c-1698637d4fbb-media.json',
+            's3://static.ucldc.cdlib.org/media_json/'
+            'e94548cc-6719-43c9-a2bd-aef348863c58-media.json',
+        ])
+        self.assertEqual(
+            docs[2]['isShownBy'],
+            'https://nuxeo.cdlib.org/Nuxeo/nxpicsfile/default/'
+            '40677ed1-f7c2-476f-886d-bf79c3fec8c4/Medium:content/')
+        self.assertRaises(StopIteration, h.next)
 
     @httpretty.activate
     @patch('boto.connect_s3', autospec=True)
@@ -296,6 +343,37 @@ class NuxeoFetcherTestCase(LogOverrideMixin, TestCase):
             isShownBy, 'https://s3.amazonaws.com/static.ucldc.cdlib.org/'
             'ucldc-nuxeo-thumb-media/4c80e254-6def-4230-9f28-bc48878568d4')
 
+    @patch('boto.connect_s3', autospec=True)
+    @patch('harvester.fetcher.nuxeo_fetcher.DeepHarvestNuxeo', autospec=True)
+    def test_scan_components(self, mock_deepharvest, mock_boto):
+        '''Test that one component scan finds both image & thumbnail
+        components and only fetches metadata it needs'''
+        deepharvest_mocker(mock_deepharvest)
+        h = fetcher.NuxeoFetcher('https://example.edu/api/v1',
+                                 'path-to-asset/here')
+        image_component = json.load(
+            open(DIR_FIXTURES + '/nuxeo_first_image_component.json'))
+        children = [
+            {'uid': 'text-1', 'type': 'CustomText', 'properties': {}},
+            {'uid': 'pdf-1', 'type': 'CustomFile', 'properties': {
+                'file:content': {'data': 'http://example.edu/x.pdf'}}},
+            {'uid': image_component['uid'], 'type': 'SampleCustomPicture',
+             'properties': {}},
+        ]
+        with patch.object(h._nx, 'nxql', return_value=children) as \
+                mock_nxql, \
+                patch.object(h._nx, 'get_metadata',
+                             return_value=image_component) as mock_get:
+            parent = {'uid': 'parent-1'}
+            self.assertEqual(h._scan_components(parent),
+                             (image_component['uid'], 'pdf-1'))
+            self.assertEqual(mock_nxql.call_count, 1)
+            mock_get.assert_called_once_with(uid=image_component['uid'])
+            # component metadata is cached for the harvest
+            self.assertEqual(h._scan_components(parent),
+                             (image_component['uid'], 'pdf-1'))
+            self.assertEqual(mock_get.call_count, 1)
+
 
 class UCLDCNuxeoFetcherTestCase(LogOverrideMixin, TestCase):
     '''Test that the UCLDC Nuxeo Fetcher errors if necessary
@@ -365,10 +443,12 @@ class Harvest_UCLDCNuxeo_ControllerTestCase(ConfigFileOverrideMixin,
         shutil.rmtree(self.controller.dir_save)
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
     @patch('boto.connect_s3', autospec=True)
     @patch('harvester.fetcher.nuxeo_fetcher.DeepHarvestNuxeo', autospec=True)
-    def testNuxeoHarvest(self, mock_deepharvest, mock_boto, mock_boto3):
+    def testNuxeoHarvest(self, mock_deepharvest, mock_boto, mock_boto3,
+                         mock_client):
         '''Test the function of the Nuxeo harvest'''
         media_json = open(DIR_FIXTURES + '/nuxeo_media_structmap.json').read()
         mock_boto.return_value.get_bucket.return_value.\
@@ -45,8 +45,9 @@ class HarvestOAC_JSON_ControllerTestCase(ConfigFileOverrideMixin,
         shutil.rmtree(self.controller.dir_save)
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testOAC_JSON_Harvest(self, mock_boto3):
+    def testOAC_JSON_Harvest(self, mock_boto3, mock_client):
         '''Test the function of the OAC harvest'''
         httpretty.register_uri(
             httpretty.GET,
@@ -55,15 +56,18 @@ class HarvestOAC_JSON_ControllerTestCase(ConfigFileOverrideMixin,
             body=open(DIR_FIXTURES + '/testOAC-url_next-1.json').read())
         self.assertTrue(hasattr(self.controller, 'harvest'))
         self.controller.harvest()
-        self.assertEqual(len(self.test_log_handler.records), 2)
+        self.assertEqual(len(self.test_log_handler.records), 3)
         self.assertTrue('UCB Department of Statistics' in
                         self.test_log_handler.formatted_records[0])
-        self.assertEqual(self.test_log_handler.formatted_records[1],
+        self.assertTrue(self.test_log_handler.formatted_records[1].startswith(
+            '[INFO] HarvestController: Uploaded '))
+        self.assertEqual(self.test_log_handler.formatted_records[2],
                          '[INFO] HarvestController: 28 records harvested')
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testObjectsHaveRegistryData(self, mock_boto3):
+    def testObjectsHaveRegistryData(self, mock_boto3, mock_client):
         # test OAC objsets
         httpretty.register_uri(
             httpretty.GET,
@@ -184,8 +188,9 @@ class HarvestOAC_XML_ControllerTestCase(ConfigFileOverrideMixin,
         # shutil.rmtree(self.controller.dir_save)
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testOAC_XML_Harvest(self, mock_boto3):
+    def testOAC_XML_Harvest(self, mock_boto3, mock_client):
         '''Test the function of the OAC harvest'''
         httpretty.register_uri(
             httpretty.GET,
@@ -195,10 +200,12 @@ class HarvestOAC_XML_ControllerTestCase(ConfigFileOverrideMixin,
         self.assertTrue(hasattr(self.controller, 'harvest'))
         self.controller.harvest()
         print "LOGS:{}".format(self.test_log_handler.formatted_records)
-        self.assertEqual(len(self.test_log_handler.records), 2)
+        self.assertEqual(len(self.test_log_handler.records), 3)
         self.assertTrue('UCB Department of Statistics' in
                         self.test_log_handler.formatted_records[0])
-        self.assertEqual(self.test_log_handler.formatted_records[1],
+        self.assertTrue(self.test_log_handler.formatted_records[1].startswith(
+            '[INFO] HarvestController: Uploaded '))
+        self.assertEqual(self.test_log_handler.formatted_records[2],
                          '[INFO] HarvestController: 24 records harvested')
 
 
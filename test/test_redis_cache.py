@@ -0,0 +1,91 @@
+import cPickle as pickle
+from unittest import TestCase
+from harvester.redis_cache import RedisHashCache
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def hset(self, key, field, value):
+        self.commands.append((key, field, value))
+
+    def execute(self):
+        self.redis.pipelines += 1
+        for key, field, value in self.commands:
+            self.redis.hashes.setdefault(key, {})[field] = value
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.hashes = {}
+        self.calls = []
+        self.pipelines = 0
+
+    def hget(self, key, field):
+        self.calls.append(('hget', field))
+        return self.hashes.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        self.calls.append(('hmget', fields))
+        return [self.hashes.get(key, {}).get(f) for f in fields]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class RedisHashCacheTestCase(TestCase):
+    '''Test the batched redis hash cache'''
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.redis.hashes['objs'] = {
+            'a': pickle.dumps(['md5-a', [1, 2]]),
+            'b': pickle.dumps(['md5-b', [3, 4]]),
+        }
+
+    def testPreload(self):
+        cache = RedisHashCache(self.redis, 'objs')
+        cache.preload(['a', 'b', 'c', 'a'])
+        self.assertEqual(self.redis.calls, [('hmget', ['a', 'b', 'c'])])
+        self.assertEqual(cache.get('a'), ['md5-a', [1, 2]])
+        self.assertEqual(cache['b'], ['md5-b', [3, 4]])
+        self.assertFalse(cache.get('c', False))
+        self.assertNotIn('c', cache)
+        self.assertRaises(KeyError, cache.__getitem__, 'c')
+        self.assertEqual(len(self.redis.calls), 1)
+        self.assertEqual(cache.get('d'), None)
+        self.assertEqual(self.redis.calls[-1], ('hget', 'd'))
+        cache.preload(['a', 'd'])
+        self.assertEqual(len(self.redis.calls), 2)
+
+    def testBufferedWrites(self):
+        cache = RedisHashCache(self.redis, 'objs', write_batch=3)
+        cache['c'] = ['md5-c', [5, 6]]
+        cache['d'] = None
+        self.assertEqual(cache['c'], ['md5-c', [5, 6]])
+        self.assertIn('d', cache)
+        self.assertEqual(self.redis.calls, [])
+        self.assertNotIn('c', self.redis.hashes['objs'])
+        cache.flush()
+        self.assertEqual(self.redis.pipelines, 1)
+        self.assertEqual(pickle.loads(self.redis.hashes['objs']['c']),
+                         ['md5-c', [5, 6]])
+        cache.flush()
+        self.assertEqual(self.redis.pipelines, 1)
+        for key in ('x', 'y', 'z'):
+            cache[key] = key
+        self.assertEqual(self.redis.pipelines, 2)
+        self.assertEqual(pickle.loads(self.redis.hashes['objs']['z']), 'z')
+
+    def testLRUBounded(self):
+        cache = RedisHashCache(self.redis, 'objs', lru_size=2)
+        cache.preload(['a', 'b'])
+        cache.get('a')
+        cache.get('c')  # b is least recently used & is dropped
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(self.redis.calls[-1], ('hget', 'b'))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
@@ -57,8 +57,9 @@ class MainTestCase(ConfigFileOverrideMixin, LogOverrideMixin, TestCase):
         self.assertTrue(hasattr(fetcher, 'EMAIL_RETURN_ADDRESS'))
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testMainCreatesCollectionProfile(self, mock_boto3):
+    def testMainCreatesCollectionProfile(self, mock_boto3, mock_client):
         '''Test that the main function produces a collection profile
         file for DPLA. The path to this file is needed when creating a
         DPLA ingestion document.
@@ -203,8 +204,9 @@ class MainTestCase(ConfigFileOverrideMixin, LogOverrideMixin, TestCase):
         self.assertTrue("Boom!" in self.test_log_handler.formatted_records[6])
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testMainFn(self, mock_boto3):
+    def testMainFn(self, mock_boto3, mock_client):
         httpretty.register_uri(
             httpretty.GET,
             "https://registry.cdlib.org/api/v1/collection/197/",
@@ -224,7 +226,7 @@ class MainTestCase(ConfigFileOverrideMixin, LogOverrideMixin, TestCase):
                 dir_profile=self.dir_test_profile,
                 profile_path=self.profile_path,
                 config_file=self.config_file)
-        self.assertEqual(len(self.test_log_handler.records), 10)
+        self.assertEqual(len(self.test_log_handler.records), 11)
         self.assertIn(u'[INFO] HarvestMain: Init harvester next',
                       self.test_log_handler.formatted_records[0])
         self.assertEqual(self.test_log_handler.formatted_records[1],
@@ -244,10 +246,12 @@ class MainTestCase(ConfigFileOverrideMixin, LogOverrideMixin, TestCase):
             self.test_log_handler.formatted_records[6])
         self.assertEqual(self.test_log_handler.formatted_records[7],
                          u'[INFO] HarvestController: 100 records harvested')
-        self.assertEqual(self.test_log_handler.formatted_records[8],
+        self.assertTrue(self.test_log_handler.formatted_records[8].startswith(
+            u'[INFO] HarvestController: Uploaded 128 pages'))
+        self.assertEqual(self.test_log_handler.formatted_records[9],
                          u'[INFO] HarvestController: 128 records harvested')
         self.assertEqual(
-            self.test_log_handler.formatted_records[9],
+            self.test_log_handler.formatted_records[10],
             u'[INFO] HarvestMain: Finished harvest of '
             u'calisphere-santa-clara-university-digital-objects. 128 '
             u'records harvested.'
@@ -339,6 +343,7 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
         if 'DPLA_CONFIG_FILE' in os.environ:
             del os.environ['DPLA_CONFIG_FILE']
 
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
     @patch('harvester.run_ingest.Redis', autospec=True)
     @patch('couchdb.Server')
@@ -350,7 +355,7 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
     @patch('dplaingestion.couch.Couch')
     def testRunIngest(self, mock_couch, mock_dash_clean, mock_check,
                       mock_remove, mock_save, mock_enrich, mock_couchdb,
-                      mock_redis, mock_boto3):
+                      mock_redis, mock_boto3, mock_client):
         mock_couch.return_value._create_ingestion_document.return_value = \
             'test-id'
         # this next is because the redis client unpickles....
@@ -391,8 +396,9 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
             dashboard_db_name='dashboard',
             dpla_db_name='ucldc')
         mock_enrich.assert_called_with([None, 'test-id'])
-        self.assertEqual(len(self.test_log_handler.records), 14)
+        self.assertEqual(len(self.test_log_handler.records), 15)
 
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
     @patch('harvester.run_ingest.Redis', autospec=True)
     @patch('couchdb.Server')
@@ -405,7 +411,7 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
     def testRunIngestProductionNotReady(self, mock_couch, mock_dash_clean,
                                         mock_check, mock_remove, mock_save,
                                         mock_enrich, mock_couchdb, mock_redis,
-                                        mock_boto3):
+                                        mock_boto3, mock_client):
         mock_couch.return_value._create_ingestion_document.return_value = \
             'test-id'
         # this next is because the redis client unpickles....
@@ -432,4 +438,4 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
             log_handler=self.test_log_handler,
             mail_handler=mail_handler)
         print self.test_log_handler.records
-        self.assertEqual(len(self.test_log_handler.records), 9)
+        self.assertEqual(len(self.test_log_handler.records), 10)
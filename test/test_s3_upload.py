@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from mock import patch
+from botocore.exceptions import NoCredentialsError
+from test.utils import LogOverrideMixin
+from harvester.fetcher.s3_upload import S3PageUploader
+from harvester.fetcher.s3_upload import S3UploadError
+
+
+class S3PageUploaderTestCase(LogOverrideMixin, TestCase):
+    '''Test the background S3 page upload stage'''
+
+    @patch('boto3.client', autospec=True)
+    def testUploadPages(self, mock_client):
+        uploads = []  # mock call counts aren't thread safe, record here
+
+        def upload(fileobj, bucket, key, Config=None):
+            uploads.append((fileobj.getvalue(), bucket, key))
+
+        mock_client().upload_fileobj.side_effect = upload
+        uploader = S3PageUploader('ucldc-ingest', workers=2, queue_size=1)
+        for n in range(5):
+            uploader.put_page('page-{}.jsonl'.format(n), '{"x": "y"}\n')
+        stats = uploader.join()
+        self.assertEqual(stats['pages'], 5)
+        self.assertEqual(stats['bytes'], 55)
+        self.assertEqual(
+            sorted(uploads),
+            [('{"x": "y"}\n', 'ucldc-ingest', 'page-{}.jsonl'.format(n))
+             for n in range(5)])
+
+    @patch('time.sleep')
+    @patch('boto3.client', autospec=True)
+    def testRetry(self, mock_client, mock_sleep):
+        mock_client().upload_fileobj.side_effect = [
+            Exception('Boom!'), Exception('Boom!'), None]
+        uploader = S3PageUploader('ucldc-ingest', workers=1, backoff=1)
+        uploader.put_page('page-0.jsonl', 'xxx\n')
+        stats = uploader.join()
+        self.assertEqual(stats['pages'], 1)
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list],
+                         [1, 2])
+
+    @patch('time.sleep')
+    @patch('boto3.client', autospec=True)
+    def testNoCredentials(self, mock_client, mock_sleep):
+        '''Missing credentials fail fast, without retries'''
+        mock_client().upload_fileobj.side_effect = NoCredentialsError()
+        uploader = S3PageUploader('ucldc-ingest', workers=1)
+        uploader.put_page('page-0.jsonl', 'xxx\n')
+        uploader._queue.join()
+        self.assertRaises(S3UploadError, uploader.put_page,
+                          'page-1.jsonl', 'xxx\n')
+        self.assertRaises(S3UploadError, uploader.join)
+        self.assertEqual(mock_client().upload_fileobj.call_count, 1)
+        self.assertFalse(mock_sleep.called)
+
+    @patch('time.sleep')
+    @patch('boto3.client', autospec=True)
+    def testFailAfterRetries(self, mock_client, mock_sleep):
+        mock_client().upload_fileobj.side_effect = Exception('Boom!')
+        uploader = S3PageUploader('ucldc-ingest', workers=1, retries=2)
+        uploader.put_page('page-0.jsonl', 'xxx\n')
+        self.assertRaises(S3UploadError, uploader.join)
+        self.assertEqual(mock_client().upload_fileobj.call_count, 3)
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -232,8 +232,9 @@ class HarvestSolr_ControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
         # shutil.rmtree(self.controller.dir_save)
 
     @httpretty.activate
+    @patch('boto3.client', autospec=True)
     @patch('boto3.resource', autospec=True)
-    def testSolrHarvest(self, mock_boto3):
+    def testSolrHarvest(self, mock_boto3, mock_client):
         '''Test the function of the Solr harvest with <date> objects
         in stream'''
         httpretty.register_uri(
@@ -259,10 +260,12 @@ class HarvestSolr_ControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
         self.assertTrue(hasattr(self.controller, 'harvest'))
         self.controller.harvest()
         print "LOGS:{}".format(self.test_log_handler.formatted_records)
-        self.assertEqual(len(self.test_log_handler.records), 2)
+        self.assertEqual(len(self.test_log_handler.records), 3)
         self.assertTrue(
             'UC San Diego' in self.test_log_handler.formatted_records[0])
-        self.assertEqual(self.test_log_handler.formatted_records[1],
+        self.assertTrue(self.test_log_handler.formatted_records[1].startswith(
+            '[INFO] HarvestController: Uploaded '))
+        self.assertEqual(self.test_log_handler.formatted_records[2],
                          '[INFO] HarvestController: 13 records harvested')
 
 
@@ -2,7 +2,8 @@ import os
 from unittest import TestCase
 import json
 from datetime import datetime as DT
-from mock import patch
+from multiprocessing.pool import ThreadPool
+from mock import patch, MagicMock
 from test.utils import DIR_FIXTURES
 from test.utils import ConfigFileOverrideMixin
 from harvester.solr_updater import push_doc_to_solr, map_couch_to_solr_doc
@@ -26,7 +27,21 @@ from harvester.solr_updater import MissingImage
 from harvester.solr_updater import MediaJSONError
 from harvester.solr_updater import MissingMediaJSON
 from harvester.solr_updater import sync_couch_collection_to_solr
+from harvester.solr_updater import sync_collections_to_solr
+from harvester.solr_updater import CollectionSyncError
+from harvester.solr_updater import get_collections_ready_for_publication
 from harvester.solr_updater import harvesting_report
+from harvester.solr_updater import SolrBatchWriter
+from harvester.solr_updater import map_couch_docs
+from harvester.solr_updater import changes_chunks
+from harvester.solr_updater import main
+from harvester.solr_updater import delete_solr_docs_for_couch_ids
+from harvester.solr_updater import solr_doc_hash
+from harvester.solr_updater import get_solr_collection_hashes
+from harvester.solr_updater import DataField, compile_solr_mapping
+from harvester.solr_updater import dict_for_data_to_fields
+from harvester.solr_updater import LRUMemo, make_datetime, unpack_date
+from solr import SolrException
 from botocore.exceptions import ClientError
 
 
@@ -59,6 +74,144 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
 
 #        mock_solr.add.assert_called_with({'repository_name': [u'Bancroft Library'], 'url_item': u'http://ark.cdlib.org/ark:/13030/ft009nb05r', 'repository': [u'https://registry.cdlib.org/api/v1/repository/4/'], 'publisher': u'The Bancroft Library, University of California, Berkeley, Berkeley, CA 94720-6000, Phone: (510) 642-6481, Fax: (510) 642-7589, Email: bancref@library.berkeley.edu, URL: http://bancroft.berkeley.edu/', 'collection_name': [u'Uchida (Yoshiko) photograph collection'], 'format': u'mods', 'rights': [u'Transmission or reproduction of materials protected by copyright beyond that allowed by fair use requires the written permission of the copyright owners. Works not in the public domain cannot be commercially exploited without permission of the copyright owner. Responsibility for any use rests exclusively with the user.', u'The Bancroft Library--assigned', u'All requests to reproduce, publish, quote from, or otherwise use collection materials must be submitted in writing to the Head of Public Services, The Bancroft Library, University of California, Berkeley 94720-6000. See: http://bancroft.berkeley.edu/reference/permissions.html', u'University of California, Berkeley, Berkeley, CA 94720-6000, Phone: (510) 642-6481, Fax: (510) 642-7589, Email: bancref@library.berkeley.edu'], 'collection': [u'https://registry.cdlib.org/api/v1/collection/23066/'], 'id': u'23066--http://ark.cdlib.org/ark:/13030/ft009nb05r', 'campus_name': [u'UC Berkeley'], 'reference_image_md5': u'f2610262f487f013fb96149f98990fb0', 'relation': [u'http://www.oac.cdlib.org/findaid/ark:/13030/ft6k4007pc', u'http://bancroft.berkeley.edu/collections/jarda.html', u'hb158005k9', u'BANC PIC 1986.059--PIC', u'http://www.oac.cdlib.org/findaid/ark:/13030/ft6k4007pc', u'http://calisphere.universityofcalifornia.edu/', u'http://bancroft.berkeley.edu/'], 'title': u'Neighbor', 'identifier': [u'http://ark.cdlib.org/ark:/13030/ft009nb05r', u'Banc Pic 1986.059:124--PIC'], 'type': u'image', 'campus': [u'https://registry.cdlib.org/api/v1/campus/1/'], 'subject': [u'Yoshiko Uchida photograph collection', u'Japanese American Relocation Digital Archive']})
 
+    @patch('solr.Solr', autospec=True)
+    def test_solr_batch_writer(self, mock_solr):
+        '''Docs are sent in batches, bad docs are isolated on a 400'''
+        docs = [{'id': str(n), 'harvest_id_s': str(n),
+                 'collection_url': 'c'} for n in range(5)]
+        writer = SolrBatchWriter(mock_solr, batch_size=2)
+        self.assertEqual(writer.add(docs[0]), 0)
+        self.assertEqual(writer.add(docs[1]), 2)
+        mock_solr.add_many.assert_called_once_with(docs[:2])
+        self.assertEqual(writer.add(docs[2]), 0)
+        writer.flush()
+        self.assertEqual(writer.num_added, 3)
+        mock_solr.add.assert_called_once_with(docs[2])
+
+        def add_many(batch):
+            if docs[3] in batch:
+                raise SolrException(400, 'bad doc', '')
+
+        def add(doc):
+            if doc == docs[3]:
+                raise SolrException(400, 'bad doc', '')
+
+        mock_solr.add_many.side_effect = add_many
+        mock_solr.add.side_effect = add
+        writer = SolrBatchWriter(mock_solr, batch_size=5)
+        for doc in docs:
+            writer.add(doc)
+        self.assertEqual(writer.num_added, 4)
+        mock_solr.add_many.side_effect = SolrException(500, 'down', '')
+        writer.add(docs[0])
+        writer.add(docs[1])
+        self.assertRaises(SolrException, writer.flush)
+
+    def test_map_couch_docs(self):
+        '''Mapping in a process pool gives the same results, in order'''
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        docs = [doc, {'_id': 'no-src'}, doc]
+        inline = list(map_couch_docs(docs, workers=1))
+        pooled = list(map_couch_docs(docs, workers=2, chunksize=1))
+        self.assertEqual(len(pooled), 3)
+        self.assertEqual(pooled[0], inline[0])
+        sdoc = map_couch_to_solr_doc(doc)
+        sdoc['content_hash_s'] = solr_doc_hash(sdoc)
+        self.assertEqual(pooled[0][0], sdoc)
+        self.assertEqual(pooled[0][1:], (None, None))
+        solr_doc, rejected, error = pooled[1]
+        self.assertEqual(solr_doc, None)
+        self.assertIsInstance(rejected, MissingSourceResource)
+        self.assertEqual(rejected.dict_key, 'Missing SourceResource')
+        self.assertEqual(pooled[2], inline[2])
+        # a pool passed in is used & left open
+        pool = ThreadPool(2)
+        for n in range(2):
+            reused = list(map_couch_docs(docs, pool=pool))
+            self.assertEqual([r[0] for r in reused], [r[0] for r in inline])
+        pool.close()
+        pool.join()
+
+    def test_map_couch_docs_read_ahead(self):
+        '''Only a few chunks of docs are read ahead of the results'''
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        read = []
+
+        def docs():
+            for n in range(20):
+                read.append(n)
+                yield doc
+        pool = ThreadPool(2)
+        with patch('harvester.solr_updater.SOLR_MAP_CHUNKS_AHEAD', 2):
+            mapped = map_couch_docs(docs(), workers=2, chunksize=1,
+                                    pool=pool)
+            next(mapped)
+            self.assertEqual(len(read), 4)
+            self.assertEqual(len(list(mapped)), 19)
+        self.assertEqual(len(read), 20)
+        pool.close()
+        pool.join()
+
+    @patch('harvester.solr_updater.multiprocessing.Pool')
+    @patch('harvester.solr_updater.check_nuxeo_media')
+    @patch('harvester.solr_updater.MediaCheckCache')
+    @patch('harvester.solr_updater.Solr')
+    @patch('harvester.solr_updater.CouchdbLastSeq_S3')
+    @patch('harvester.solr_updater.get_couchdb')
+    @patch('harvester.solr_updater.changes_chunks')
+    def test_main_one_map_pool(self, mock_chunks, mock_couchdb, mock_seq,
+                               mock_solr, mock_cache, mock_check, mock_pool):
+        '''main maps every _changes chunk in the same process pool'''
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        mock_chunks.return_value = [
+            ([{'id': doc['_id'], 'doc': doc}], '1'),
+            ([{'id': doc['_id'], 'doc': doc}], '2'),
+        ]
+        pool = ThreadPool(2)
+        mock_pool.return_value = pool
+        main('http://couch', 'ucldc', 'http://solr', map_workers=2)
+        mock_pool.assert_called_once_with(2)
+        self.assertEqual(mock_solr.return_value.commit.call_count, 2)
+        self.assertEqual(mock_seq.return_value.last_seq, '2')
+        self.assertEqual(mock_solr.return_value.add.call_count, 2)
+
+    def test_solr_doc_hash(self):
+        '''The hash depends only on the mapped content'''
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        sdoc = map_couch_to_solr_doc(doc)
+        doc_hash = solr_doc_hash(sdoc)
+        self.assertEqual(len(doc_hash), 32)
+        sdoc['content_hash_s'] = doc_hash
+        self.assertEqual(solr_doc_hash(sdoc), doc_hash)
+        sdoc['title'] = ['changed']
+        self.assertNotEqual(solr_doc_hash(sdoc), doc_hash)
+
+    def test_data_field_mapping(self):
+        '''DataField entries map like dict_for_data_to_fields, the compiled
+        plan writes straight into the solr doc'''
+        data = {'spatial': ['', 'here', {'name': 'there'}],
+                'properties': {'ucldc_schema:physlocation': 'shelf'}}
+        field = DataField('spatial', 'spatial', 'coverage')
+        self.assertEqual(
+            field(data),
+            dict_for_data_to_fields('spatial', data, ('spatial', 'coverage')))
+        self.assertEqual(field(data), {'spatial': ['here', 'there'],
+                                       'coverage': ['here', 'there']})
+        self.assertEqual(DataField('missing', 'x')(data), {})
+        plan = compile_solr_mapping({
+            'spatial': field,
+            'ucldc_schema:physlocation': DataField(
+                'ucldc_schema:physlocation', 'location',
+                data_key='properties'),
+            'other': lambda d: {'other': 'value'}})
+        solr_doc = {}
+        for key in (u'spatial', u'ucldc_schema:physlocation', u'other'):
+            plan[key](data, solr_doc)
+        self.assertEqual(solr_doc, {'spatial': ['here', 'there'],
+                                    'coverage': ['here', 'there'],
+                                    'location': 'shelf',
+                                    'other': 'value'})
+
     def test_map_couch_to_solr_no_campus(self):
         doc = json.load(open(DIR_FIXTURES + '/couchdb_nocampus.json'))
         sdoc = map_couch_to_solr_doc(doc)
@@ -284,6 +437,25 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
             'collection/23066/'
         ])
 
+    def test_map_registry_data_memo(self):
+        '''Registry data is memoized on its content'''
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        collections = doc['originalRecord']['collection']
+        reg_data = map_registry_data(collections)
+        reg_data['collection_name'].append('x')  # lists are copies
+        with patch('harvester.solr_updater._map_registry_data') as mock_map:
+            mock_map.return_value = {}
+            reg_data = map_registry_data(collections)
+            self.assertFalse(mock_map.called)
+            self.assertEqual(reg_data['collection_name'],
+                             [u'Uchida (Yoshiko) photograph collection'])
+        collections[0]['name'] = u'New name'
+        reg_data = map_registry_data(collections)
+        self.assertEqual(reg_data['collection_name'], [u'New name'])
+        del collections[0]['repository']
+        self.assertRaises(OldCollectionException, map_registry_data,
+                          collections)
+
     def test_decade_facet(self):
         '''Test generation of decade facet
         Currently generated from sourceResource.date.displayDate
@@ -317,6 +489,84 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
         mock_boto('s3').Object().get.assert_called()
         mock_boto('s3').Object().get()['Body'].read.assert_called()
 
+    def test_changes_chunks(self):
+        '''The changes feed is paged with limit & since'''
+        class FakeDB(object):
+            def __init__(self):
+                self.calls = []
+
+            def changes(self, **kwargs):
+                self.calls.append(kwargs)
+                since = kwargs['since']
+                seqs = range(since + 1, min(since + kwargs['limit'], 5) + 1)
+                return {'last_seq': str(seqs[-1] if seqs else since),
+                        'results': [{'id': str(n), 'seq': n} for n in seqs]}
+
+        db = FakeDB()
+        chunks = list(changes_chunks(db, 0, chunk_size=2))
+        self.assertEqual([last_seq for results, last_seq in chunks],
+                         [2, 4, 5])
+        self.assertEqual([r['id'] for r in chunks[1][0]], ['3', '4'])
+        self.assertEqual(db.calls[0], {'since': 0, 'limit': 2,
+                                       'include_docs': 'true'})
+        self.assertEqual(db.calls[-1]['since'], 4)
+        db = FakeDB()
+        self.assertEqual(len(list(changes_chunks(db, 0, chunk_size=10))), 1)
+        self.assertEqual(len(db.calls), 1)
+
+    def test_delete_solr_docs_for_couch_ids(self):
+        '''Deleted couch ids are looked up & deleted in batches'''
+        class Response(object):
+            def __init__(self, results, numFound=None):
+                self.results = results
+                self.numFound = numFound or len(results)
+
+        mock_solr = MagicMock()
+        mock_solr.select.side_effect = [
+            Response([{'id': 's1', 'harvest_id_s': 'c1'},
+                      {'id': 's3a', 'harvest_id_s': 'c"3'}], numFound=3),
+            Response([{'id': 's1', 'harvest_id_s': 'c1'},
+                      {'id': 's3a', 'harvest_id_s': 'c"3'},
+                      {'id': 's3b', 'harvest_id_s': 'c"3'}]),
+            Response([{'id': 's4', 'harvest_id_s': 'c4'}]),
+        ]
+        n = delete_solr_docs_for_couch_ids(
+            mock_solr, ['c1', 'c2', 'c"3', 'c4'], batch_size=3)
+        self.assertEqual(n, 2)
+        self.assertEqual(mock_solr.select.call_count, 3)
+        self.assertEqual(
+            mock_solr.select.call_args_list[0][1]['q'],
+            'harvest_id_s:("c1" OR "c2" OR "c\\"3")')
+        self.assertEqual(mock_solr.select.call_args_list[1][1]['rows'], 3)
+        self.assertEqual(mock_solr.delete.call_args_list[0][1],
+                         {'ids': ['s1']})
+        self.assertEqual(mock_solr.delete.call_args_list[1][1],
+                         {'ids': ['s4']})
+
+    def test_get_solr_collection_hashes(self):
+        '''The collection docs are paged through with a cursorMark'''
+        class Response(object):
+            def __init__(self, results, nextCursorMark):
+                self.results = results
+                self.nextCursorMark = nextCursorMark
+
+        mock_solr = MagicMock()
+        mock_solr.select.side_effect = [
+            Response([{'id': 'a', 'content_hash_s': 'ha'},
+                      {'id': 'b'}], 'AoEb'),
+            Response([{'id': 'c', 'content_hash_s': 'hc'}], 'AoEc'),
+            Response([], 'AoEc'),
+        ]
+        hashes = get_solr_collection_hashes(mock_solr, 'cid', page_size=2)
+        self.assertEqual(hashes, {'a': 'ha', 'b': None, 'c': 'hc'})
+        calls = mock_solr.select.call_args_list
+        self.assertEqual([c[1]['cursorMark'] for c in calls],
+                         ['*', 'AoEb', 'AoEc'])
+        for c in calls:
+            self.assertEqual(c[1]['sort'], 'id asc')
+            self.assertEqual(c[1]['rows'], 2)
+            self.assertNotIn('start', c[1])
+
     def test_old_collection(self):
         doc = json.load(open(DIR_FIXTURES + '/couchdb_norepo.json'))
         self.assertRaises(OldCollectionException, map_couch_to_solr_doc, doc)
@@ -417,6 +667,47 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
         sid = get_solr_id(doc)
         self.assertEqual(sid, "ark:/21198/zz002b1833")
 
+    def test_lru_memo(self):
+        '''The memo is bounded, evicts the least recently used & counts'''
+        calls = []
+
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        memo = LRUMemo(double, maxsize=2)
+        self.assertEqual(memo(1), 2)
+        self.assertEqual(memo(2), 4)
+        self.assertEqual(memo(1), 2)
+        self.assertEqual(memo(3), 6)  # evicts 2
+        self.assertEqual(memo(1), 2)
+        self.assertEqual(memo(2), 4)
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual((memo.hits, memo.misses), (2, 4))
+        self.assertEqual(memo.hit_rate(), 2.0 / 6)
+        memo.clear()
+        self.assertEqual((memo.hits, memo.misses), (0, 0))
+
+    def test_make_datetime_fast_path(self):
+        '''The fast path matches the strptime results'''
+        self.assertEqual(make_datetime('1999'), DT(1999, 1, 1, tzinfo=UTC))
+        self.assertEqual(make_datetime('1999-12-31'),
+                         DT(1999, 12, 31, tzinfo=UTC))
+        self.assertEqual(make_datetime('1999-1-5'),
+                         DT(1999, 1, 5, tzinfo=UTC))
+        self.assertEqual(make_datetime(' 1999'), DT(1999, 1, 1, tzinfo=UTC))
+        self.assertEqual(make_datetime('1999-02-30'), None)
+        self.assertEqual(make_datetime('0000'), None)
+        self.assertEqual(make_datetime('circa 1999'), None)
+        self.assertEqual(make_datetime(''), None)
+        dates, starts, ends = unpack_date(
+            [{'displayDate': '1950s', 'begin': '1950', 'end': '1959'}])
+        dates.append('x')  # memoized results are copied
+        self.assertEqual(unpack_date(
+            [{'displayDate': '1950s', 'begin': '1950', 'end': '1959'}]),
+            (['1950s'], [DT(1950, 1, 1, tzinfo=UTC)],
+             [DT(1959, 1, 1, tzinfo=UTC)]))
+
     def test_sort_dates(self):
         '''test the sort_date_start/end values'''
         doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
@@ -492,6 +783,22 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
                          'isShownAt not a URL : 2\n'
                          'Missing Rights : 2\n'
                          'Missing jp2000 : 2')
+        msg = harvesting_report(cid, updated_docs, num_added, {},
+                                memo_report=['Memo x hit rate : 50%'])
+        self.assertEqual(msg, 'Synced collection 22222 to solr.\n'
+                         '10 Couch Docs.\n'
+                         '4 solr documents updated\n'
+                         'Memo x hit rate : 50%')
+        msg = harvesting_report(['1', '2'], 10, num_added, {})
+        self.assertEqual(msg, 'Synced 2 collections to solr.\n'
+                         '10 Couch Docs.\n'
+                         '4 solr documents updated\n')
+        msg = harvesting_report(['1', '2'], 10, num_added, {},
+                                failures={'2': 'ValueError: boom'})
+        self.assertEqual(msg, 'Synced 2 collections to solr.\n'
+                         '10 Couch Docs.\n'
+                         '4 solr documents updated\n'
+                         'FAILED 2 : ValueError: boom')
 
     @patch('harvester.solr_updater.MediaJson', autospec=True)
     def test_nuxeo_media_check(self, mock_mediajson):
@@ -513,14 +820,37 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
             '---- OMITTED: Doc:a-UUID Missing reference media file: ',
             check_nuxeo_media, doc)
 
+    @patch('harvester.solr_updater.MediaJson', autospec=True)
+    def test_nuxeo_media_check_cached(self, mock_mediajson):
+        '''Checked media isn't checked again, unlisted media json fails'''
+        mock_cache = MagicMock()
+        mock_cache.listed_etag.return_value = (True, 'etag')
+        mock_cache.is_checked.return_value = False
+        doc = {'harvest_id_s': 'a-UUID',
+               'structmap_url': 's3://fakebucket/fakedir/a-UUID-media.json'}
+        check_nuxeo_media(doc, media_cache=mock_cache)
+        self.assertEqual(mock_mediajson.call_count, 1)
+        mock_cache.set_checked.assert_called_once_with(
+            's3://fakebucket/fakedir/a-UUID-media.json', 'etag')
+        mock_cache.is_checked.return_value = True
+        check_nuxeo_media(doc, media_cache=mock_cache)
+        self.assertEqual(mock_mediajson.call_count, 1)
+        mock_cache.listed_etag.return_value = (True, None)
+        self.assertRaisesRegexp(
+            MissingMediaJSON,
+            '---- OMITTED: Doc:a-UUID missing media json not found',
+            check_nuxeo_media, doc, media_cache=mock_cache)
+        self.assertEqual(mock_mediajson.call_count, 1)
+
 
+    @patch('harvester.solr_updater.MediaCheckCache')
     @patch('harvester.solr_updater.MediaJson', autospec=True)
     @patch('harvester.solr_updater.publish_to_harvesting')
     @patch('harvester.solr_updater.Solr', autospec=True)
     @patch('harvester.solr_updater.CouchDBCollectionFilter')
     @patch('harvester.solr_updater.get_couchdb')
     def test_report(self, mock_get_couchdb, mock_couchview, mock_solr,
-                    mock_publish, mock_mediajson):
+                    mock_publish, mock_mediajson, mock_cache):
         '''Test that the report from sync collection has a tally of the
         various errors
         '''
@@ -632,8 +962,10 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
             }),
         ]
         mock_couchview.return_value = test_data
+        mock_cache.return_value.listed_etag.return_value = (False, None)
+        mock_cache.return_value.is_checked.return_value = False
         with patch('harvester.solr_updater.map_registry_data') as mock_reg:
-            updated_docs, report = sync_couch_collection_to_solr('cid')
+            n_docs, report = sync_couch_collection_to_solr('cid')
         self.assertEqual(report, {
             'Missing isShownAt': 2,
             'Missing Image': 2,
@@ -644,7 +976,7 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
 
         mock_mediajson.side_effect = ValueError
         with patch('harvester.solr_updater.map_registry_data'):
-            updated_docs, report = sync_couch_collection_to_solr('cid')
+            n_docs, report = sync_couch_collection_to_solr('cid')
         self.assertEqual(report, {
             'Missing isShownAt': 2,
             'Missing Image': 2,
@@ -653,3 +985,106 @@ class SolrUpdaterTestCase(ConfigFileOverrideMixin, TestCase):
             'Missing Rights': 2,
             'Missing reference media file': 2
         })
+
+    @patch('harvester.solr_updater.MediaCheckCache')
+    @patch('harvester.solr_updater.publish_to_harvesting')
+    @patch('harvester.solr_updater.delete_solr_collection')
+    @patch('harvester.solr_updater.Solr')
+    @patch('harvester.solr_updater.CouchDBCollectionFilter')
+    @patch('harvester.solr_updater.get_couchdb')
+    def test_sync_incremental(self, mock_get_couchdb, mock_couchview,
+                              mock_solr, mock_delete, mock_publish,
+                              mock_cache):
+        '''Incremental sync only adds changed docs & deletes missing'''
+        class viewrow():
+            def __init__(self, data):
+                self.doc = data
+
+        doc = json.load(open(DIR_FIXTURES + '/couchdb_doc.json'))
+        sdoc = map_couch_to_solr_doc(json.loads(json.dumps(doc)))
+        doc_hash = solr_doc_hash(sdoc)
+        mock_couchview.return_value = [viewrow(doc)]
+        solr_db = mock_solr.return_value
+        solr_db.select.return_value.numFound = 2
+        solr_db.select.return_value.nextCursorMark = '*'
+        solr_db.select.return_value.results = [
+            {'id': sdoc['id'], 'content_hash_s': doc_hash},
+            {'id': 'gone'}]
+        n_docs, report = sync_couch_collection_to_solr(
+            'cid', incremental=True)
+        self.assertFalse(mock_delete.called)
+        self.assertEqual(
+            solr_db.select.call_args[1]['q'],
+            'collection_url:"https://registry.cdlib.org/api/v1/'
+            'collection/cid/"')
+        self.assertEqual(n_docs, 1)
+        self.assertFalse(solr_db.add_many.called)
+        self.assertFalse(solr_db.add.called)
+        solr_db.delete.assert_called_once_with(ids=['gone'])
+        self.assertEqual(report, {'Unchanged in solr': 1,
+                                  'Deleted from solr': 1})
+        solr_db.select.return_value.results = [
+            {'id': sdoc['id'], 'content_hash_s': 'old'}]
+        solr_db.select.return_value.numFound = 1
+        solr_db.delete.reset_mock()
+        mock_couchview.return_value = [viewrow(doc)]
+        n_docs, report = sync_couch_collection_to_solr(
+            'cid', incremental=True)
+        self.assertEqual(solr_db.add.call_args[0][0]['content_hash_s'],
+                         doc_hash)
+        self.assertFalse(solr_db.delete.called)
+        self.assertEqual(report, {})
+
+    @patch('harvester.solr_updater.multiprocessing.Pool', new=ThreadPool)
+    @patch('harvester.solr_updater.publish_to_harvesting')
+    @patch('harvester.solr_updater.Solr')
+    @patch('harvester.solr_updater.sync_collection')
+    def test_sync_collections_to_solr(self, mock_sync, mock_solr,
+                                      mock_publish):
+        '''Collections are synced incrementally, each in its own worker'''
+        def sync(collection_key, solr_db, **kwargs):
+            if collection_key == 'bad':
+                raise ValueError('boom')
+            return 3, 2, {'Missing Rights': 1}
+
+        mock_sync.side_effect = sync
+        n_docs, num_added, report = sync_collections_to_solr(
+            '1;2', workers=2)
+        self.assertEqual(mock_sync.call_count, 2)
+        for call in mock_sync.call_args_list:
+            self.assertEqual(call[1]['incremental'], True)
+            self.assertEqual(call[1]['map_workers'], 1)
+        self.assertEqual(
+            sorted(call[0][0] for call in mock_sync.call_args_list),
+            ['1', '2'])
+        self.assertEqual(n_docs, 6)
+        self.assertEqual(num_added, 4)
+        self.assertEqual(report, {'Missing Rights': 2,
+                                  'Collections synced': 2})
+        self.assertEqual(mock_publish.call_count, 1)
+        subject, msg = mock_publish.call_args[0]
+        self.assertEqual(subject, 'Synced 2 collections to solr')
+        self.assertIn('Synced 2 collections to solr.\n6 Couch Docs.\n'
+                      '4 solr documents updated\n', msg)
+        # a failed collection doesn't stop the others & is reported
+        mock_sync.reset_mock()
+        mock_publish.reset_mock()
+        self.assertRaises(CollectionSyncError, sync_collections_to_solr,
+                          '1;bad;2', workers=2)
+        self.assertEqual(mock_sync.call_count, 3)
+        self.assertEqual(mock_publish.call_count, 1)
+        subject, msg = mock_publish.call_args[0]
+        self.assertEqual(subject, 'FAILED sync of 3 collections to solr')
+        self.assertIn('Collections failed : 1', msg)
+        self.assertIn('FAILED bad : ValueError: boom', msg)
+
+    def test_get_collections_ready_for_publication(self):
+        '''Only the collections ready for publication are returned'''
+        collections = [MagicMock(id='1'), MagicMock(id='2')]
+        collections[0].__getitem__.return_value = True
+        collections[1].__getitem__.return_value = False
+        registry = MagicMock()
+        registry.resource_iter.return_value = collections
+        self.assertEqual(get_collections_ready_for_publication(registry),
+                         ['1'])
+        registry.resource_iter.assert_called_once_with('collection')
@@ -22,11 +22,13 @@ class XMLFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(h.url_base, url)
         docs = []
         d = h.next()
-        self.assertEqual(len(d), 999)
+        self.assertEqual(len(d), 1000)
         docs.extend(d)
         for d in h:
             docs.extend(d)
         self.assertEqual(len(docs), 2320)
+        self.assertEqual(h.docs_fetched, 2320)
+        self.assertRaises(StopIteration, h.next)
         test1 = docs[0]
         test2 = docs[2]
         self.assertIn('title', test1['metadata'])
@@ -40,6 +42,24 @@ class XMLFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(test2['metadata']['q'], ['scanned'])
         self.assertEqual(test2['metadata']['d'], ['Epson'])
 
+    @httpretty.activate
+    def testNestedRecords(self):
+        '''A record nested in another is also part of the outer record'''
+        url = 'http://example.edu/nested.xml'
+        httpretty.register_uri(
+            httpretty.GET,
+            url,
+            body='<export><record><title>outer</title>'
+            '<record><title>inner</title></record>'
+            '<date>1900</date></record>'
+            '<record><title>next</title></record></export>')
+        h = fetcher.XML_Fetcher(url, None)
+        docs = [d['metadata'] for d in h.next()]
+        self.assertEqual(docs, [
+            {'title': ['inner']},
+            {'title': ['outer', 'inner'], 'date': ['1900']},
+            {'title': ['next']}])
+
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
 # Redistribution and use in source and binary forms, with or without